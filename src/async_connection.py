@@ -0,0 +1,467 @@
+"""
+asyncio runtime for the nodes, next to the thread-per-connection one of
+stomp.py.
+
+An AsyncStompConnection speaks STOMP over non-blocking asyncio streams and
+can be shared by any number of nodes and subscriptions on one event loop.
+Its reader task awaits the on_message coroutine of the node owning each
+frame before it reads on, so a busy engine stops the reads and the
+broker's messages back up in TCP instead of in an unbounded queue, and
+send() waits until the socket buffer drained.
+
+AsyncActiveMQNode has the public API of ActiveMQNode, with coroutines for
+everything that talks to the broker (start, stop, subscribe, send, ...).
+Received events are handed to the engine with the awaitable hand_off(),
+what the engine publishes meanwhile collects in an Outbox and goes out in
+one frame per topic once the hand-off is done. The engine nodes and the
+producer have async variants built from it, e.g. AsyncPythonActiveMQNode.
+
+Everything is Python 3.6 compatible, drive it with
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(node.start())
+"""
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import connection as node_connection
+from connection import BATCH_HEADER, ActiveMQNode
+from connection_pool import CONNECT_ATTEMPTS, backoff_delays
+from envelope import Envelope
+from publisher import PUBLISH_BATCH_SIZE
+from readiness import (
+    PROBE_TOPIC,
+    READINESS_TIMEOUT_S,
+    READY_TOPIC,
+    ReadinessAnnouncer,
+    ReadinessWaiter,
+    write_readiness_file,
+)
+from stomp_broker import RECV_SIZE, Frame, StompError, parse_frame
+
+
+def subscribe_frame(destination: str, id_: str, ack: str) -> Frame:
+    return Frame("SUBSCRIBE", {"destination": destination, "id": id_, "ack": ack})
+
+
+class AsyncStompConnection:
+    """
+    One STOMP 1.2 connection on an event loop, multiplexing the
+    subscriptions of several nodes.
+
+    Nothing is opened until the first subscribe or send. A connection the
+    broker dropped is reopened with exponential backoff, with its
+    subscriptions restored.
+    """
+
+    def __init__(
+        self,
+        host_and_port: Tuple[str, int],
+        name: str = "async",
+        login: str = "admin",
+        passcode: str = "admin",
+    ) -> None:
+        self.host_and_port = host_and_port
+        self.name = name
+        self.login = login
+        self.passcode = passcode
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.reader_task: Optional[asyncio.Future] = None
+        # created on the loop, asyncio primitives of Python 3.6 bind to one
+        self.lock: Optional[asyncio.Lock] = None
+        # subscription id -> (listener, destination, ack)
+        self.subscriptions: Dict[str, Tuple[Any, str, str]] = {}
+        self.receipts: Dict[str, asyncio.Future] = {}
+        self.receipt_ids = itertools.count(1)
+        self.listeners: Set[Any] = set()
+        self.connects = 0
+        self.closing = False
+
+    def add_listener(self, listener: Any):
+        self.listeners.add(listener)
+
+    def remove_listener(self, listener: Any) -> bool:
+        """
+        Returns whether that was the last listener.
+        """
+        self.listeners.discard(listener)
+        return not self.listeners
+
+    @property
+    def is_connected(self) -> bool:
+        return self.writer is not None and not self.writer.transport.is_closing()
+
+    async def connect(self, attempts: int = CONNECT_ATTEMPTS):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            self.closing = False
+            if not self.is_connected:
+                await self.open(attempts)
+
+    async def open(self, attempts: int):
+        delays = backoff_delays()
+        tried = 0
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(*self.host_and_port)
+                buffer = bytearray()
+                writer.write(
+                    Frame(
+                        "CONNECT",
+                        {
+                            "accept-version": "1.2",
+                            "host": self.host_and_port[0],
+                            "login": self.login,
+                            "passcode": self.passcode,
+                            "heart-beat": "0,0",
+                        },
+                    ).encode(escape=False)
+                )
+                frame = await self.read_frame(reader, buffer)
+                if frame.command != "CONNECTED":
+                    writer.close()
+                    raise StompError(frame.headers.get("message", frame.command))
+                break
+            except (OSError, StompError):
+                tried += 1
+                if attempts and tried >= attempts:
+                    raise
+                await asyncio.sleep(next(delays))
+
+        self.reader, self.writer = reader, writer
+        self.connects += 1
+        for id_, (_, destination, ack) in self.subscriptions.items():
+            self.write(subscribe_frame(destination, id_, ack))
+        await writer.drain()
+        self.reader_task = asyncio.ensure_future(self.read_loop(reader, buffer))
+
+    @staticmethod
+    async def read_frame(reader: asyncio.StreamReader, buffer: bytearray) -> Frame:
+        while True:
+            frame = parse_frame(buffer)
+            if frame is not None:
+                return frame
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                raise ConnectionResetError("the broker closed the connection")
+            buffer += data
+
+    async def read_loop(self, reader: asyncio.StreamReader, buffer: bytearray):
+        try:
+            while True:
+                await self.dispatch(await self.read_frame(reader, buffer))
+        except (OSError, StompError) as error:
+            if self.closing:
+                return
+            print(
+                f"AsyncStompConnection {self.name} lost the broker ({error}), "
+                "reconnecting"
+            )
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+            self.writer = None
+            try:
+                await self.connect(attempts=0)
+            except Exception as error:
+                print(f"AsyncStompConnection {self.name} failed to reconnect: {error}")
+
+    async def dispatch(self, frame: Frame):
+        if frame.command == "MESSAGE":
+            subscription = self.subscriptions.get(frame.headers.get("subscription"))
+            if subscription is None:
+                return
+            listener, _, ack = subscription
+            try:
+                await listener.on_message(frame)
+            except Exception as error:
+                print(f"AsyncStompConnection {self.name} - on_message failed {error!r}")
+            if ack != "auto":
+                await self.send_frame(Frame("ACK", {"id": frame.headers["ack"]}))
+        elif frame.command == "RECEIPT":
+            confirmed = self.receipts.get(frame.headers.get("receipt-id"))
+            if confirmed is not None and not confirmed.done():
+                confirmed.set_result(True)
+        elif frame.command == "ERROR":
+            for listener in list(self.listeners):
+                listener.on_error(frame)
+
+    def write(self, frame: Frame):
+        self.writer.write(frame.encode())
+
+    async def send_frame(self, frame: Frame):
+        if not self.is_connected:
+            await self.connect()
+        self.write(frame)
+        # waits while the socket buffer is above its high-water mark
+        await self.writer.drain()
+
+    async def subscribe(
+        self, listener: Any, destination: str, id: str, ack: str = "auto"
+    ):
+        self.subscriptions[id] = (listener, destination, ack)
+        if not self.is_connected:
+            # subscribes everything in self.subscriptions
+            await self.connect()
+            return
+        await self.send_frame(subscribe_frame(destination, id, ack))
+
+    async def unsubscribe(self, id: str):
+        if self.subscriptions.pop(id, None) is not None and self.is_connected:
+            await self.send_frame(Frame("UNSUBSCRIBE", {"id": id}))
+
+    async def send(
+        self, body, destination: str, headers: Optional[Dict[str, str]] = None
+    ):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        frame_headers = {"destination": destination}
+        frame_headers.update(headers or {})
+        await self.send_frame(Frame("SEND", frame_headers, body))
+
+    async def send_confirmed(
+        self, body, destination: str, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Send and wait until the broker confirms it processed the frame, and
+        with it every frame sent on this connection before, e.g. the
+        subscriptions. Returns False if the receipt didn't arrive in time.
+        """
+        receipt = f"{self.name}-{next(self.receipt_ids)}"
+        confirmed = self.receipts[receipt] = asyncio.get_event_loop().create_future()
+        try:
+            await self.send(body, destination, headers={"receipt": receipt})
+            await asyncio.wait_for(confirmed, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.receipts.pop(receipt, None)
+
+    async def disconnect(self):
+        self.closing = True
+        if self.is_connected:
+            self.write(Frame("DISCONNECT"))
+            await self.writer.drain()
+            self.writer.close()
+        self.writer = None
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+            self.reader_task = None
+
+
+class Outbox:
+    """
+    Collects what an engine publishes during a hand-off, in place of the
+    BatchingPublisher and its thread. AsyncActiveMQNode.flush sends it.
+    """
+
+    def __init__(self) -> None:
+        self.messages: Deque[Tuple[Any, str]] = deque()
+
+    def publish(self, message, topic):
+        # deque.append is atomic, engines may publish from their own threads
+        self.messages.append((message, topic))
+
+    def take(self) -> "OrderedDict[str, List[Any]]":
+        batches: "OrderedDict[str, List[Any]]" = OrderedDict()
+        while self.messages:
+            message, topic = self.messages.popleft()
+            batches.setdefault(topic, []).append(message)
+        return batches
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+class AsyncReadinessAnnouncer(ReadinessAnnouncer):
+    async def announce(self, timeout: Optional[float] = READINESS_TIMEOUT_S) -> bool:
+        connection = self.node.activemq_connection
+        await connection.subscribe(
+            self, destination=PROBE_TOPIC, id=self.subscription_id
+        )
+        if not await connection.send_confirmed(
+            str(self.node.id), READY_TOPIC, timeout
+        ):
+            print(f"Node {self.node.id} - broker didn't confirm the subscriptions")
+            return False
+
+        write_readiness_file(self.node.id)
+        print(f"Node {self.node.id} is ready")
+        return True
+
+    async def withdraw(self):
+        await self.node.activemq_connection.unsubscribe(self.subscription_id)
+
+    async def on_message(self, frame):
+        await self.node.activemq_connection.send(
+            body=str(self.node.id), destination=READY_TOPIC
+        )
+
+
+class AsyncReadinessWaiter(ReadinessWaiter):
+    async def wait(self, timeout: float = READINESS_TIMEOUT_S) -> Set[int]:
+        if not self.expected:
+            return set()
+
+        self.complete = asyncio.Event()
+        connection = self.node.activemq_connection
+        subscription_id = f"ready-{self.node.id}"
+        await connection.subscribe(self, destination=READY_TOPIC, id=subscription_id)
+
+        started = time.monotonic()
+        deadline = started + timeout
+        delays = backoff_delays()
+        try:
+            while self.missing and time.monotonic() < deadline:
+                await connection.send(
+                    body=str(self.node.id), destination=PROBE_TOPIC
+                )
+                try:
+                    await asyncio.wait_for(
+                        self.complete.wait(),
+                        min(next(delays), max(deadline - time.monotonic(), 0)),
+                    )
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await connection.unsubscribe(subscription_id)
+
+        print(
+            f"{len(self.ready & self.expected)}/{len(self.expected)} nodes ready "
+            f"after {time.monotonic() - started:.1f}s"
+        )
+        return self.missing
+
+    async def on_message(self, frame):
+        super().on_message(frame)
+
+
+class AsyncActiveMQNode(ActiveMQNode):
+    """
+    ActiveMQNode on an event loop, see the module docstring. Pass the same
+    AsyncStompConnection to the nodes of a loop to share it, a node without
+    one opens its own.
+    """
+
+    def __init__(
+        self,
+        *args,
+        activemq_connection: Optional[AsyncStompConnection] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.owns_connection = activemq_connection is None
+        self._activemq_connection = activemq_connection
+        if activemq_connection is not None:
+            activemq_connection.add_listener(self)
+        # after the engine nodes' __init__, which set up a BatchingPublisher
+        self.publisher = Outbox()
+
+    @property
+    def activemq_connection(self) -> AsyncStompConnection:
+        if self._activemq_connection is None:
+            self._activemq_connection = AsyncStompConnection(
+                (node_connection.ACTIVEMQ_HOST, int(node_connection.ACTIVEMQ_PORT)),
+                name=f"async-{self.id}",
+            )
+            self._activemq_connection.add_listener(self)
+        return self._activemq_connection
+
+    async def start(self):
+        self.metrics.start_reporting()
+        await self.subscribe_to_topics()
+        await self.announce_ready()
+
+    async def announce_ready(self) -> bool:
+        self.readiness = AsyncReadinessAnnouncer(self)
+        return await self.readiness.announce()
+
+    async def wait_for_nodes(
+        self, expected: Iterable[int], timeout: float = READINESS_TIMEOUT_S
+    ) -> Set[int]:
+        return await AsyncReadinessWaiter(self, expected).wait(timeout)
+
+    async def stop(self):
+        await self.unsubscribe_from_topics()
+        await self.flush()
+        await self.disconnect()
+        self.metrics.stop_reporting()
+
+    async def on_message(self, message):
+        await self.hand_off(self.receive_message(message))
+
+    async def hand_off(self, envelopes: List[Envelope]):
+        """
+        Give received events to the engine, the next frame is only read once
+        this returns. Engine nodes process the events and flush() their
+        matches.
+        """
+        for envelope in envelopes:
+            print(f"AsyncActiveMQNode - Received message {envelope!r}")
+
+    async def flush(self):
+        """
+        Send the outbox, one frame per topic and PUBLISH_BATCH_SIZE messages.
+        """
+        for topic, messages in self.publisher.take().items():
+            for start in range(0, len(messages), PUBLISH_BATCH_SIZE):
+                batch = messages[start : start + PUBLISH_BATCH_SIZE]
+                await self.send_batch(batch, topic)
+
+    async def subscribe(self, topic, ack="auto"):
+        subscription_id = f"sub-{self.id}-{topic}"
+        await self.activemq_connection.subscribe(
+            self, destination=topic, id=subscription_id, ack=ack
+        )
+
+    async def unsubscribe(self, topic):
+        subscription_id = f"sub-{self.id}-{topic}"
+        await self.activemq_connection.unsubscribe(id=subscription_id)
+
+    async def subscribe_to_topics(self, ack="auto"):
+        for topic in self.topic_subscriptions:
+            print("------------------Node ", self.id, " subscribes Topic: ", topic)
+            await self.subscribe(topic, ack=ack)
+
+    async def unsubscribe_from_topics(self):
+        for topic in self.topic_subscriptions:
+            await self.unsubscribe(topic)
+
+    async def send(self, message, topic):
+        if isinstance(message, Envelope):
+            message = message.encode()
+        await self.activemq_connection.send(body=message, destination=topic)
+
+    async def send_batch(self, messages, topic):
+        if len(messages) == 1:
+            await self.send(messages[0], topic=topic)
+            return
+
+        await self.activemq_connection.send(
+            body=self.pack_batch(messages),
+            destination=topic,
+            headers={BATCH_HEADER: str(len(messages))},
+        )
+
+    async def disconnect(self):
+        if self.readiness is not None:
+            await self.readiness.withdraw()
+            self.readiness = None
+        if self._activemq_connection is None:
+            return
+        self._activemq_connection.remove_listener(self)
+        # a shared connection is closed by its owner, e.g. NodeHost.stop
+        if self.owns_connection:
+            await self._activemq_connection.disconnect()
+            self._activemq_connection = None
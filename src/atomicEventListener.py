@@ -1,10 +1,7 @@
 import time
-from connection import ActiveMQNode
+from connection import ACTIVEMQ_HOST, ACTIVEMQ_PORT, ActiveMQNode
 from evaluation_plan import Statement, AtomicEventType
-
-import os
-
-SLEEP = float(os.environ.get("SLEEP", 20))
+from readiness import wait_for_broker
 
 
 if __name__ == "__main__":
@@ -19,8 +16,7 @@ if __name__ == "__main__":
     ]
 
     statement = Statement(query=None, inputs=atomic_events, nodes=None)
-    print("Waiting for ActiveMQ to start")
-    time.sleep(SLEEP)
+    wait_for_broker(ACTIVEMQ_HOST, ACTIVEMQ_PORT)
     ActiveMQNode(id_=0, statements=[statement]).start()  # handles subscription
 
     time.sleep(3600)
@@ -1,12 +1,17 @@
-import csv
-import time
 import os
 from pathlib import Path
 
-from connection import ActiveMQNode
+from async_connection import AsyncActiveMQNode
+from connection import ACTIVEMQ_HOST, ACTIVEMQ_PORT, ActiveMQNode
+from envelope import Envelope, now_ms
+from readiness import EXPECTED_NODES, parse_node_ids, wait_for_broker
+from replay import ReplayScheduler
+from trace_source import EVENT_TYPE_CODES, EVENT_TYPES, TraceSource
 
 file_root = Path(__file__).parent
-SLEEP = float(os.environ.get("SLEEP", 20))
+PRODUCER_VERBOSE = os.environ.get("PRODUCER_VERBOSE", "1") == "1"
+# .csv or a binary .trace, see binary_trace.py
+TRACE_FILE = os.environ.get("TRACE_FILE", "data/combinedEventTimestamps.csv")
 
 
 class AtomicEventProducer(ActiveMQNode):
@@ -23,34 +28,81 @@ class AtomicEventProducer(ActiveMQNode):
         self.eventIntervalsFileName = eventIntervalsFileName
 
         if eventTimestamps is not None:
-            self.eventTimestamps = eventTimestamps
+            self.trace = [
+                (int(timestamp), EVENT_TYPE_CODES[eventType])
+                for timestamp, eventType in eventTimestamps
+            ]
         else:
-            with open(self.eventIntervalsFileName) as f:
-                reader = csv.reader(f, delimiter=",")
-                self.eventTimestamps = list(reader)
-
-    def pushEvents(self):
-        previousEvent = ["0", ""]
-        timeDifferenceToCurrentEvent = 0
-        for currentEvent in self.eventTimestamps:
-            timeDifferenceToCurrentEvent = int(currentEvent[0]) - int(previousEvent[0])
-            time.sleep(timeDifferenceToCurrentEvent / 1000)
-            print(f"AtomicEventProducer sending event:  {currentEvent[1]}")
-            self.send(currentEvent[1], topic=f"/topic/{currentEvent[1]}")
-            previousEvent = currentEvent
-
-
-def register_and_start_atomic_event_producers():
+            self.trace = TraceSource(self.eventIntervalsFileName)
+
+        self.topics = [f"/topic/{eventType}" for eventType in EVENT_TYPES]
+        self.replayStart = 0
+
+    def timedEvents(self):
+        """
+        Start the replay clock, returns the trace for the ReplayScheduler, which
+        emits each whole (timestamp, event type code) event.
+
+        Event times are the trace timestamps offset to the start of the
+        replay, like in the simulator, so WITHIN windows span the same events
+        at any REPLAY_SPEEDUP or REPLAY_MODE.
+        """
+        self.replayStart = now_ms()
+        return ((timestamp, (timestamp, code)) for timestamp, code in self.trace)
+
+    def pushEvents(self, scheduler=None):
+        scheduler = scheduler or ReplayScheduler()
+        report = scheduler.replay(self.timedEvents(), self.pushEvent)
+        print(f"AtomicEventProducer {report}")
+        return report
+
+    def atomicEvent(self, event):
+        timestamp, eventTypeCode = event
+        eventType = EVENT_TYPES[eventTypeCode]
+        if PRODUCER_VERBOSE:
+            print(f"AtomicEventProducer sending event:  {eventType}")
+        envelope = Envelope.atomic(
+            eventType, producer_id=self.id, event_time=self.replayStart + timestamp
+        )
+        return envelope, self.topics[eventTypeCode]
+
+    def pushEvent(self, event):
+        envelope, topic = self.atomicEvent(event)
+        self.send(envelope, topic=topic)
+
+
+class AsyncAtomicEventProducer(AsyncActiveMQNode, AtomicEventProducer):
+    """
+    AtomicEventProducer on an event loop, see async_connection.py. Every send
+    waits until the socket buffer drained, a slow broker slows the replay down.
+    """
+
+    async def pushEvents(self, scheduler=None):
+        scheduler = scheduler or ReplayScheduler()
+        report = await scheduler.replay_async(self.timedEvents(), self.pushEvent)
+        print(f"AtomicEventProducer {report}")
+        return report
+
+    async def pushEvent(self, event):
+        envelope, topic = self.atomicEvent(event)
+        await self.send(envelope, topic=topic)
+
+
+def register_and_start_atomic_event_producers(
+    eventIntervalsFileName=TRACE_FILE,
+    expectedNodes=EXPECTED_NODES,
+):
+    wait_for_broker(ACTIVEMQ_HOST, ACTIVEMQ_PORT)
     atomic_event_producer = AtomicEventProducer(
         id_=0,
-        eventIntervalsFileName="data/combinedEventTimestamps.csv",
+        eventIntervalsFileName=eventIntervalsFileName,
     )
+    missing = atomic_event_producer.wait_for_nodes(parse_node_ids(expectedNodes))
+    if missing:
+        print(f"Nodes {sorted(missing)} are not ready, pushing atomic events anyway")
     print("nodes created. Start pushing atomic events now")
     atomic_event_producer.pushEvents()
 
 
 if __name__ == "__main__":
-    print("Waiting for ActiveMQ to start")
-    time.sleep(SLEEP)
-
     register_and_start_atomic_event_producers()
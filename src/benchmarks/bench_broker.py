@@ -0,0 +1,65 @@
+"""
+Throughput of the in-process STOMP broker: one node publishes envelopes, one
+subscriber receives them, single and in batches, so broker overhead can be
+told apart from the cost of the nodes when profiling them.
+
+Run from src/: python benchmarks/bench_broker.py
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import stomp  # noqa: E402
+
+import connection  # noqa: E402
+from connection import ActiveMQNode, make_connection  # noqa: E402
+from envelope import Envelope  # noqa: E402
+from stomp_broker import StompBroker  # noqa: E402
+
+MESSAGES = 20000
+BATCH_SIZES = (1, 16, 64)
+TOPIC = "/topic/SEQ(J, A)"
+
+
+class Counter(stomp.ConnectionListener):
+    def __init__(self, expected):
+        self.expected = expected
+        self.received = 0
+        self.done = threading.Event()
+
+    def on_message(self, frame):
+        self.received += len(ActiveMQNode.unpack_message(frame))
+        if self.received >= self.expected:
+            self.done.set()
+
+
+def bench(batch_size):
+    batches = MESSAGES // batch_size
+    counter = Counter(batches * batch_size)
+    subscriber = make_connection(counter)
+    subscriber.subscribe(destination=TOPIC, id="bench", ack="auto")
+    node = ActiveMQNode(id_=1)
+    envelopes = [Envelope.atomic("SEQ(J, A)", producer_id=1) for _ in range(batch_size)]
+    time.sleep(0.1)
+
+    started = time.perf_counter()
+    for _ in range(batches):
+        node.send_batch(envelopes, topic=TOPIC)
+    received = counter.done.wait(60)
+    elapsed = time.perf_counter() - started
+    assert received, f"received {counter.received} of {counter.expected} messages"
+
+    node.disconnect()
+    subscriber.disconnect()
+    return counter.received / elapsed
+
+
+if __name__ == "__main__":
+    with StompBroker(port=0) as broker:
+        connection.ACTIVEMQ_HOST, connection.ACTIVEMQ_PORT = broker.address
+        print(f"{'batch':>6}{'events/s':>12}")
+        for batch_size in BATCH_SIZES:
+            print(f"{batch_size:>6}{bench(batch_size):>12.0f}")
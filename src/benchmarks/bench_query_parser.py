@@ -0,0 +1,141 @@
+"""
+Micro-benchmark of the query parser and topic access on deeply nested,
+generated queries, against the previous character-by-character parser with
+recomputed topics (kept below as LegacyQuery for reference).
+
+Run from src/: python benchmarks/bench_query_parser.py
+"""
+import hashlib
+import random
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from evaluation_plan import AtomicEventType, Operator, Query  # noqa: E402
+
+DEPTH = 8
+FANOUT = 3
+QUERIES = 200
+REPEAT = 5
+
+
+class LegacyQuery:
+    def __init__(self, operator, operands) -> None:
+        self.operator = operator
+        self.operands = operands
+
+    @property
+    def topic(self) -> str:
+        return str(self)
+
+    @property
+    def hash_topic(self) -> str:
+        return hashlib.md5(str(self).encode("UTF-8")).hexdigest().strip()
+
+    @classmethod
+    def from_string(cls, text):
+        operator = Operator.from_string(text)
+        operands = [
+            cls.parse_operand(operand)
+            for operand in cls.split_operands(text[len(operator.value) + 1 : -1])
+        ]
+        return cls(operator, operands)
+
+    @staticmethod
+    def split_operands(operands):
+        operands = f"{operands}$"
+        atoms = AtomicEventType.values()
+        buffer = ""
+        open_parenthesis = 0
+        results = []
+        for index, char in enumerate(operands):
+            if char == "$":
+                break
+            if char in (",", " ") and not buffer:
+                continue
+            if char in atoms and operands[index + 1] in (",", "$") and not buffer:
+                results.append(char)
+            else:
+                buffer += char
+                if char == "(":
+                    open_parenthesis += 1
+                elif char == ")":
+                    open_parenthesis -= 1
+                if char == ")" and open_parenthesis == 0:
+                    results.append(buffer)
+                    buffer = ""
+        return results
+
+    @classmethod
+    def parse_operand(cls, operand):
+        try:
+            Operator.from_string(operand)
+            return cls.from_string(operand)
+        except ValueError:
+            return AtomicEventType.from_string(operand)
+
+    def __str__(self) -> str:
+        return f"{self.operator.value}({', '.join([str(operand) for operand in self.operands])})"
+
+
+def generate_query(rng, depth):
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice(AtomicEventType.values())
+
+    operator = rng.choice(Operator.values())
+    operands = ", ".join(
+        generate_query(rng, depth - 1) for _ in range(rng.randint(2, FANOUT))
+    )
+    return f"{operator}({operands})"
+
+
+def generate_queries(seed=0):
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < QUERIES:
+        text = generate_query(rng, DEPTH)
+        if "(" in text:
+            queries.append(text)
+    return queries
+
+
+def subqueries(query):
+    for operand in query.operands:
+        if not isinstance(operand, AtomicEventType):
+            yield operand
+            yield from subqueries(operand)
+
+
+def bench(cls, texts):
+    parsed = [cls.from_string(text) for text in texts]
+    nodes = [node for query in parsed for node in subqueries(query)]
+
+    parse = min(
+        timeit.repeat(lambda: [cls.from_string(t) for t in texts], number=1, repeat=REPEAT)
+    )
+    topic = min(
+        timeit.repeat(
+            lambda: [(n.topic, n.hash_topic) for n in nodes], number=1, repeat=REPEAT
+        )
+    )
+    return parse, topic, len(nodes)
+
+
+if __name__ == "__main__":
+    texts = generate_queries()
+    print(
+        f"{len(texts)} queries, depth <= {DEPTH}, "
+        f"{sum(len(t) for t in texts) // len(texts)} characters on average"
+    )
+
+    legacy_parse, legacy_topic, nodes = bench(LegacyQuery, texts)
+    parse, topic, _ = bench(Query, texts)
+
+    print(f"{'':8}{'legacy':>12}{'current':>12}{'speedup':>10}")
+    print(f"{'parse':8}{legacy_parse:>11.4f}s{parse:>11.4f}s{legacy_parse / parse:>9.1f}x")
+    print(
+        f"{'topic':8}{legacy_topic:>11.4f}s{topic:>11.4f}s{legacy_topic / topic:>9.1f}x"
+        f"  ({nodes} subquery topics)"
+    )
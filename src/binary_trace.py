@@ -0,0 +1,189 @@
+"""
+Columnar binary event traces.
+
+Layout, little endian:
+
+    header   magic b"EVTR", version, code width in bytes, 2 pad bytes, event count (uint64)
+    column   event count x int64 timestamps in ms
+    column   event count x uint8/uint16 event type codes
+
+The 16 byte header keeps the timestamp column 8-byte aligned, so a reader can
+memory-map the file and cast both columns in place without copying. Several
+producer processes replaying the same file then share its pages.
+"""
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+
+MAGIC = b"EVTR"
+VERSION = 1
+HEADER = struct.Struct("<4sBB2xQ")
+CODE_TYPES = {1: "B", 2: "H"}
+CHUNK_SIZE = 65536
+
+BINARY_TRACE_SUFFIX = ".trace"
+
+
+def write_binary_trace(
+    path, events: Iterable[Tuple[int, int]], code_width: int = 1
+) -> int:
+    """
+    Streams (timestamp, code) pairs into a binary trace and returns the event
+    count. Timestamps go straight to the file while the codes are spooled to a
+    temporary file and appended at the end, so memory stays flat.
+    """
+    if code_width not in CODE_TYPES:
+        raise ValueError(
+            f"Unsupported code width {code_width}, expected one of {list(CODE_TYPES)}"
+        )
+
+    max_code = (1 << (8 * code_width)) - 1
+    count = 0
+    with open(path, "wb") as f, tempfile.TemporaryFile() as codes_file:
+        f.write(HEADER.pack(MAGIC, VERSION, code_width, 0))
+
+        timestamps = array("q")
+        codes = array(CODE_TYPES[code_width])
+        for timestamp, code in events:
+            if not 0 <= code <= max_code:
+                raise ValueError(
+                    f"Event type code {code} does not fit in {code_width} byte(s)"
+                )
+            timestamps.append(timestamp)
+            codes.append(code)
+            if len(timestamps) == CHUNK_SIZE:
+                count += flush_columns(f, codes_file, timestamps, codes)
+
+        count += flush_columns(f, codes_file, timestamps, codes)
+
+        codes_file.seek(0)
+        shutil.copyfileobj(codes_file, f)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, code_width, count))
+
+    return count
+
+
+def flush_columns(f, codes_file, timestamps: array, codes: array) -> int:
+    count = len(timestamps)
+    if sys.byteorder != "little":
+        timestamps.byteswap()
+        codes.byteswap()
+    timestamps.tofile(f)
+    codes.tofile(codes_file)
+    del timestamps[:]
+    del codes[:]
+    return count
+
+
+class BinaryTrace:
+    """
+    Read-only memory map of a binary trace. `timestamps` and `codes` are
+    memoryviews straight into the mapped file.
+    """
+
+    def __init__(self, path) -> None:
+        if sys.byteorder != "little":
+            raise ValueError("Memory-mapped binary traces need a little endian host")
+
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f"{self.path} is too short for a binary trace")
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, code_width, count = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or code_width not in CODE_TYPES:
+            self.map.close()
+            raise ValueError(f"{self.path} is not a version {VERSION} binary trace")
+
+        codes_offset = HEADER.size + 8 * count
+        if size < codes_offset + code_width * count:
+            self.map.close()
+            raise ValueError(f"{self.path} is truncated, expected {count} events")
+
+        view = memoryview(self.map)
+        self.timestamps = view[HEADER.size : codes_offset].cast("q")
+        self.codes = view[codes_offset : codes_offset + code_width * count].cast(
+            CODE_TYPES[code_width]
+        )
+        view.release()
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.timestamps, self.codes)
+
+    def close(self):
+        # views have to be released before the map can be closed
+        self.timestamps.release()
+        self.codes.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_binary_trace(path) -> Iterator[Tuple[int, int]]:
+    with BinaryTrace(path) as trace:
+        yield from trace
+
+
+def read_csv_row(path) -> Iterator[int]:
+    # the per-type files hold all timestamps in a single row, read it in chunks
+    rest = ""
+    with open(path) as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), ""):
+            values = (rest + chunk).split(",")
+            rest = values.pop()
+            for value in values:
+                yield int(value)
+    if rest.strip():
+        yield int(rest)
+
+
+def convert_csv_trace(csv_path, binary_path=None) -> Path:
+    """
+    Converts a combined `timestamp,type` trace or a single row per-type
+    `atomicEvents_<type>_timestamps.csv` file into a binary trace.
+    """
+    from trace_source import EVENT_TYPE_CODES, read_csv_trace
+
+    csv_path = Path(csv_path)
+    binary_path = (
+        Path(binary_path)
+        if binary_path is not None
+        else csv_path.with_suffix(BINARY_TRACE_SUFFIX)
+    )
+
+    per_type = re.fullmatch(r"atomicEvents_(\w+)_timestamps", csv_path.stem)
+    if per_type:
+        code = EVENT_TYPE_CODES[per_type.group(1)]
+        events = ((timestamp, code) for timestamp in read_csv_row(csv_path))
+    else:
+        events = read_csv_trace(csv_path)
+
+    count = write_binary_trace(binary_path, events)
+    print(f"converted {count} events from {csv_path} to {binary_path}")
+    return binary_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"usage: {sys.argv[0]} <trace.csv> [<trace{BINARY_TRACE_SUFFIX}>]")
+        sys.exit(1)
+
+    convert_csv_trace(*sys.argv[1:3])
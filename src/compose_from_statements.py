@@ -1,6 +1,15 @@
+import os
 from collections import defaultdict
+from typing import Dict, List
 
 from evaluation_plan import StatementParser
+from placement_optimizer import PlacementOptimizer, RateModel, event_rates_from_files
+from plan_rewriter import (
+    PlanRewriter,
+    conflicting,
+    subscription_count,
+    unevaluable,
+)
 
 NODE_BASE = """
   node_{node_id}:
@@ -12,13 +21,48 @@ NODE_BASE = """
       - ACTIVEMQ_PORT=61613
       - STATEMENTS={statements}
       - NODE_ID={node_id}
-      - SLEEP=100
-    depends_on:
-      activemq:
-        condition: service_healthy
-    command: ["python3", "siddhi_connection.py"]
+      - ENGINE={engine}
+      - PLAN={plan}
+      - READINESS_FILE=/tmp/ready
+    healthcheck:
+      test: ["CMD", "test", "-f", "/tmp/ready"]
+      interval: 1s
+      retries: 600
+    command: ["python3", "{command}"]
+"""
+
+# several nodes in one process, see node_host.py
+HOST_BASE = """
+  host_{host_id}:
+    build:
+      context: .
+      dockerfile: ./Dockerfile
+    environment:
+      - ACTIVEMQ_HOST=activemq
+      - ACTIVEMQ_PORT=61613
+      - STATEMENTS={statements}
+      - NODE_IDS={node_ids}
+      - ENGINE={engine}
+      - PLAN={plan}
+      - READINESS_FILE=/tmp/ready-{{node_id}}
+    healthcheck:
+      test: ["CMD", "sh", "-c", "{readiness_test}"]
+      interval: 1s
+      retries: 600
+    command: ["python3", "node_host.py"]
 """
 
+# entry point of each matching backend
+ENGINE_COMMANDS = {
+    "siddhi": "siddhi_connection.py",
+    "python": "python_connection.py",
+}
+DEFAULT_ENGINE = os.environ.get("ENGINE", "siddhi")
+
+# backend per node, nodes not listed here run the DEFAULT_ENGINE
+NODE_ENGINES = {}
+
+
 ACTIVE_MQ_BASE = """
   activemq:
     image: islandora/activemq:main
@@ -43,9 +87,7 @@ ATOMIC_PRODUCER = """
     environment:
       - ACTIVEMQ_HOST=activemq
       - ACTIVEMQ_PORT=61613
-    depends_on:
-      activemq:
-        condition: service_healthy
+      - EXPECTED_NODES={expected_nodes}
     command: ["python3", "atomicEventProducer.py"]
 """
 STATEMENTS = [
@@ -54,37 +96,143 @@ STATEMENTS = [
     "SELECT AND(C, E, D, F) FROM C, E, D, F ON {2, 4}",
     "SELECT AND(C, E, B, D, F) FROM B, AND(C, E, D, F) ON {0, 1, 2, 3, 4, 5}",
     "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
-    "SELECT AND(E, SEQ(C, J, A)) FROM AND(E, SEQ(J, A)), C ON {5, 9}",
-]
-
-STATEMENTS = [
-    "SELECT SEQ(A, F, C) FROM A, F, C ON {0}",
-    "SELECT SEQ(J, A) FROM J, A ON {4}",
-    "SELECT AND(C, E, D, F) FROM C, E, D, F ON {2, 4}",
-    "SELECT AND(B, AND(C, E, D, F)) FROM B, AND(C, E, D, F) ON {0, 1, 2, 3, 4, 5}",
-    "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
     "SELECT AND(E, SEQ(C, J, A)) FROM E, SEQ(C, J, A) ON {5, 9}",
-    "SELECT SEQ(C, J, A) FROM C, J, A ON {10}", #Helper Node
+    "SELECT SEQ(C, J, A) FROM C, J, A ON {10}",  # helper node
 ]
 
+# reuse subqueries produced elsewhere in the plan and add helper statements for
+# the ones nobody produces, see plan_rewriter.py
+REWRITE_PLAN = os.environ.get("REWRITE_PLAN", "1") == "1"
+# replace the hand-written ON {...} placement by the cost-based one from
+# placement_optimizer.py, with rates measured from the per-type traces
+OPTIMIZE_PLACEMENT = os.environ.get("OPTIMIZE_PLACEMENT", "0") == "1"
+# pack the nodes running the same engine into this many processes (and JVMs),
+# 0 runs every node in its own container
+NODE_HOSTS = int(os.environ.get("NODE_HOSTS", 0))
+# let the nodes of every SEQ statement placed on several nodes split its work
+# instead of each computing all of it, see Statement.partitionable
+PARTITION_REPLICAS = os.environ.get("PARTITION_REPLICAS", "0") == "1"
+
+
+def plan_statements(statements=STATEMENTS):
+    parsed_statements = [StatementParser(statement).parse() for statement in statements]
+    if PARTITION_REPLICAS:
+        for statement in parsed_statements:
+            statement.partitioned = (
+                len(statement.nodes) > 1 and statement.partitionable
+            )
+    if not REWRITE_PLAN:
+        invalid = unevaluable(parsed_statements)
+        if invalid:
+            raise ValueError(
+                "Statements can't be evaluated as written, set REWRITE_PLAN=1: "
+                + "; ".join(str(statement) for statement in invalid)
+            )
+        conflicts = conflicting(parsed_statements)
+        if conflicts:
+            raise ValueError(
+                "Statements produce the same topic with a different WITHIN or "
+                "POLICY, their matches would mix: "
+                + "; ".join(str(statement) for statement in conflicts)
+            )
+        return parsed_statements
+
+    rewritten = PlanRewriter(parsed_statements).rewrite()
+    print(
+        f"Rewrote plan: {len(parsed_statements)} -> {len(rewritten)} statements, "
+        f"{subscription_count(parsed_statements)} -> {subscription_count(rewritten)} "
+        "subscriptions"
+    )
+    return rewritten
+
+
+def place_statements(statements):
+    if not OPTIMIZE_PLACEMENT:
+        return statements
+
+    rates = RateModel(event_rates_from_files())
+    placed, report = PlacementOptimizer(statements, rates).optimize()
+    print(f"Predicted message rates per node:\n{report}")
+    return placed
+
+
+def pack_nodes(statements_by_node: Dict[int, List[str]], hosts: int) -> List[List[int]]:
+    """
+    Spread the nodes over at most `hosts` hosts per engine, the nodes with the
+    most statements first, each onto the host with the fewest statements so far.
+    """
+    packed = []
+    nodes_by_engine = defaultdict(list)
+    for node in sorted(statements_by_node):
+        nodes_by_engine[NODE_ENGINES.get(node, DEFAULT_ENGINE)].append(node)
+
+    for nodes in nodes_by_engine.values():
+        bins = [[] for _ in range(min(hosts, len(nodes)))]
+        loads = [0] * len(bins)
+        for node in sorted(nodes, key=lambda node: -len(statements_by_node[node])):
+            index = loads.index(min(loads))
+            bins[index].append(node)
+            loads[index] += len(statements_by_node[node])
+        packed.extend(sorted(nodes) for nodes in bins)
+    return packed
+
+
+def write_hosts(f, statements_by_node: Dict[int, List[str]], hosts: int, plan: str):
+    for host_id, node_ids in enumerate(pack_nodes(statements_by_node, hosts)):
+        statement_strings = list(
+            dict.fromkeys(
+                statement for node in node_ids for statement in statements_by_node[node]
+            )
+        )
+        f.write(
+            HOST_BASE.format(
+                host_id=host_id,
+                statements="|".join(statement_strings),
+                node_ids=",".join(str(node) for node in node_ids),
+                engine=NODE_ENGINES.get(node_ids[0], DEFAULT_ENGINE),
+                plan=plan,
+                readiness_test=" && ".join(
+                    f"test -f /tmp/ready-{node}" for node in node_ids
+                ),
+            )
+        )
+        f.write("\n")
+
+
 if __name__ == "__main__":
     statements_by_node = defaultdict(list)
 
-    for statement in STATEMENTS:
-        parsed_statement = StatementParser(statement).parse()
+    placed_statements = place_statements(plan_statements())
+    for parsed_statement in placed_statements:
         for node in parsed_statement.nodes:
-            statements_by_node[node.value].append(statement)
+            statements_by_node[node.value].append(str(parsed_statement))
+    # lets every node skip publishing what no other node consumes
+    plan = "|".join(str(statement) for statement in placed_statements)
 
     with open("docker-compose.statements.yaml", "w") as f:
         f.write('version: "3.8"\n')
         f.write("services: \n")
 
-        for node, statement_strings in statements_by_node.items():
-            f.write(
-                NODE_BASE.format(node_id=node, statements="|".join(statement_strings))
-            )
-            f.write("\n")
+        if NODE_HOSTS:
+            write_hosts(f, statements_by_node, NODE_HOSTS, plan)
+        else:
+            for node, statement_strings in statements_by_node.items():
+                engine = NODE_ENGINES.get(node, DEFAULT_ENGINE)
+                f.write(
+                    NODE_BASE.format(
+                        node_id=node,
+                        statements="|".join(statement_strings),
+                        engine=engine,
+                        plan=plan,
+                        command=ENGINE_COMMANDS[engine],
+                    )
+                )
+                f.write("\n")
 
         f.write(ACTIVE_MQ_BASE)
         f.write("\n")
-        f.write(ATOMIC_PRODUCER)
+        f.write(
+            ATOMIC_PRODUCER.format(
+                expected_nodes=",".join(str(node) for node in statements_by_node)
+            )
+        )
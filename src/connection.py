@@ -1,13 +1,26 @@
 import os
-from typing import Any, List, Optional
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
 
 import stomp
 
+from connection_pool import CONNECTION_POOL, ConnectionPool, PooledConnection
+from dedup import DuplicateFilter
+from envelope import Envelope, is_envelope
 from evaluation_plan import Statement
+from metrics import NodeMetrics
+from readiness import READINESS_TIMEOUT_S, ReadinessAnnouncer, ReadinessWaiter
 
 ACTIVEMQ_HOST = os.environ.get("ACTIVEMQ_HOST", "localhost")
 ACTIVEMQ_PORT = os.environ.get("ACTIVEMQ_PORT", 61613)
 STATEMENTS = os.environ.get("STATEMENTS", [])
+# drop composite events already received from another replica of a statement
+DEDUP = os.environ.get("DEDUP", "1") == "1"
+
+# frames carrying several messages are marked with the number of messages
+BATCH_HEADER = "batch-size"
+BATCH_SEPARATOR = "\n"
 
 
 class LogListenerActiveMQ(stomp.ConnectionListener):
@@ -20,43 +33,177 @@ class LogListenerActiveMQ(stomp.ConnectionListener):
 
 def make_connection(listener: Any = LogListenerActiveMQ()):
     hosts = [(ACTIVEMQ_HOST, ACTIVEMQ_PORT)]
-    conn = stomp.Connection(host_and_ports=hosts)
+    # bodies are binary envelopes, ActiveMQNode.unpack_message decodes them
+    conn = stomp.Connection(host_and_ports=hosts, auto_decode=False)
     conn.set_listener("", listener)
     conn.connect("admin", "admin", wait=True)
     return conn
 
 
+def local_topics(statements: List[Statement], node_id: int) -> Set[str]:
+    """
+    Outputs of a node's statements consumed by other statements of it, handed
+    over in-process instead of through the broker. Only the ones the node
+    computes all matches of, a replica of a PARTITIONED SEQ still needs the
+    shards of the others from the broker.
+    """
+    produced = {
+        statement.query.topic: statement
+        for statement in statements
+        if statement.query is not None
+    }
+    consumed = {topic for statement in statements for topic in statement.input_topics}
+    return {
+        topic
+        for topic in set(produced) & consumed
+        if produced[topic].shard(node_id) is None
+    }
+
+
 class ActiveMQNode(stomp.ConnectionListener):
     def __init__(
         self,
         id_: int,
         statements: Optional[List[Statement]] = None,
+        connection_pool: Optional[ConnectionPool] = None,
+        plan: Optional[List[Statement]] = None,
     ):
         super().__init__()
 
         self.id: int = int(id_)
-        self.activemq_connection: stomp.Connection = make_connection(listener=self)
+        # shared with the other nodes of this process, opened on first use
+        self.connection_pool = (
+            CONNECTION_POOL if connection_pool is None else connection_pool
+        )
+        self._activemq_connection: Optional[PooledConnection] = None
+        self.readiness: Optional[ReadinessAnnouncer] = None
         self.statements: list[Statement] = statements or []
+        self.metrics = NodeMetrics(self.id)
+        self.duplicates = DuplicateFilter() if DEDUP else None
+
+        self.local_topics = local_topics(self.statements, self.id)
+        self.local_events: Deque[Envelope] = deque()
+
+        # the whole evaluation plan, None publishes every output
+        self.plan = plan
+        # input topics of the plan, and the ones some node subscribes to on
+        # the broker, this one included (e.g. the shards of a partitioned SEQ)
+        self.plan_topics: Set[str] = set()
+        self.broker_topics: Set[str] = {
+            topic
+            for statement in self.statements
+            for topic in statement.input_topics
+            if topic not in self.local_topics
+        }
+        statements_by_node: Dict[int, List[Statement]] = defaultdict(list)
+        for statement in plan or []:
+            self.plan_topics.update(statement.input_topics)
+            for node in statement.nodes:
+                statements_by_node[node.value].append(statement)
+        for node_id, statements in statements_by_node.items():
+            self.broker_topics.update(
+                topic
+                for statement in statements
+                for topic in statement.input_topics
+                if topic not in local_topics(statements, node_id)
+            )
+
+    @property
+    def activemq_connection(self) -> PooledConnection:
+        if self._activemq_connection is None:
+            self._activemq_connection = self.connection_pool.acquire(
+                self, (ACTIVEMQ_HOST, int(ACTIVEMQ_PORT))
+            )
+        return self._activemq_connection
 
     def start(self):
+        self.metrics.start_reporting()
         self.subscribe_to_topics()
+        self.announce_ready()
+
+    def announce_ready(self) -> bool:
+        """
+        Tell the producer (and READINESS_FILE) that this node is subscribed,
+        call it once the node can process events.
+        """
+        self.readiness = ReadinessAnnouncer(self)
+        return self.readiness.announce()
+
+    def wait_for_nodes(
+        self, expected: Iterable[int], timeout: float = READINESS_TIMEOUT_S
+    ) -> Set[int]:
+        """
+        Block until the expected nodes announced they are ready, returns the
+        ones that didn't within timeout seconds.
+        """
+        return ReadinessWaiter(self, expected).wait(timeout)
 
     def stop(self):
         self.unsubscribe_from_topics()
         self.disconnect()
+        self.metrics.stop_reporting()
 
     def on_message(self, message):
-        print(f"ActiveMQNodeListener - Received message {message}")
+        for envelope in self.receive_message(message):
+            print(f"ActiveMQNodeListener - Received message {envelope!r}")
+
+    def receive_message(self, message) -> List[Envelope]:
+        """
+        Unpack a frame, drop composite events that were already received and
+        record how long the remaining events took to get here.
+        """
+        envelopes = self.unpack_message(message)
+        if self.duplicates is not None:
+            envelopes = self.drop_duplicates(envelopes)
+
+        now = time.time()
+        for envelope in envelopes:
+            self.metrics.record(
+                "receive", envelope.symbol, now - envelope.event_time / 1000
+            )
+        return envelopes
+
+    def drop_duplicates(self, envelopes: List[Envelope]) -> List[Envelope]:
+        fresh = []
+        for envelope in envelopes:
+            # atomic events are unique, only replicas publish the same composite
+            if envelope.constituents and self.duplicates.is_duplicate(envelope.event_id):
+                self.metrics.count("duplicates", envelope.symbol)
+                continue
+            fresh.append(envelope)
+        return fresh
 
     def on_error(self, error):
         print(f"ActiveMQNodeListener - Received error {error}")
 
+    def publishes(self, topic: str) -> bool:
+        """
+        Whether an output has to go to the broker: some node subscribes to it
+        there, or it's a final result of the plan, or the plan is unknown.
+        """
+        if self.plan is None:
+            return True
+        return topic in self.broker_topics or topic not in self.plan_topics
+
+    def route_output(self, envelope: Envelope) -> bool:
+        """
+        Queue a match of this node for its statements consuming it, see
+        local_topics, returns whether to publish it as well. The engine nodes
+        feed local_events back after every input event.
+        """
+        if envelope.symbol in self.local_topics:
+            self.metrics.count("local", envelope.symbol)
+            self.local_events.append(envelope)
+
+        return self.publishes(envelope.symbol)
+
     @property
     def topic_subscriptions(self):
         return [
             f"/topic/{topic}"
             for statement in self.statements
             for topic in statement.input_topics
+            if topic not in self.local_topics
         ]
 
     @property
@@ -66,7 +213,7 @@ class ActiveMQNode(stomp.ConnectionListener):
     def subscribe(self, topic, ack="auto"):
         subscription_id = f"sub-{self.id}-{topic}"
         self.activemq_connection.subscribe(
-            destination=topic, id=subscription_id, ack=ack
+            self, destination=topic, id=subscription_id, ack=ack
         )
 
     def unsubscribe(self, topic):
@@ -83,13 +230,55 @@ class ActiveMQNode(stomp.ConnectionListener):
             self.unsubscribe(topic)
 
     def send(self, message, topic):
+        if isinstance(message, Envelope):
+            message = message.encode()
         self.activemq_connection.send(body=message, destination=topic)
 
+    def send_batch(self, messages, topic):
+        if len(messages) == 1:
+            self.send(messages[0], topic=topic)
+            return
+
+        self.activemq_connection.send(
+            body=self.pack_batch(messages),
+            destination=topic,
+            headers={BATCH_HEADER: str(len(messages))},
+        )
+
+    @staticmethod
+    def pack_batch(messages):
+        if isinstance(messages[0], Envelope):
+            # envelopes are self-delimiting
+            return b"".join(message.encode() for message in messages)
+        return BATCH_SEPARATOR.join(messages)
+
+    @staticmethod
+    def unpack_message(message) -> List[Envelope]:
+        """
+        Decode the envelopes of a (possibly batched) frame. Plain text messages
+        are wrapped into atomic envelopes, their body being the symbol.
+        """
+        body = message.body
+        if is_envelope(body):
+            return Envelope.decode_all(body)
+
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        texts = body.split(BATCH_SEPARATOR) if BATCH_HEADER in message.headers else [body]
+        return [Envelope.atomic(text, producer_id=0) for text in texts]
+
     def disconnect(self):
-        self.activemq_connection.disconnect()
+        if self.readiness is not None:
+            self.readiness.withdraw()
+            self.readiness = None
+        if self._activemq_connection is not None:
+            self.connection_pool.release(
+                self, self._activemq_connection.host_and_port
+            )
+            self._activemq_connection = None
 
     def __str__(self):
-        return f"Connection(id='{self.id}', activemq_connection={self.activemq_connection}, statements='{self.statements}')"
+        return f"Connection(id='{self.id}', activemq_connection={self._activemq_connection}, statements='{self.statements}')"
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, ActiveMQNode):
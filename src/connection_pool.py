@@ -0,0 +1,224 @@
+"""
+Broker connections shared by the nodes hosted in one process.
+
+A ConnectionPool hands every node one of at most `size` PooledConnections.
+Nothing is opened until a node first subscribes or sends. Frames are routed
+back to the node owning their subscription id, and a connection the broker
+dropped is reopened with exponential backoff, with its subscriptions
+restored.
+"""
+import itertools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+import stomp
+
+CONNECTION_POOL_SIZE = int(os.environ.get("CONNECTION_POOL_SIZE", 1))
+BACKOFF_INITIAL_S = float(os.environ.get("BACKOFF_INITIAL_S", 0.1))
+BACKOFF_MAX_S = float(os.environ.get("BACKOFF_MAX_S", 10))
+# attempts to open a connection before giving up, 0 retries forever
+CONNECT_ATTEMPTS = int(os.environ.get("CONNECT_ATTEMPTS", 10))
+
+
+def backoff_delays(
+    initial: float = BACKOFF_INITIAL_S, maximum: float = BACKOFF_MAX_S
+) -> Iterator[float]:
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * 2, maximum)
+
+
+def retry_with_backoff(
+    attempt: Callable[[], Any],
+    attempts: int = CONNECT_ATTEMPTS,
+    delays: Optional[Iterator[float]] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Any:
+    """
+    Call attempt until it doesn't raise a stomp exception or an OSError,
+    sleeping between the calls, and re-raise the last error after `attempts`
+    calls (never give up if attempts is 0).
+    """
+    delays = delays or backoff_delays()
+    tried = 0
+    while True:
+        try:
+            return attempt()
+        except (stomp.exception.StompException, OSError):
+            tried += 1
+            if attempts and tried >= attempts:
+                raise
+            sleep(next(delays))
+
+
+class PooledConnection(stomp.ConnectionListener):
+    """
+    One STOMP connection multiplexing the subscriptions of several nodes.
+
+    Subscription ids have to be unique across the nodes sharing the
+    connection, ActiveMQNode prefixes them with the node id.
+    """
+
+    def __init__(self, host_and_port: Tuple[str, int], name: str = "pooled") -> None:
+        self.host_and_port = host_and_port
+        self.name = name
+        self.connection: Optional[stomp.Connection] = None
+        # subscription id -> (listener, destination, ack)
+        self.subscriptions: Dict[str, Tuple[Any, str, str]] = {}
+        self.listeners: Set[Any] = set()
+        self.lock = threading.RLock()
+        self.closing = False
+        self.connects = 0
+        # receipt id -> set once the broker confirmed the frame carrying it
+        self.receipts: Dict[str, threading.Event] = {}
+        self.receipt_ids = itertools.count(1)
+
+    def add_listener(self, listener: Any):
+        with self.lock:
+            self.listeners.add(listener)
+
+    def remove_listener(self, listener: Any) -> bool:
+        """
+        Forget a listener and its subscriptions, returns whether the
+        connection is unused now.
+        """
+        with self.lock:
+            for subscription_id, (owner, _, _) in list(self.subscriptions.items()):
+                if owner is listener:
+                    self.unsubscribe(subscription_id)
+            self.listeners.discard(listener)
+            return not self.listeners
+
+    @property
+    def is_connected(self) -> bool:
+        return self.connection is not None and self.connection.is_connected()
+
+    def connect(self) -> stomp.Connection:
+        with self.lock:
+            if self.is_connected:
+                return self.connection
+
+            self.closing = False
+
+            def attempt():
+                # bodies are binary envelopes, ActiveMQNode.unpack_message decodes them
+                connection = stomp.Connection(
+                    host_and_ports=[self.host_and_port], auto_decode=False
+                )
+                connection.set_listener(self.name, self)
+                connection.connect("admin", "admin", wait=True)
+                return connection
+
+            self.connection = retry_with_backoff(attempt)
+            self.connects += 1
+            for subscription_id, (_, destination, ack) in self.subscriptions.items():
+                self.connection.subscribe(destination=destination, id=subscription_id, ack=ack)
+            return self.connection
+
+    def subscribe(self, listener: Any, destination: str, id: str, ack: str = "auto"):
+        with self.lock:
+            self.subscriptions[id] = (listener, destination, ack)
+            self.connect().subscribe(destination=destination, id=id, ack=ack)
+
+    def unsubscribe(self, id: str):
+        with self.lock:
+            if self.subscriptions.pop(id, None) is not None and self.is_connected:
+                self.connection.unsubscribe(id=id)
+
+    def send(self, body, destination: str, headers: Optional[Dict[str, str]] = None):
+        connection = self.connection if self.is_connected else self.connect()
+        connection.send(body=body, destination=destination, headers=headers)
+
+    def send_confirmed(
+        self, body, destination: str, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Send and wait until the broker confirms it processed the frame, and
+        with it every frame sent on this connection before, e.g. the
+        subscriptions. Returns False if the receipt didn't arrive in time.
+        """
+        receipt = f"{self.name}-{next(self.receipt_ids)}"
+        confirmed = self.receipts[receipt] = threading.Event()
+        try:
+            self.send(body, destination, headers={"receipt": receipt})
+            return confirmed.wait(timeout)
+        finally:
+            self.receipts.pop(receipt, None)
+
+    def disconnect(self):
+        with self.lock:
+            self.closing = True
+            if self.is_connected:
+                self.connection.disconnect()
+            self.connection = None
+
+    def on_message(self, frame):
+        subscription = self.subscriptions.get(frame.headers.get("subscription"))
+        if subscription is not None:
+            subscription[0].on_message(frame)
+
+    def on_receipt(self, frame):
+        confirmed = self.receipts.get(frame.headers.get("receipt-id"))
+        if confirmed is not None:
+            confirmed.set()
+
+    def on_error(self, frame):
+        for listener in list(self.listeners):
+            listener.on_error(frame)
+
+    def on_disconnected(self):
+        if self.closing:
+            return
+
+        print(f"PooledConnection {self.name} lost the broker, reconnecting")
+        # not from the receiver thread calling us, it is about to exit
+        threading.Thread(
+            target=self.reconnect, name=f"reconnect-{self.name}", daemon=True
+        ).start()
+
+    def reconnect(self):
+        try:
+            retry_with_backoff(self.connect, attempts=0)
+        except Exception as error:
+            print(f"PooledConnection {self.name} failed to reconnect: {error}")
+
+
+class ConnectionPool:
+    """
+    At most `size` connections per broker, node i always gets the
+    connection i % size to the broker it asks for.
+    """
+
+    def __init__(self, size: int = CONNECTION_POOL_SIZE) -> None:
+        self.size = max(size, 1)
+        self.connections: Dict[Tuple[Tuple[str, int], int], PooledConnection] = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, node: Any, host_and_port: Tuple[str, int]) -> PooledConnection:
+        index = node.id % self.size
+        with self.lock:
+            connection = self.connections.get((host_and_port, index))
+            if connection is None:
+                connection = PooledConnection(host_and_port, name=f"pool-{index}")
+                self.connections[(host_and_port, index)] = connection
+        connection.add_listener(node)
+        return connection
+
+    def release(self, node: Any, host_and_port: Tuple[str, int]):
+        key = (host_and_port, node.id % self.size)
+        with self.lock:
+            connection = self.connections.get(key)
+            if connection is None or not connection.remove_listener(node):
+                return
+            del self.connections[key]
+        connection.disconnect()
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+
+# shared by every node of this process
+CONNECTION_POOL = ConnectionPool()
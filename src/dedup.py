@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+DEDUP_SIZE = int(os.environ.get("DEDUP_SIZE", 100000))
+DEDUP_TTL_S = float(os.environ.get("DEDUP_TTL_S", 300))
+
+
+class DuplicateFilter:
+    """
+    Remembers the ids of the last `size` events seen within `ttl` seconds.
+
+    Composite event ids are derived from the topic and the constituent atomic
+    events (see envelope.composite_event_id), so every replica of a statement
+    publishes the same match under the same id and all but the first copy are
+    reported as duplicates. Memory stays bounded by `size`, ids expire after
+    `ttl` seconds without being seen again.
+    """
+
+    def __init__(
+        self,
+        size: int = DEDUP_SIZE,
+        ttl: float = DEDUP_TTL_S,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.seen: "OrderedDict[int, float]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.passed = 0
+        self.dropped = 0
+
+    def is_duplicate(self, event_id: int) -> bool:
+        now = self.clock()
+        with self.lock:
+            expired = now - self.ttl
+            while self.seen and next(iter(self.seen.values())) <= expired:
+                self.seen.popitem(last=False)
+
+            duplicate = event_id in self.seen
+            self.seen[event_id] = now
+            self.seen.move_to_end(event_id)
+
+            if duplicate:
+                self.dropped += 1
+            else:
+                self.passed += 1
+                if len(self.seen) > self.size:
+                    self.seen.popitem(last=False)
+            return duplicate
+
+    def __len__(self) -> int:
+        return len(self.seen)
@@ -0,0 +1,232 @@
+"""
+Compact binary envelope for the events exchanged through ActiveMQ.
+
+Layout (little endian, 24 byte fixed header):
+
+    B   magic (0xF5, never the first byte of a UTF-8 text message)
+    B   version
+    q   event time, milliseconds since the epoch
+    q   event id
+    H   producer / node id
+    H   number of constituent atomic event ids
+    H   length of the symbol
+    ... symbol, UTF-8
+    ... constituent atomic event ids, int64 each
+
+Atomic events carry no constituents, their only constituent is themselves.
+Composite events carry the sorted ids of all atomic events they were built from
+and get a deterministic id derived from their symbol and those constituents.
+Envelopes are self-delimiting, so a batch is just their concatenation.
+"""
+import hashlib
+import itertools
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+MAGIC = 0xF5
+VERSION = 1
+HEADER = struct.Struct("<BBqqHHH")
+ID_MASK = (1 << 63) - 1  # ids stay positive in Siddhi's signed long
+
+EVENT_CACHE_SIZE = int(os.environ.get("EVENT_CACHE_SIZE", 100000))
+
+_event_counter = itertools.count(1)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def new_event_id(producer_id: int) -> int:
+    return ((producer_id << 40) | next(_event_counter)) & ID_MASK
+
+
+def composite_event_id(symbol: str, constituents: Sequence[int]) -> int:
+    digest = hashlib.blake2b(
+        symbol.encode("utf-8") + struct.pack(f"<{len(constituents)}q", *constituents),
+        digest_size=8,
+    ).digest()
+    return int.from_bytes(digest, "little") & ID_MASK
+
+
+def is_envelope(body) -> bool:
+    return isinstance(body, (bytes, bytearray)) and len(body) > 0 and body[0] == MAGIC
+
+
+class Envelope:
+    __slots__ = ("symbol", "event_time", "event_id", "producer_id", "constituents")
+
+    def __init__(
+        self,
+        symbol: str,
+        event_time: int,
+        event_id: int,
+        producer_id: int,
+        constituents: Tuple[int, ...] = (),
+    ) -> None:
+        self.symbol = symbol
+        self.event_time = event_time
+        self.event_id = event_id
+        self.producer_id = producer_id
+        self.constituents = constituents
+
+    @classmethod
+    def atomic(
+        cls, symbol: str, producer_id: int, event_time: Optional[int] = None
+    ) -> "Envelope":
+        return cls(
+            symbol,
+            now_ms() if event_time is None else event_time,
+            new_event_id(producer_id),
+            producer_id,
+        )
+
+    @classmethod
+    def composite(
+        cls,
+        symbol: str,
+        producer_id: int,
+        constituents: Iterable[int],
+        event_time: int,
+    ) -> "Envelope":
+        constituents = tuple(sorted(set(constituents)))
+        return cls(
+            symbol,
+            event_time,
+            composite_event_id(symbol, constituents),
+            producer_id,
+            constituents,
+        )
+
+    @classmethod
+    def from_parts(
+        cls, symbol: str, producer_id: int, parts: Sequence["Envelope"]
+    ) -> "Envelope":
+        return cls.composite(
+            symbol,
+            producer_id,
+            constituents=[i for part in parts for i in part.constituent_ids],
+            event_time=max(part.event_time for part in parts),
+        )
+
+    @property
+    def constituent_ids(self) -> Tuple[int, ...]:
+        return self.constituents or (self.event_id,)
+
+    def encode(self) -> bytes:
+        symbol = self.symbol.encode("utf-8")
+        n = len(self.constituents)
+        return (
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                self.event_time,
+                self.event_id,
+                self.producer_id,
+                n,
+                len(symbol),
+            )
+            + symbol
+            + struct.pack(f"<{n}q", *self.constituents)
+        )
+
+    @classmethod
+    def decode_from(cls, data, offset: int = 0) -> "Tuple[Envelope, int]":
+        """
+        Decode the envelope starting at offset, returns it and the offset
+        of the next envelope in data.
+        """
+        (
+            magic,
+            version,
+            event_time,
+            event_id,
+            producer_id,
+            n,
+            symbol_length,
+        ) = HEADER.unpack_from(data, offset)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Invalid envelope: magic={magic}, version={version}")
+
+        offset += HEADER.size
+        symbol = bytes(data[offset : offset + symbol_length]).decode("utf-8")
+        offset += symbol_length
+        constituents = struct.unpack_from(f"<{n}q", data, offset)
+        offset += 8 * n
+
+        return cls(symbol, event_time, event_id, producer_id, constituents), offset
+
+    @classmethod
+    def decode(cls, data) -> "Envelope":
+        return cls.decode_from(data)[0]
+
+    @classmethod
+    def decode_all(cls, data) -> "List[Envelope]":
+        envelopes = []
+        offset = 0
+        while offset < len(data):
+            envelope, offset = cls.decode_from(data, offset)
+            envelopes.append(envelope)
+        return envelopes
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Envelope):
+            return False
+
+        return (
+            self.symbol == other.symbol
+            and self.event_time == other.event_time
+            and self.event_id == other.event_id
+            and self.producer_id == other.producer_id
+            and self.constituents == other.constituents
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Envelope(symbol='{self.symbol}', event_time={self.event_time}, "
+            f"event_id={self.event_id}, producer_id={self.producer_id}, "
+            f"constituents={list(self.constituents)})"
+        )
+
+    def __str__(self) -> str:
+        return self.symbol
+
+
+class EventCache:
+    """
+    Bounded map event id -> envelope of the most recent input events.
+
+    Siddhi only hands back the ids of the events in a match, the cache
+    resolves them to their constituent atomic events.
+    """
+
+    def __init__(self, size: int = EVENT_CACHE_SIZE) -> None:
+        self.size = size
+        self.events: "OrderedDict[int, Envelope]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, envelope: Envelope) -> None:
+        with self.lock:
+            self.events[envelope.event_id] = envelope
+            if len(self.events) > self.size:
+                self.events.popitem(last=False)
+
+    def get(self, event_id: int) -> Optional[Envelope]:
+        return self.events.get(event_id)
+
+    def constituents(self, event_ids: Iterable[int]) -> List[int]:
+        constituents = []
+        for event_id in event_ids:
+            envelope = self.events.get(event_id)
+            constituents.extend(
+                envelope.constituent_ids if envelope is not None else (event_id,)
+            )
+        return constituents
+
+    def __len__(self) -> int:
+        return len(self.events)
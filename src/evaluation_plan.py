@@ -1,8 +1,8 @@
 import hashlib
 import re
+import weakref
 from enum import Enum
-from itertools import permutations
-from typing import Any, List, Union
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
 
 
 def make_safe_topic_name(topic: str) -> str:
@@ -17,6 +17,27 @@ def make_safe_topic_name(topic: str) -> str:
     return escaped_clean
 
 
+DURATION_UNITS = {"ms": 1, "s": 1000, "sec": 1000, "min": 60000, "h": 3600000}
+
+
+def parse_duration(text: str) -> int:
+    """
+    "30s", "1500ms", "2 min" -> milliseconds
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*(ms|sec|s|min|h)\s*", text)
+    if not match:
+        raise ValueError(f"Invalid duration: '{text}', expected e.g. 30s or 1500ms")
+    return int(float(match.group(1)) * DURATION_UNITS[match.group(2)])
+
+
+def format_duration(ms: int) -> str:
+    return f"{ms // 1000}s" if ms % 1000 == 0 else f"{ms}ms"
+
+
+def siddhi_within(within_ms: "Optional[int]") -> str:
+    return f" within {within_ms} milliseconds" if within_ms is not None else ""
+
+
 class ValueEnum(Enum):
     @classmethod
     def values(cls) -> "list[str]":
@@ -43,6 +64,10 @@ class AtomicEventType(ValueEnum):
     def topic(self):
         return self.value
 
+    @property
+    def canonical(self) -> "AtomicEventType":
+        return self
+
     def to_siddhi_query(
         self,
         input_stream="cseEventStream",
@@ -52,7 +77,7 @@ class AtomicEventType(ValueEnum):
         return (
             f"@info(name = '{self.topic}') "
             f"from {input_stream}[{attribute} == '{self.value}']  "
-            f"select {attribute} "
+            f"select {attribute}, eventTime, eventId as id1 "
             f"insert into {output_stream}; "
         )
 
@@ -65,6 +90,58 @@ class Operator(ValueEnum):
     SEQ = "SEQ"
 
 
+class Selection(ValueEnum):
+    """
+    Which events a pattern combines into matches, with the effect on the
+    output rate of SEQ(X1, ..., Xn) with operand rates r1, ..., rn:
+
+    EACH   every combination in order, each X1 starts a partial match,
+           about r1 matches/s and unbounded state without WITHIN
+    FIRST  a single match in progress at a time, events that don't extend it
+           are ignored, about 1 / (1/r1 + ... + 1/rn) matches/s
+    LAST   only the most recent event of each operand, at most one partial
+           match per step, at most min(ri) matches/s
+
+    For AND, FIRST and LAST keep one event per operand, EACH every event, so
+    with EACH each arrival matches every combination of the stored events.
+    """
+
+    EACH = "EACH"
+    FIRST = "FIRST"
+    LAST = "LAST"
+
+
+class Consumption(ValueEnum):
+    """
+    REUSE    an event may be part of several matches
+    CONSUME  the events of a match are not used for any other match, which
+             caps the output at min(ri) matches/s and drops the partial
+             matches holding consumed events
+    """
+
+    REUSE = "REUSE"
+    CONSUME = "CONSUME"
+
+
+# the semantics of the generated `every` patterns
+DEFAULT_POLICIES = {
+    Operator.SEQ: (Selection.EACH, Consumption.REUSE),
+    Operator.AND: (Selection.FIRST, Consumption.CONSUME),
+}
+
+# what Query.to_siddhi_query can express, the others need the python engine
+SIDDHI_POLICIES = {
+    Operator.SEQ: {
+        (Selection.EACH, Consumption.REUSE),
+        # every (e1 -> ... -> en) holds a single partial match, so its events
+        # are never part of another match either way
+        (Selection.FIRST, Consumption.REUSE),
+        (Selection.FIRST, Consumption.CONSUME),
+    },
+    Operator.AND: {(Selection.FIRST, Consumption.CONSUME)},
+}
+
+
 class NodeEnum(Enum):
     ZERO = 0
     ONE = 1
@@ -85,15 +162,89 @@ class Statement:
         nodes: "List[NodeEnum]",
         query: "Query",
         inputs: "List[Union[AtomicEventType,Query]]",
+        partitioned: bool = False,
+        within_ms: Optional[int] = None,
+        selection: "Optional[Selection]" = None,
+        consumption: "Optional[Consumption]" = None,
     ) -> None:
         self.nodes = nodes
-        self.query = query
-        self.inputs = inputs
+        self.query = query.canonical if query is not None else None
+        self.inputs = [input_.canonical for input_ in inputs]
+        # replicas split the work, see shard()
+        self.partitioned = partitioned
+        # maximum event time span of a match, partial matches expire after it
+        self.within_ms = within_ms
+        # None falls back to DEFAULT_POLICIES of the operator
+        self.selection = selection
+        self.consumption = consumption
 
     @property
     def input_topics(self) -> List[str]:
         return sorted([input_.topic for input_ in self.inputs])
 
+    @property
+    def evaluation_query(self) -> "Query":
+        """
+        The query as it is evaluated from the inputs of this statement.
+
+        Canonical AND queries are flat, AND(B, C, D, E, F) computed FROM B,
+        AND(C, D, E, F) is evaluated as AND(B, AND(C, D, E, F)) so that its
+        operands are the subscribed topics. The topic stays the canonical one.
+        Queries that are not a regrouping of their inputs are evaluated as is.
+        """
+        query = self.query
+        if query.operator != Operator.AND or len(self.inputs) < 2:
+            return query
+
+        def and_operands(operand):
+            if isinstance(operand, Query) and operand.operator == Operator.AND:
+                return [operand_.topic for operand_ in operand.operands]
+            return [operand.topic]
+
+        provided = sorted(
+            [topic for input_ in self.inputs for topic in and_operands(input_)]
+        )
+        if provided != sorted(and_operands(query)):
+            return query
+
+        return Query(Operator.AND, sorted(self.inputs, key=lambda input_: input_.topic))
+
+    def shard(self, node_id: int) -> "Optional[Tuple[int, int]]":
+        """
+        (index, count) of the shard a node evaluates of a PARTITIONED statement,
+        None if the node evaluates all of it.
+
+        SEQ replicas only start partial matches for first-operand events with
+        eventId % count == index. Every partial match still sees all later
+        events, so no match is lost and each is found by exactly one replica.
+        """
+        if not self.partitioned or len(self.nodes) < 2:
+            return None
+
+        node_ids = [node.value for node in self.nodes]
+        return node_ids.index(int(node_id)), len(node_ids)
+
+    @property
+    def partitionable(self) -> bool:
+        """
+        Whether the replicas can split the work without changing the matches.
+
+        Only SEQ with the default EACH REUSE policy: its partial matches are
+        independent of each other. The rounds of an AND, and which events a
+        FIRST, LAST or CONSUME pattern uses, depend on every event before, so
+        each replica would have to see all of them and would still pick and
+        consume events on its own.
+        """
+        return (
+            self.query.operator == Operator.SEQ
+            and self.policy == DEFAULT_POLICIES[Operator.SEQ]
+        )
+
+    @property
+    def policy(self) -> "Tuple[Selection, Consumption]":
+        selection, consumption = DEFAULT_POLICIES[self.query.operator]
+        return self.selection or selection, self.consumption or consumption
+
     def __eq__(self, other) -> bool:
         if not isinstance(other, Statement):
             return False
@@ -108,41 +259,151 @@ class Statement:
             f"Statement(nodes={self.nodes}, query={self.query}, inputs={self.inputs})"
         )
 
+    def __str__(self) -> str:
+        # the textual form StatementParser reads
+        inputs = ", ".join([input_.topic for input_ in self.inputs])
+        nodes = ", ".join([str(node.value) for node in self.nodes])
+        clauses = ""
+        if self.partitioned:
+            clauses += " PARTITIONED"
+        if self.within_ms is not None:
+            clauses += f" WITHIN {format_duration(self.within_ms)}"
+        policy = [value.value for value in (self.selection, self.consumption) if value]
+        if policy:
+            clauses += f" POLICY {' '.join(policy)}"
+        return f"SELECT {self.query.topic} FROM {inputs} ON {{{nodes}}}{clauses}"
+
 
 class Query:
-    def __init__(
-        self, operator: Operator, operands: "List[Union[AtomicEventType, Query]]"
-    ) -> None:
-        self.operator = operator
-        self.operands = operands
+    """
+    Immutable query node. Nodes are interned: constructing a query equal to an
+    existing one returns that object, so identical subqueries across all
+    statements are shared and compare by identity. The topic is built once.
+
+    The topic is the one of the canonical form: AND is commutative and
+    associative, so nested ANDs are flattened and AND operands sorted by their
+    topic, while SEQ keeps its order. AND(SEQ(J, A), E) and AND(E, SEQ(J, A))
+    are different nodes but share the topic "AND(E, SEQ(J, A))".
+    """
+
+    __slots__ = (
+        "operator",
+        "operands",
+        "canonical",
+        "_topic",
+        "_hash_topic",
+        "_hash",
+        "__weakref__",
+    )
+
+    _interned: "weakref.WeakValueDictionary" = weakref.WeakValueDictionary()
+
+    def __new__(
+        cls, operator: Operator, operands: "Iterable[Union[AtomicEventType, Query]]"
+    ) -> "Query":
+        operands = tuple(operands)
+        key = (operator, operands)
+
+        query = cls._interned.get(key)
+        if query is not None:
+            return query
+
+        canonical_operands = []
+        for operand in operands:
+            operand = operand.canonical
+            if (
+                operator == Operator.AND
+                and isinstance(operand, Query)
+                and operand.operator == Operator.AND
+            ):
+                canonical_operands.extend(operand.operands)
+            else:
+                canonical_operands.append(operand)
+        if operator == Operator.AND:
+            canonical_operands.sort(key=lambda operand: operand.topic)
+        canonical_operands = tuple(canonical_operands)
+
+        query = super().__new__(cls)
+        object.__setattr__(query, "operator", operator)
+        object.__setattr__(query, "operands", operands)
+        if canonical_operands == operands:
+            object.__setattr__(query, "canonical", query)
+            object.__setattr__(
+                query,
+                "_topic",
+                f"{operator.value}({', '.join([operand.topic for operand in operands])})",
+            )
+        else:
+            canonical = Query(operator, canonical_operands)
+            object.__setattr__(query, "canonical", canonical)
+            object.__setattr__(query, "_topic", canonical.topic)
+        object.__setattr__(query, "_hash_topic", None)
+        object.__setattr__(query, "_hash", hash(key))
+        return cls._interned.setdefault(key, query)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Query is immutable, can't set '{name}'")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Query is immutable, can't delete '{name}'")
+
+    def __reduce__(self):
+        return (Query, (self.operator, self.operands))
 
     @property
     def topic(self) -> str:
-        return str(self)
+        return self._topic
 
     @property
     def hash_topic(self) -> str:
-        hash_md5 = hashlib.md5(str(self).encode("UTF-8"))
-        return hash_md5.hexdigest().strip()
+        if self._hash_topic is None:
+            hash_md5 = hashlib.md5(self._topic.encode("UTF-8"))
+            object.__setattr__(self, "_hash_topic", hash_md5.hexdigest().strip())
+        return self._hash_topic
 
     def to_siddhi_query(
         self,
         input_stream="cseEventStream",
         output_stream="outputStream",
         attribute="symbol",
+        shard=None,
+        within_ms=None,
+        policy=None,
     ):
+        if policy is not None and tuple(policy) not in SIDDHI_POLICIES[self.operator]:
+            selection, consumption = policy
+            raise ValueError(
+                f"POLICY {selection.value} {consumption.value} of {self.operator.value} "
+                f"is not supported by the Siddhi backend, use ENGINE=python"
+            )
+
         if self.operator.value == "SEQ":
-            from_every_string = "from every "
+            # FIRST restarts the pattern only once the previous match completed
+            restart = policy is not None and policy[0] == Selection.FIRST
+            from_every_string = "from every (" if restart else "from every "
             for i, operand in enumerate(self.operands):
                 from_every_string += "e{}".format(i + 1)
-                from_every_string += f"={input_stream}[{attribute} == '{operand}']"
+                condition = f"{attribute} == '{operand}'"
+                if shard is not None and i == 0:
+                    # only this replica's share of the partial matches, see Statement.shard
+                    index, count = shard
+                    condition += f" and eventId % {count} == {index}"
+                from_every_string += f"={input_stream}[{condition}]"
                 if not (i == len(self.operands) - 1):
                     from_every_string += "-> "
-
+            if restart:
+                from_every_string += ")"
+            from_every_string += siddhi_within(within_ms)
+
+            select = self.siddhi_select(
+                f"e{len(self.operands)}.eventTime",
+                [f"e{i + 1}.eventId" for i in range(len(self.operands))],
+                attribute=attribute,
+            )
             rueckgabe = f"""
                 @info(name = '{self.topic}')
                 {from_every_string}
-                select '{self.topic}' as symbol 
+                {select}
                 insert into {output_stream};
                 """
             print(rueckgabe)
@@ -169,27 +430,131 @@ class Query:
             #     return rueckgabe
 
         elif self.operator.value == "AND":
-            print(self.operands)
-            rueckgabe = f"""
+            rueckgabe = self.to_siddhi_and_query(
+                input_stream=input_stream,
+                output_stream=output_stream,
+                attribute=attribute,
+                within_ms=within_ms,
+            )
+            print("--------Rückgabe", rueckgabe)
+            return rueckgabe
+
+    def to_siddhi_and_query(
+        self,
+        input_stream="cseEventStream",
+        output_stream="outputStream",
+        attribute="symbol",
+        within_ms=None,
+    ):
+        """
+        Compile AND(X1, ..., Xn) into a tree of n - 1 logical
+        `every (e1=... and e2=...)` patterns, pairing neighbouring operands
+        level by level, so the app grows linearly with the number of operands
+        instead of one pattern per permutation.
+
+        Intermediate results are inserted into internal streams, only the root
+        query is named after the topic and inserts into the output stream.
+
+        Each pattern keeps the first event of either side and consumes both
+        with its match, like the python AndMatcher does for the whole AND. The
+        two agree for two operands, and for more as long as no operand occurs
+        again before the round is complete. Otherwise the levels run ahead:
+        for AND(A, B, C) fed A1 B1 B2 C1 A2 C2, B2 starts the next AND(A, B)
+        once A1 B1 matched and the tree also emits (A2, B2, C2), while the
+        AndMatcher ignores B2 and still waits for a B.
+
+        A window is checked once, over the event times of the whole match like
+        the python engine does, by a filter on the root's output: Siddhi's
+        `within` measures arrival times and on every level of the tree would
+        let a match span up to depth * within_ms. Unlike the python engine,
+        which forgets expired events, a pattern still holds an expired event
+        until it completes, and the too wide match is then dropped.
+        """
+        windowed = within_ms is not None
+        # (source, ids, min_time) where ids are the event id attributes the
+        # source carries and min_time the attribute of its earliest event time
+        sources = [
+            (f"{input_stream}[{attribute} == '{operand}']", ["eventId"], "eventTime")
+            for operand in self.operands
+        ]
+
+        if len(sources) == 1:
+            source, ids, _ = sources[0]
+            select = self.siddhi_select(
+                "e1.eventTime", [f"e1.{id_}" for id_ in ids], attribute=attribute
+            )
+            return f"""
                 @info(name = '{self.topic}')
+                from every e1={source}
+                {select}
+                insert into {output_stream};
                 """
 
-            event_permutations = list(permutations(self.operands, len(self.operands)))
+        queries = []
+        while len(sources) > 1:
+            next_sources = []
+            for (left, left_ids, left_min), (right, right_ids, right_min) in zip(
+                sources[::2], sources[1::2]
+            ):
+                is_root = len(sources) == 2
+                target = (
+                    output_stream
+                    if is_root and not windowed
+                    else f"{self.operator.value}{self.hash_topic}_{len(queries) + 1}"
+                )
+                ids = [f"e1.{id_}" for id_ in left_ids] + [
+                    f"e2.{id_}" for id_ in right_ids
+                ]
+                select = self.siddhi_select(
+                    "maximum(e1.eventTime, e2.eventTime)", ids, attribute=attribute
+                )
+                if windowed:
+                    select += (
+                        f", minimum(e1.{left_min}, e2.{right_min}) as minEventTime"
+                    )
+
+                query = f"""
+                from every (e1={left} and e2={right})
+                {select}
+                insert into {target};
+                """
+                if is_root and not windowed:
+                    query = f"""
+                @info(name = '{self.topic}')""" + query
 
-            for i, permutation in enumerate(event_permutations):
-                rueckgabe += "from every "
-                for j, operand in enumerate(permutation):
-                    rueckgabe += f"e{j+1}={input_stream}[{attribute} == '{operand}']"
-                    if not (j == len(self.operands) - 1):
-                        rueckgabe += "-> "
-                rueckgabe += f"""
-                select '{self.topic}' as symbol 
-                insert into {output_stream};
+                queries.append(query)
+                next_sources.append(
+                    (target, [f"id{i + 1}" for i in range(len(ids))], "minEventTime")
+                )
 
+            if len(sources) % 2:
+                next_sources.append(sources[-1])
+            sources = next_sources
+
+        if windowed:
+            root, ids, _ = sources[0]
+            columns = ", ".join([attribute, "eventTime"] + ids)
+            queries.append(
+                f"""
+                @info(name = '{self.topic}')
+                from {root}[eventTime - minEventTime <= {within_ms}]
+                select {columns}
+                insert into {output_stream};
                 """
+            )
 
-            print("--------Rückgabe", rueckgabe)
-            return rueckgabe
+        return "".join(queries)
+
+    def siddhi_select(self, event_time, event_ids, attribute="symbol"):
+        """
+        Select clause shared by all generated queries: the topic as symbol, the
+        event time of the match and the ids of the matched events as id1..idn,
+        which the node resolves to their constituent atomic events.
+        """
+        ids = ", ".join(
+            f"{event_id} as id{i + 1}" for i, event_id in enumerate(event_ids)
+        )
+        return f"select '{self.topic}' as {attribute}, {event_time} as eventTime, {ids}"
 
     def compute_query_from_statement(self, query, input_stream_def):
         siddhi_query = input_stream_def
@@ -219,121 +584,127 @@ class Query:
         text: "AND(A, B, C)"
         returns: Query(
                     operator=Operator.AND,
-                    operands=[AtomicEventType.A, AtomicEventType.B, AtomicEventType.C]
+                    operands=(AtomicEventType.A, AtomicEventType.B, AtomicEventType.C)
                 )
 
         text: "SEQ(A, AND(B, C))"
         returns: Query(
                     operator=Operator.SEQ,
-                    operands=[
+                    operands=(
                         AtomicEventType.A,
-                        Query(Operator.AND, [AtomicEventType.B, AtomicEventType.C])
-                    ]
+                        Query(Operator.AND, (AtomicEventType.B, AtomicEventType.C))
+                    )
                 )
         """
-
-        # A query always starts with an operator
-        # and the first operand is always an AtomicEventType
-
-        match = Query.match_operator(text)
-
-        if not match:
-            raise ValueError(
-                f"Invalid Query: '{text}'. Must start with a valid operator"
-            )
-
-        operator = Operator.from_string(match.group(1))
-        operands = Query.parse_operands(match.group(2))
-
-        return cls(operator, operands)
-
-    @staticmethod
-    def match_operator(text):
-        valid_operators = "|".join([operator.value for operator in Operator])
-        return re.match(rf"({valid_operators})\((.*)\)", text)
+        parser = QueryParser(text)
+        query = parser.parse_query()
+        parser.expect_end()
+        return query
 
     @staticmethod
     def parse_operands(operands: str) -> "List[Union[AtomicEventType, Query]]":
-        return [
-            Query.parse_operand(operand) for operand in Query.split_operands(operands)
-        ]
-
-    @staticmethod
-    def split_operands(operands: str) -> "list[str]":
-        """
-        Split operands into a list of strings, one level deep.
-
-        We can't simply split on "," because of nested queries.
-        Instead, we parse the string character by character and
-        split on "," only if we are NOT inside a nested query.
-
-        Subqueries are identified by the number of currently open parenthesis.
-        """
-        STOP = "$"
-        operands = f"{operands}{STOP}"
-
-        atoms = AtomicEventType.values()
-        operators = Operator.values()
-
-        buffer = ""
-        open_parenthesis = 0
-
-        results = []
-
-        for index, char in enumerate(operands):
-            if char == STOP:
-                break
-
-            if char in (",", " ") and not buffer:
-                continue
-
-            # We encountered an AtomicEventType
-            if char in atoms and operands[index + 1] in (",", "$") and not buffer:
-                results.append(char)
-
-            # We encountered a Subquery
-            else:
-                buffer += char
-
-                if char == "(":
-                    open_parenthesis += 1
-                elif char == ")":
-                    open_parenthesis -= 1
-
-                if char == ")" and open_parenthesis == 0:
-                    results.append(buffer)
-                    buffer = ""
-
-        # quick sanity check
-        for item in results:
-            assert any(
-                [item.startswith(operator) for operator in operators]
-                + [len(item) == 1 and item.startswith(atom) for atom in atoms]
-            ), f"Query splitting failed, encountered an unknown item: {results}"
-
+        parser = QueryParser(operands)
+        results = parser.parse_operand_list()
+        parser.expect_end()
         return results
 
-    @staticmethod
-    def parse_operand(operand: str) -> "Union[AtomicEventType, Query]":
-        try:
-            # Operand is a Query
-            Operator.from_string(operand)
-            return Query.from_string(operand)
-        except ValueError:
-            # Operand is an AtomicEventType
-            return AtomicEventType.from_string(operand)
-
     def __eq__(self, other) -> bool:
+        # interning makes equal queries the same object
+        if self is other:
+            return True
         if not isinstance(other, Query):
             return False
 
         return self.operator == other.operator and self.operands == other.operands
 
+    def __hash__(self) -> int:
+        return self._hash
+
     def __repr__(self) -> str:
         return f"Query(operator={self.operator}, operands={self.operands})"
 
     def __str__(self) -> str:
-        return f"{self.operator.value}({', '.join([str(operand) for operand in self.operands])})"
+        return self._topic
+
+
+class QueryParser:
+    """
+    Single pass recursive descent parser over the tokens of a query:
+
+        operand      = ATOM | OPERATOR "(" operand_list ")"
+        operand_list = operand ("," operand)*
+    """
+
+    TOKEN = re.compile(r"\s*(?:([A-Za-z_]\w*)|([(),])|(\S))")
+    OPERATORS = {operator.value: operator for operator in Operator}
+    ATOMS = {atom.value: atom for atom in AtomicEventType}
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens = self.tokenize(text)
+        self.position = 0
+
+    def tokenize(self, text: str) -> "List[str]":
+        tokens = []
+        for name, punctuation, invalid in self.TOKEN.findall(text):
+            if invalid:
+                raise ValueError(f"Invalid Query: '{text}'. Unexpected '{invalid}'")
+            tokens.append(name or punctuation)
+        return tokens
+
+    def peek(self) -> "Optional[str]":
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise ValueError(f"Invalid Query: '{self.text}'. Unexpected end")
+        self.position += 1
+        return token
+
+    def expect(self, expected: str):
+        token = self.next()
+        if token != expected:
+            raise ValueError(
+                f"Invalid Query: '{self.text}'. Expected '{expected}', got '{token}'"
+            )
+
+    def expect_end(self):
+        if self.position != len(self.tokens):
+            raise ValueError(
+                f"Invalid Query: '{self.text}'. Unexpected '{self.tokens[self.position]}'"
+            )
+
+    def parse_query(self) -> Query:
+        name = self.next()
+        if name not in self.OPERATORS:
+            raise ValueError(
+                f"Invalid Query: '{self.text}'. Must start with a valid operator"
+            )
+        self.expect("(")
+        operands = self.parse_operand_list()
+        self.expect(")")
+        return Query(self.OPERATORS[name], operands)
+
+    def parse_operand(self) -> "Union[AtomicEventType, Query]":
+        name = self.peek()
+        if name in self.OPERATORS:
+            return self.parse_query()
+
+        self.next()
+        try:
+            return self.ATOMS[name]
+        except KeyError:
+            raise ValueError(f"Unknown AtomicEventType: {name}") from None
+
+    def parse_operand_list(self) -> "List[Union[AtomicEventType, Query]]":
+        operands = [self.parse_operand()]
+        while self.peek() == ",":
+            self.next()
+            operands.append(self.parse_operand())
+        return operands
 
 
 class StatementParser:
@@ -351,6 +722,21 @@ class StatementParser:
         5. SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}
         6. SELECT AND(E, SEQ(C, J, A)) FROM AND(E, SEQ(J, A)), C ON {5, 9}
 
+        A trailing PARTITIONED makes the nodes of a SEQ statement split its
+        work, see Statement.shard and Statement.partitionable:
+
+        7. SELECT SEQ(J, A) FROM J, A ON {4, 6} PARTITIONED
+
+        WITHIN bounds the event time span of a match, partial matches that
+        can't complete within it are dropped:
+
+        8. SELECT SEQ(J, A) FROM J, A ON {4} WITHIN 30s
+
+        POLICY sets the event selection (EACH, FIRST, LAST) and consumption
+        (REUSE, CONSUME) of the pattern, see Selection and Consumption:
+
+        9. SELECT SEQ(J, A) FROM J, A ON {4} POLICY LAST CONSUME
+
         Example 1
 
         query: SELECT SEQ(J, A) FROM J, A ON {4}
@@ -385,7 +771,7 @@ class StatementParser:
                 )
 
         """
-        regex = r"SELECT (.*) FROM (.*) ON {(.*)}"
+        regex = r"SELECT (.*) FROM (.*) ON {(.*)}(.*)$"
         match = re.match(regex, self.statement)
 
         if not match:
@@ -395,7 +781,54 @@ class StatementParser:
         inputs = Query.parse_operands(match.group(2))
         nodes = [NodeEnum(int(node)) for node in match.group(3).split(",")]
 
-        return Statement(query=query, inputs=inputs, nodes=nodes)
+        statement = Statement(
+            query=query, inputs=inputs, nodes=nodes, **self.parse_clauses(match.group(4))
+        )
+        if statement.partitioned and not statement.partitionable:
+            raise ValueError(
+                f"Invalid statement: '{self.statement}'. Only SEQ with the default "
+                "POLICY can be PARTITIONED"
+            )
+        return statement
+
+    CLAUSE = re.compile(
+        r"\s*(?:(PARTITIONED)|WITHIN\s+(\d+(?:\.\d+)?\s*[a-z]+)"
+        r"|POLICY((?:\s+(?:EACH|FIRST|LAST|REUSE|CONSUME)){1,2})(?![A-Z]))"
+    )
+
+    def parse_policy(self, words: List[str]) -> "Dict[str, Any]":
+        policy: "Dict[str, Any]" = {}
+        for word in words:
+            key, value = (
+                ("selection", Selection(word))
+                if word in Selection.values()
+                else ("consumption", Consumption(word))
+            )
+            if key in policy:
+                raise ValueError(
+                    f"Invalid statement: '{self.statement}'. More than one {key} policy"
+                )
+            policy[key] = value
+        return policy
+
+    def parse_clauses(self, text: str) -> "Dict[str, Any]":
+        clauses: "Dict[str, Any]" = {}
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = self.CLAUSE.match(text, position)
+            if not match:
+                raise ValueError(
+                    f"Invalid statement: '{self.statement}'. Unknown clause '{text[position:].strip()}'"
+                )
+            if match.group(1):
+                clauses["partitioned"] = True
+            elif match.group(2):
+                clauses["within_ms"] = parse_duration(match.group(2))
+            else:
+                clauses.update(self.parse_policy(match.group(3).split()))
+            position = match.end()
+        return clauses
 
 
 if __name__ == "__main__":
@@ -2,10 +2,15 @@
 This class generates files which describe in which intervals events should be pushed to the queue
 """
 import csv
+import heapq
+import os
 import random
+from itertools import takewhile
 from pathlib import Path
 
 from atomicEventProducer import AtomicEventProducer
+from binary_trace import BINARY_TRACE_SUFFIX, write_binary_trace
+from trace_source import EVENT_TYPE_CODES
 
 file_root = Path(__file__).parent
 
@@ -14,37 +19,73 @@ class EventIntervaldGenerator:
     def __init__(self) -> None:
         pass
 
-    def generate_random_event_intervals(
-        self, totalTimeInMs, minTimeStepInMs, maxTimeStepInMs, filename
+    def iter_random_event_intervals(
+        self, totalTimeInMs, minTimeStepInMs, maxTimeStepInMs, seed=None
     ):
-        print("generating intervals for file: " + filename)
+        # the same seed always yields the same timestamps, so a trace can be
+        # streamed twice (per-type file and merge) without keeping it in memory
+        rng = random.Random(seed)
+        timeEventsAreCalculatedFor = 0
+        while timeEventsAreCalculatedFor < totalTimeInMs:
+            timeEventsAreCalculatedFor += rng.randint(minTimeStepInMs, maxTimeStepInMs)
+            yield timeEventsAreCalculatedFor
 
-        eventIntervals = []
+    def iter_fixed_event_intervals(self, totalTimeInMs, interval):
         timeEventsAreCalculatedFor = 0
         while timeEventsAreCalculatedFor < totalTimeInMs:
-            nextTimeInterval = random.randint(minTimeStepInMs, maxTimeStepInMs)
-            eventIntervals.append(timeEventsAreCalculatedFor + nextTimeInterval)
-            timeEventsAreCalculatedFor += nextTimeInterval
+            timeEventsAreCalculatedFor += interval
+            yield timeEventsAreCalculatedFor
+
+    def generate_random_event_intervals(
+        self, totalTimeInMs, minTimeStepInMs, maxTimeStepInMs, filename, seed=None
+    ):
+        print("generating intervals for file: " + filename)
 
-        self.writeSingleEventIntervalsToFile(eventIntervals, filename)
-        return eventIntervals
+        return self.writeSingleEventIntervalsToFile(
+            self.iter_random_event_intervals(
+                totalTimeInMs, minTimeStepInMs, maxTimeStepInMs, seed=seed
+            ),
+            filename,
+        )
 
     def generate_fixed_event_intervals(self, totalTimeInMs, interval, filename):
         print("generating intervals for file: " + filename)
 
-        eventIntervals = []
-        timeEventsAreCalculatedFor = 0
-        while timeEventsAreCalculatedFor < totalTimeInMs:
-            eventIntervals.append(timeEventsAreCalculatedFor + interval)
-            timeEventsAreCalculatedFor += interval
-
-        self.writeSingleEventIntervalsToFile(eventIntervals, filename)
-        return eventIntervals
+        return self.writeSingleEventIntervalsToFile(
+            self.iter_fixed_event_intervals(totalTimeInMs, interval), filename
+        )
+
+    def merge_event_intervals(self, eventIntervalsByType, totalTimeInMs):
+        """
+        k-way merge of the per-type timestamp streams into [timestamp, type] rows,
+        ordered by timestamp and, for equal timestamps, by the order of the types.
+        Only events before totalTimeInMs are kept.
+        """
+        streams = [
+            self.tag_event_intervals(eventIntervals, order, eventType)
+            for order, (eventType, eventIntervals) in enumerate(
+                eventIntervalsByType.items()
+            )
+        ]
+        merged = takewhile(
+            lambda event: event[0] < totalTimeInMs, heapq.merge(*streams)
+        )
+        return ([timestamp, eventType] for timestamp, _, eventType in merged)
+
+    @staticmethod
+    def tag_event_intervals(eventIntervals, order, eventType):
+        for timestamp in eventIntervals:
+            yield timestamp, order, eventType
 
     def writeSingleEventIntervalsToFile(self, eventIntervals, filename):
-        with open(filename, "w") as f:
-            writer = csv.writer(f)
-            writer.writerow(eventIntervals)
+        # one row with all timestamps, written incrementally
+        count = 0
+        with open(filename, "w", newline="") as f:
+            for eventInterval in eventIntervals:
+                f.write(f",{eventInterval}" if count else str(eventInterval))
+                count += 1
+            f.write("\r\n")
+        return count
 
     def writeCombinedEventIntervalsToFile(self, combinedEventTimestamps, filename):
         with open(
@@ -53,63 +94,68 @@ class EventIntervaldGenerator:
             writer = csv.writer(f)
             writer.writerows(combinedEventTimestamps)
 
+    def writeCombinedEventIntervalsToBinaryFile(self, combinedEventTimestamps, filename):
+        return write_binary_trace(
+            filename,
+            (
+                (timestamp, EVENT_TYPE_CODES[eventType])
+                for timestamp, eventType in combinedEventTimestamps
+            ),
+        )
+
 
 if __name__ == "__main__":
     # Generate atomic events
-    totalTimeInMs = (
-        600000  # set this variable to decide how long events should be generated for
-    )
+    totalTimeInMs = int(
+        os.environ.get("TOTAL_TIME_MS", 600000)
+    )  # set this variable to decide how long events should be generated for
+    seed = int(os.environ.get("SEED", random.randrange(2**32)))
+    traceFormat = os.environ.get("TRACE_FORMAT", "csv")  # csv or binary
+    print(f"generating {totalTimeInMs}ms of events with seed {seed}")
+
     eventIntervalGenerator = EventIntervaldGenerator()
-    a_event_intervals = eventIntervalGenerator.generate_random_event_intervals(
-        totalTimeInMs, 500, 30000, AtomicEventProducer.fileNameAEvents
-    )
-    b_event_intervals = eventIntervalGenerator.generate_random_event_intervals(
-        totalTimeInMs, 1000, 30000, AtomicEventProducer.fileNameBEvents
-    )
-    c_event_intervals = eventIntervalGenerator.generate_fixed_event_intervals(
-        totalTimeInMs, 30000, AtomicEventProducer.fileNameCEvents
-    )
-    d_event_intervals = eventIntervalGenerator.generate_random_event_intervals(
-        totalTimeInMs, 30000, 600000, AtomicEventProducer.fileNameDEvents
-    )
-    e_event_intervals = eventIntervalGenerator.generate_random_event_intervals(
-        totalTimeInMs, 500, 30000, AtomicEventProducer.fileNameEEvents
-    )
-    f_event_intervals = eventIntervalGenerator.generate_fixed_event_intervals(
-        totalTimeInMs, 5000, AtomicEventProducer.fileNameFEvents
-    )
-    j_event_intervals = eventIntervalGenerator.generate_random_event_intervals(
-        totalTimeInMs, 500, 30000, AtomicEventProducer.fileNameJEvents
-    )
 
-    ms_iterator = 0
-    combinedEventsArray = []
-    while ms_iterator < totalTimeInMs:
-        if ms_iterator % 100000 == 0:
-            print("{}ms of {}ms merged".format(ms_iterator, totalTimeInMs))
-        if a_event_intervals.__contains__(ms_iterator):
-            eventTimeStamp = [ms_iterator, "A"]
-            combinedEventsArray.append(eventTimeStamp)
-        if b_event_intervals.__contains__(ms_iterator):
-            eventTimeStamp = [ms_iterator, "B"]
-            combinedEventsArray.append(eventTimeStamp)
-        if c_event_intervals.__contains__(ms_iterator):
-            eventTimeStamp = [ms_iterator, "C"]
-            combinedEventsArray.append(eventTimeStamp)
-        if d_event_intervals.__contains__(ms_iterator):
-            eventTimeStamp = [ms_iterator, "D"]
-            combinedEventsArray.append(eventTimeStamp)
-        if e_event_intervals.__contains__(ms_iterator):
-            eventTimeStamp = [ms_iterator, "E"]
-            combinedEventsArray.append(eventTimeStamp)
-        if f_event_intervals.__contains__(ms_iterator):
-            eventTimeStamp = [ms_iterator, "F"]
-            combinedEventsArray.append(eventTimeStamp)
-        if j_event_intervals.__contains__(ms_iterator):
-            eventTimeStamp = [ms_iterator, "J"]
-            combinedEventsArray.append(eventTimeStamp)
-
-        ms_iterator += 1
-    eventIntervalGenerator.writeCombinedEventIntervalsToFile(
-        combinedEventsArray, str(file_root / "data/combinedEventTimestamps.csv")
+    # type -> (min, max) step for random intervals or a fixed interval, and its file
+    eventTypes = {
+        "A": ((500, 30000), AtomicEventProducer.fileNameAEvents),
+        "B": ((1000, 30000), AtomicEventProducer.fileNameBEvents),
+        "C": (30000, AtomicEventProducer.fileNameCEvents),
+        "D": ((30000, 600000), AtomicEventProducer.fileNameDEvents),
+        "E": ((500, 30000), AtomicEventProducer.fileNameEEvents),
+        "F": (5000, AtomicEventProducer.fileNameFEvents),
+        "J": ((500, 30000), AtomicEventProducer.fileNameJEvents),
+    }
+
+    eventIntervalsByType = {}
+    for eventType, (steps, filename) in eventTypes.items():
+        if isinstance(steps, tuple):
+            typeSeed = f"{seed}-{eventType}"
+            eventIntervalGenerator.generate_random_event_intervals(
+                totalTimeInMs, *steps, filename, seed=typeSeed
+            )
+            eventIntervalsByType[eventType] = (
+                eventIntervalGenerator.iter_random_event_intervals(
+                    totalTimeInMs, *steps, seed=typeSeed
+                )
+            )
+        else:
+            eventIntervalGenerator.generate_fixed_event_intervals(
+                totalTimeInMs, steps, filename
+            )
+            eventIntervalsByType[eventType] = (
+                eventIntervalGenerator.iter_fixed_event_intervals(totalTimeInMs, steps)
+            )
+
+    combinedEventTimestamps = eventIntervalGenerator.merge_event_intervals(
+        eventIntervalsByType, totalTimeInMs
     )
+    if traceFormat == "binary":
+        eventIntervalGenerator.writeCombinedEventIntervalsToBinaryFile(
+            combinedEventTimestamps,
+            str(file_root / f"data/combinedEventTimestamps{BINARY_TRACE_SUFFIX}"),
+        )
+    else:
+        eventIntervalGenerator.writeCombinedEventIntervalsToFile(
+            combinedEventTimestamps,
+            str(file_root / "data/combinedEventTimestamps.csv"),
+        )
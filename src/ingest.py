@@ -0,0 +1,120 @@
+import os
+import queue
+import threading
+from typing import Any, Callable, List
+
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 10000))
+INGEST_POLICY = os.environ.get("INGEST_POLICY", "block")
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 64))
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", 1))
+
+POLICIES = ("block", "drop")
+
+
+class IngestQueue:
+    """
+    Bounded queue between the STOMP receiver thread and a matching engine.
+
+    put() is all the receiver thread does; worker threads drain the queue in
+    batches of up to batch_size items and hand them to handler(batch). When
+    the queue is full, the "block" policy stalls the receiver (and thereby the
+    broker) while "drop" discards the new item and counts it.
+
+    Pattern matching depends on the order of events, so more than one worker
+    is only safe for engines that do not care about arrival order.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], None],
+        name: str = "ingest",
+        queue_size: int = INGEST_QUEUE_SIZE,
+        policy: str = INGEST_POLICY,
+        batch_size: int = INGEST_BATCH_SIZE,
+        workers: int = INGEST_WORKERS,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown ingest policy: {policy}, expected one of {POLICIES}")
+
+        self.handler = handler
+        self.name = name
+        self.policy = policy
+        self.batch_size = batch_size
+        self.n_workers = workers
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.high_watermark = max(int(queue_size * 0.8), 1)
+        self.falling_behind = False
+        self.dropped = 0
+        self.workers: List[threading.Thread] = []
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    def start(self):
+        if self.workers:
+            return
+
+        for index in range(self.n_workers):
+            worker = threading.Thread(
+                target=self.drain, name=f"{self.name}-{index}", daemon=True
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        # one sentinel per worker, queued behind the pending items
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def put(self, item) -> bool:
+        if self.policy == "block":
+            self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+        self.check_depth()
+        return True
+
+    def check_depth(self):
+        depth = self.depth
+        if depth >= self.high_watermark and not self.falling_behind:
+            self.falling_behind = True
+            print(
+                f"IngestQueue {self.name} - falling behind, queue depth {depth}/{self.queue.maxsize} (dropped {self.dropped})"
+            )
+        elif depth < self.high_watermark // 2:
+            self.falling_behind = False
+
+    def drain(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            stopping = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                self.handler(batch)
+            except Exception as error:
+                print(f"IngestQueue {self.name} - failed to process batch: {error}")
+
+            if stopping:
+                return
@@ -0,0 +1,312 @@
+"""
+Pure-Python matching engine, an in-process alternative to the Siddhi backend.
+
+The engine evaluates the Query AST from evaluation_plan directly. Every statement
+gets an incremental automaton whose partial matches are keyed by the operand they
+are waiting for, so an incoming event only touches the matchers (and the partial
+matches) that can actually use it.
+
+Operands are matched by their topic, exactly like the generated Siddhi queries:
+the input of a statement is a stream of symbols (atomic event types or the topics
+of subqueries computed on other nodes).
+"""
+import threading
+from abc import ABC, abstractmethod
+from itertools import product
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from evaluation_plan import (
+    DEFAULT_POLICIES,
+    Consumption,
+    Operator,
+    Query,
+    Selection,
+    Statement,
+)
+
+Match = Tuple[Any, ...]
+Shard = Tuple[int, int]
+Policy = Tuple[Selection, Consumption]
+
+
+class QueryMatcher(ABC):
+    def __init__(
+        self,
+        query: Query,
+        shard: Optional[Shard] = None,
+        within_ms: Optional[int] = None,
+        policy: Optional[Policy] = None,
+    ) -> None:
+        self.query = query
+        # (index, count) of a PARTITIONED statement, see Statement.shard
+        self.shard = shard
+        # partial matches whose first event is older than within_ms (in event
+        # time of the incoming event) can't complete anymore and are dropped
+        self.within_ms = within_ms
+        # event selection and consumption, see evaluation_plan.Selection
+        self.selection, self.consumption = policy or DEFAULT_POLICIES[query.operator]
+        self.topic = query.topic
+        self.operands: List[str] = [operand.topic for operand in query.operands]
+
+        # operand symbol -> positions of that symbol in the query, descending
+        self.positions: Dict[str, List[int]] = {}
+        for position, operand in enumerate(self.operands):
+            self.positions.setdefault(operand, []).insert(0, position)
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self.positions)
+
+    @property
+    @abstractmethod
+    def partial_matches(self) -> int:
+        """
+        Partial matches the matcher is holding.
+        """
+
+    @abstractmethod
+    def process(self, symbol: str, event: Any) -> List[Match]:
+        """
+        Feed one event of an operand symbol, returns the completed matches.
+        """
+
+
+class SeqMatcher(QueryMatcher):
+    """
+    SEQ(X1, ..., Xn) with the semantics of the Siddhi pattern
+    `from every e1=X1 -> e2=X2 -> ... -> en=Xn`:
+
+    every X1 opens a new partial match and each partial match advances
+    on the next event of the operand it is waiting for. With a shard, only
+    X1 events whose eventId % count == index open a partial match.
+
+    Partial matches are kept in the order they were started, so expiring
+    them with a window only trims the front of each waiting list.
+
+    The other policies: FIRST opens a partial match only while none is in
+    progress, LAST keeps only the newest partial match waiting for each
+    operand, and CONSUME completes only the oldest partial match on an Xn
+    and drops every partial match holding an event of the match (events are
+    compared by identity).
+    """
+
+    def __init__(
+        self,
+        query: Query,
+        shard: Optional[Shard] = None,
+        within_ms: Optional[int] = None,
+        policy: Optional[Policy] = None,
+    ) -> None:
+        super().__init__(query, shard, within_ms, policy)
+        # waiting[i] holds the partial matches waiting for operand i
+        self.waiting: List[List[Match]] = [[] for _ in self.operands]
+
+    @property
+    def partial_matches(self) -> int:
+        return sum(len(waiting) for waiting in self.waiting)
+
+    def process(self, symbol: str, event: Any) -> List[Match]:
+        matches = []
+        last = len(self.operands) - 1
+
+        if self.within_ms is not None:
+            self.expire(event.event_time - self.within_ms)
+
+        # descending positions, so one event never advances a partial match twice
+        for position in self.positions.get(symbol, ()):
+            if position == 0:
+                if self.shard is not None and not self.owns(event):
+                    continue
+                if self.selection == Selection.FIRST and self.partial_matches:
+                    continue
+                advanced = [(event,)]
+            elif position == last and self.consumption == Consumption.CONSUME:
+                advanced = [
+                    partial + (event,) for partial in self.waiting[position][:1]
+                ]
+                del self.waiting[position][:1]
+            else:
+                advanced = [partial + (event,) for partial in self.waiting[position]]
+                self.waiting[position] = []
+
+            if position == last:
+                matches.extend(advanced)
+            elif self.selection == Selection.LAST:
+                self.waiting[position + 1] = (
+                    advanced[-1:] or self.waiting[position + 1]
+                )
+            else:
+                self.waiting[position + 1].extend(advanced)
+
+        if matches and self.consumption == Consumption.CONSUME:
+            self.consume(matches)
+
+        return matches
+
+    def consume(self, matches: List[Match]):
+        consumed = {id(event) for match in matches for event in match}
+        self.waiting = [
+            [
+                partial
+                for partial in waiting
+                if not any(id(event) in consumed for event in partial)
+            ]
+            for waiting in self.waiting
+        ]
+
+    def expire(self, cutoff: int):
+        for waiting in self.waiting:
+            expired = 0
+            while expired < len(waiting) and waiting[expired][0].event_time < cutoff:
+                expired += 1
+            del waiting[:expired]
+
+    def owns(self, event: Any) -> bool:
+        index, count = self.shard
+        return event.event_id % count == index
+
+
+class AndMatcher(QueryMatcher):
+    """
+    AND(X1, ..., Xn): remembers the first event seen for every operand and
+    emits one match as soon as all operands have been seen, then starts over
+    (like the logical `every (e1 and e2)` patterns generated for Siddhi, see
+    Query.to_siddhi_and_query for where their tree for more operands differs).
+    With a window, remembered events older than within_ms are forgotten.
+
+    That is the FIRST CONSUME policy. LAST remembers the newest event of
+    every operand instead, EACH all of them, and an event completing a match
+    is combined with every remembered combination. REUSE keeps the events of
+    a match, so they are combined again with later events. EACH CONSUME
+    combines the event with the oldest remembered event of every other
+    operand, so each event is part of at most one match.
+    """
+
+    def __init__(
+        self,
+        query: Query,
+        shard: Optional[Shard] = None,
+        within_ms: Optional[int] = None,
+        policy: Optional[Policy] = None,
+    ) -> None:
+        super().__init__(query, shard, within_ms, policy)
+        # operand position -> events remembered for that operand
+        self.seen: List[List[Any]] = [[] for _ in self.operands]
+
+    @property
+    def partial_matches(self) -> int:
+        return max(len(seen) for seen in self.seen)
+
+    def process(self, symbol: str, event: Any) -> List[Match]:
+        if self.within_ms is not None:
+            cutoff = event.event_time - self.within_ms
+            self.seen = [
+                [seen for seen in events if seen.event_time >= cutoff]
+                for events in self.seen
+            ]
+
+        positions = self.positions.get(symbol, ())
+        if not positions:
+            return []
+        # an operand nothing was seen for yet, if the symbol repeats in the query
+        position = next(
+            (position for position in positions if not self.seen[position]),
+            positions[0],
+        )
+
+        others = [other for other in range(len(self.operands)) if other != position]
+        matches: List[Match] = []
+        if all(self.seen[other] for other in others):
+            consume = self.consumption == Consumption.CONSUME
+            if self.selection == Selection.EACH and not consume:
+                combinations = product(*(self.seen[other] for other in others))
+            elif self.selection == Selection.LAST:
+                combinations = [tuple(self.seen[other][-1] for other in others)]
+            else:
+                # EACH CONSUME pairs the events in order, each used once
+                combinations = [tuple(self.seen[other][0] for other in others)]
+
+            for combination in combinations:
+                match = list(combination)
+                match.insert(position, event)
+                matches.append(tuple(match))
+
+            if consume:
+                for other in others:
+                    if self.selection == Selection.LAST:
+                        del self.seen[other][-1]
+                    else:
+                        del self.seen[other][0]
+                return matches
+
+        if self.selection == Selection.EACH:
+            self.seen[position].append(event)
+        elif self.selection == Selection.LAST:
+            self.seen[position] = [event]
+        elif not self.seen[position]:
+            self.seen[position] = [event]
+        return matches
+
+
+MATCHERS = {
+    Operator.SEQ: SeqMatcher,
+    Operator.AND: AndMatcher,
+}
+
+
+def make_matcher(
+    query: Query,
+    shard: Optional[Shard] = None,
+    within_ms: Optional[int] = None,
+    policy: Optional[Policy] = None,
+) -> QueryMatcher:
+    return MATCHERS[query.operator](query, shard, within_ms, policy)
+
+
+class MatchingEngine:
+    """
+    Runs the queries of a node's statements and reports every match as
+    callback(topic, events), where events are the operand events of the match.
+    """
+
+    def __init__(
+        self,
+        statements: List[Statement],
+        callback: Callable[[str, Match], None],
+        node_id: Optional[int] = None,
+    ) -> None:
+        self.callback = callback
+        self.matchers = [
+            make_matcher(
+                statement.evaluation_query,
+                statement.shard(node_id) if node_id is not None else None,
+                statement.within_ms,
+                statement.policy,
+            )
+            for statement in statements
+        ]
+        self.lock = threading.Lock()
+
+        self.matchers_by_symbol: Dict[str, List[QueryMatcher]] = {}
+        for matcher in self.matchers:
+            for symbol in matcher.symbols:
+                self.matchers_by_symbol.setdefault(symbol, []).append(matcher)
+
+    @property
+    def partial_matches(self) -> Dict[str, int]:
+        with self.lock:
+            return {matcher.topic: matcher.partial_matches for matcher in self.matchers}
+
+    def send(self, symbol: str, event: Any = None) -> None:
+        if event is None:
+            event = symbol
+
+        with self.lock:
+            results = [
+                (matcher.topic, match)
+                for matcher in self.matchers_by_symbol.get(symbol, ())
+                for match in matcher.process(symbol, event)
+            ]
+
+        for topic, match in results:
+            self.callback(topic, match)
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Tuple
+
+METRICS_INTERVAL = float(os.environ.get("METRICS_INTERVAL", 30))
+METRICS_FILE = os.environ.get("METRICS_FILE", None)
+
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram with microsecond resolution.
+
+    Values below 2**SUB_BUCKET_BITS microseconds get a bucket each, above that
+    every power of two is split into 2**(SUB_BUCKET_BITS - 1) linear buckets,
+    which bounds the relative error to about 1 / 2**(SUB_BUCKET_BITS - 1).
+    All counts live in one preallocated array, recording allocates nothing.
+    """
+
+    SUB_BUCKET_BITS = 6
+    MAX_SHIFT = 36  # covers latencies up to ~2**42 us, about 50 days
+
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+    N_BUCKETS = SUB_BUCKETS + MAX_SHIFT * HALF_SUB_BUCKETS
+
+    def __init__(self) -> None:
+        self.counts = array("Q", bytes(8 * self.N_BUCKETS))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, value: int) -> int:
+        if value < cls.SUB_BUCKETS:
+            return max(value, 0)
+
+        shift = min(value.bit_length() - cls.SUB_BUCKET_BITS, cls.MAX_SHIFT)
+        top = min(value >> shift, cls.SUB_BUCKETS - 1)
+        return cls.SUB_BUCKETS + (shift - 1) * cls.HALF_SUB_BUCKETS + top - cls.HALF_SUB_BUCKETS
+
+    @classmethod
+    def value_at(cls, index: int) -> int:
+        """Lowest value that falls into the bucket at index."""
+        if index < cls.SUB_BUCKETS:
+            return index
+
+        shift, offset = divmod(index - cls.SUB_BUCKETS, cls.HALF_SUB_BUCKETS)
+        return (cls.HALF_SUB_BUCKETS + offset) << (shift + 1)
+
+    def record(self, seconds: float) -> None:
+        # clock skew between producer and node can make a duration negative
+        value = max(int(seconds * 1_000_000), 0)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percentile: float) -> int:
+        """Latency in microseconds below which `percentile` percent of the values fall."""
+        if not self.count:
+            return 0
+
+        threshold = self.count * percentile / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= threshold:
+                return min(self.value_at(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"count={self.count} mean_ms={self.mean / 1000:.3f} "
+            f"p50_ms={self.percentile(50) / 1000:.3f} "
+            f"p90_ms={self.percentile(90) / 1000:.3f} "
+            f"p99_ms={self.percentile(99) / 1000:.3f} "
+            f"max_ms={self.max / 1000:.3f}"
+        )
+
+
+class NodeMetrics:
+    """
+    Per-topic latency histograms of a node, one per stage:
+
+    receive  event time of the envelope -> message received by the node
+             (event times are trace times, so it's the wall clock latency
+             only for a scheduled replay at REPLAY_SPEEDUP=1)
+    engine   message received -> handed to the matching engine
+    publish  match reported by the engine -> frame sent to ActiveMQ
+
+    and per-topic counters, e.g. the duplicates a node dropped, and gauges,
+    callables sampled at report time that return a value per topic, e.g.
+    the partial matches each query is holding.
+    """
+
+    STAGES = ("receive", "engine", "publish")
+
+    def __init__(self, node_id: int) -> None:
+        self.node_id = node_id
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.counters: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.gauges: Dict[str, Callable[[], Dict[str, int]]] = {}
+        self.reporter: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def histogram(self, stage: str, topic: str) -> LatencyHistogram:
+        histogram = self.histograms.get((stage, topic))
+        if histogram is None:
+            histogram = self.histograms.setdefault((stage, topic), LatencyHistogram())
+        return histogram
+
+    def record(self, stage: str, topic: str, seconds: float) -> None:
+        self.histogram(stage, topic).record(seconds)
+
+    def count(self, counter: str, topic: str, n: int = 1) -> None:
+        self.counters[(counter, topic)] += n
+
+    def observe(self, gauge: str, source: Callable[[], Dict[str, int]]) -> None:
+        self.gauges[gauge] = source
+
+    def report(self) -> str:
+        return "\n".join(
+            [
+                f"node={self.node_id} stage={stage} topic={topic} {histogram.summary()}"
+                for (stage, topic), histogram in sorted(self.histograms.items())
+            ]
+            + [
+                f"node={self.node_id} counter={counter} topic={topic} count={count}"
+                for (counter, topic), count in sorted(self.counters.items())
+            ]
+            + [
+                f"node={self.node_id} gauge={gauge} topic={topic} value={value}"
+                for gauge, source in sorted(self.gauges.items())
+                for topic, value in sorted(source().items())
+            ]
+        )
+
+    def dump(self, filename: Optional[str] = None) -> None:
+        report = self.report()
+        if not report:
+            return
+
+        if filename:
+            with open(filename, "a") as f:
+                f.write(f"# {time.strftime('%Y-%m-%dT%H:%M:%S')}\n{report}\n")
+        else:
+            print(report)
+
+    def start_reporting(
+        self, interval: float = METRICS_INTERVAL, filename: Optional[str] = METRICS_FILE
+    ) -> None:
+        if interval <= 0 or self.reporter is not None:
+            return
+
+        def report_periodically():
+            while not self.stopped.wait(interval):
+                self.dump(filename)
+
+        self.reporter = threading.Thread(
+            target=report_periodically, name=f"metrics-{self.node_id}", daemon=True
+        )
+        self.reporter.start()
+
+    def stop_reporting(self, filename: Optional[str] = METRICS_FILE) -> None:
+        self.stopped.set()
+        if self.reporter is not None:
+            self.reporter.join()
+            self.reporter = None
+            self.dump(filename)
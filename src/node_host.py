@@ -0,0 +1,157 @@
+"""
+Runs several logical nodes of the evaluation plan in one process.
+
+Every node keeps its own statements, subscriptions and output topics, the
+nodes of a host only share the process: one connection pool and, with the
+Siddhi engine, one SiddhiManager (one JVM) with an app runtime per node.
+
+STATEMENTS holds the statements of all nodes of the host separated by '|',
+every node runs the statements placed ON it. NODE_IDS lists the node ids,
+comma separated, ENGINE picks the backend of all of them. PLAN holds the
+statements of all nodes, see ActiveMQNode.publishes.
+
+With RUNTIME=asyncio the nodes run on one event loop and share one
+non-blocking connection instead of the pool, see async_connection.py.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+import connection
+from async_connection import AsyncStompConnection
+from connection import ACTIVEMQ_HOST, ACTIVEMQ_PORT, ActiveMQNode
+from connection_pool import CONNECTION_POOL, ConnectionPool
+from evaluation_plan import Statement, StatementParser
+from readiness import parse_node_ids, wait_for_broker
+
+STATEMENTS = os.environ.get("STATEMENTS", "")
+NODE_IDS = os.environ.get("NODE_IDS", "")
+ENGINE = os.environ.get("ENGINE", "siddhi")
+PLAN = os.environ.get("PLAN", "")
+RUNTIME = os.environ.get("RUNTIME", "threads")
+
+ENGINES = ("siddhi", "python")
+RUNTIMES = ("threads", "asyncio")
+
+
+def statements_for_node(statements: List[Statement], node_id: int) -> List[Statement]:
+    return [
+        statement
+        for statement in statements
+        if node_id in {node.value for node in statement.nodes}
+    ]
+
+
+class NodeHost:
+    def __init__(
+        self,
+        node_ids: List[int],
+        statements: List[Statement],
+        engine: str = ENGINE,
+        connection_pool: Optional[ConnectionPool] = None,
+        plan: Optional[List[Statement]] = None,
+        runtime: str = RUNTIME,
+    ) -> None:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}, expected one of {ENGINES}")
+        if runtime not in RUNTIMES:
+            raise ValueError(f"Unknown runtime: {runtime}, expected one of {RUNTIMES}")
+
+        self.engine = engine
+        self.runtime = runtime
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.activemq_connection: Optional[AsyncStompConnection] = None
+        if runtime == "asyncio":
+            self.loop = asyncio.new_event_loop()
+            self.activemq_connection = AsyncStompConnection(
+                (connection.ACTIVEMQ_HOST, int(connection.ACTIVEMQ_PORT)), name="host"
+            )
+        self.connection_pool = (
+            CONNECTION_POOL if connection_pool is None else connection_pool
+        )
+        self.siddhi_manager = None
+        self.plan = plan
+        self.nodes: Dict[int, ActiveMQNode] = {
+            node_id: self.make_node(node_id, statements_for_node(statements, node_id))
+            for node_id in sorted(node_ids)
+        }
+
+    def make_node(self, node_id: int, statements: List[Statement]) -> ActiveMQNode:
+        if not statements:
+            raise ValueError(f"No statement is placed on node {node_id}")
+
+        kwargs = {"id_": node_id, "statements": statements, "plan": self.plan}
+        if self.runtime == "asyncio":
+            kwargs["activemq_connection"] = self.activemq_connection
+        else:
+            kwargs["connection_pool"] = self.connection_pool
+
+        if self.engine == "python":
+            from python_connection import AsyncPythonActiveMQNode, PythonActiveMQNode
+
+            if self.runtime == "asyncio":
+                return AsyncPythonActiveMQNode(**kwargs)
+            return PythonActiveMQNode(**kwargs)
+
+        # imported here, so hosts of python nodes don't need PySiddhi
+        from PySiddhi.core.SiddhiManager import SiddhiManager
+
+        from siddhi_connection import AsyncSiddhiActiveMQNode, SiddhiActiveMQNode
+
+        if self.siddhi_manager is None:
+            self.siddhi_manager = SiddhiManager()
+        kwargs["siddhi_manager"] = self.siddhi_manager
+        if self.runtime == "asyncio":
+            return AsyncSiddhiActiveMQNode(**kwargs)
+        return SiddhiActiveMQNode(**kwargs)
+
+    def start(self):
+        for node in self.nodes.values():
+            if self.loop is not None:
+                self.loop.run_until_complete(node.start())
+            else:
+                node.start()
+
+    def run_forever(self):
+        """
+        Serve the nodes, with the asyncio runtime nothing is received before.
+        """
+        if self.loop is not None:
+            self.loop.run_forever()
+        else:
+            time.sleep(3600)
+
+    def stop(self):
+        for node in self.nodes.values():
+            if self.loop is not None:
+                self.loop.run_until_complete(node.stop())
+            else:
+                node.stop()
+        if self.loop is not None:
+            self.loop.run_until_complete(self.activemq_connection.disconnect())
+            self.loop.close()
+        if self.siddhi_manager is not None:
+            self.siddhi_manager.shutdown()
+
+
+if __name__ == "__main__":
+    statements = [
+        StatementParser(statement).parse() for statement in STATEMENTS.split("|")
+    ]
+    plan = (
+        [StatementParser(statement).parse() for statement in PLAN.split("|")]
+        if PLAN
+        else None
+    )
+
+    wait_for_broker(ACTIVEMQ_HOST, ACTIVEMQ_PORT)
+
+    host = NodeHost(sorted(parse_node_ids(NODE_IDS)), statements, plan=plan)
+    print(
+        f"Hosting nodes {list(host.nodes)} with the {host.engine} engine "
+        f"on the {host.runtime} runtime"
+    )
+
+    host.start()
+    host.run_forever()
@@ -0,0 +1,249 @@
+"""
+Cost-based placement of the statements of an evaluation plan onto nodes.
+
+Rates are events per second. Atomic rates are measured from the traces, the
+output rate of a query is estimated from the rates of its operands:
+
+- SEQ(X1, ..., Xn): every X1 starts a partial match that completes once the
+  remaining operands arrived, so it emits about rate(X1)
+- AND(X1, ..., Xn): a match is emitted once every operand has been seen and
+  then starts over, with Poisson inputs a round takes E[max_i T_i] for
+  T_i ~ Exp(rate(Xi)), which inclusion-exclusion gives as
+  sum over non-empty S of (-1)^(|S|+1) / sum_{i in S} rate(Xi)
+
+A node receives every topic it subscribes to once, no matter how many of its
+statements consume it, and publishes the output of each of its statements.
+Statements are placed greedily, the ones with the highest input rate first,
+on the node where they add the least broker traffic plus load_weight times the
+resulting load of the node, without exceeding the node capacity. The replicas
+of a PARTITIONED statement share its load and its output.
+"""
+import os
+from collections import defaultdict
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from binary_trace import read_csv_row
+from evaluation_plan import AtomicEventType, NodeEnum, Operator, Query, Statement
+
+file_root = Path(__file__).parent
+
+NODE_CAPACITY = float(os.environ.get("NODE_CAPACITY", "inf"))
+LOAD_WEIGHT = float(os.environ.get("LOAD_WEIGHT", 0.5))
+
+TYPE_FILES = {
+    event_type: file_root / f"data/atomicEvents_{event_type}_timestamps.csv"
+    for event_type in AtomicEventType.values()
+}
+
+
+def event_rates(events: Iterable[Tuple[int, str]], duration_ms: Optional[int] = None):
+    """
+    Events per second of each type in a trace of (timestamp in ms, type) pairs.
+    The trace starts at 0 and lasts duration_ms, or until its last event.
+    """
+    counts: Dict[str, int] = defaultdict(int)
+    last = 0
+    for timestamp, event_type in events:
+        counts[event_type] += 1
+        last = max(last, timestamp)
+
+    duration = (duration_ms or last) / 1000
+    if duration <= 0:
+        raise ValueError("Can't derive event rates from an empty trace")
+    return {event_type: count / duration for event_type, count in counts.items()}
+
+
+def event_rates_from_files(files: Dict[str, Path] = TYPE_FILES) -> Dict[str, float]:
+    """
+    Event rates from the single row per-type timestamp files.
+    """
+    return event_rates(
+        (timestamp, event_type)
+        for event_type, path in files.items()
+        for timestamp in read_csv_row(path)
+    )
+
+
+class RateModel:
+    def __init__(self, atomic_rates: Dict[str, float]) -> None:
+        self.rates = dict(atomic_rates)
+
+    def rate(self, operand: Union[AtomicEventType, Query]) -> float:
+        topic = operand.topic
+        if topic not in self.rates:
+            if isinstance(operand, AtomicEventType):
+                raise ValueError(f"No event rate for atomic event type {topic}")
+            self.rates[topic] = self.estimate(operand)
+        return self.rates[topic]
+
+    def estimate(self, query: Query) -> float:
+        rates = [self.rate(operand) for operand in query.operands]
+
+        if query.operator == Operator.SEQ:
+            return rates[0]
+
+        if query.operator == Operator.AND:
+            if min(rates) <= 0:
+                return 0.0
+            round_time = sum(
+                (-1) ** (size + 1) / sum(subset)
+                for size in range(1, len(rates) + 1)
+                for subset in combinations(rates, size)
+            )
+            return 1 / round_time
+
+        raise ValueError(f"No rate model for operator {query.operator}")
+
+
+class NodePlacement:
+    def __init__(self, node: NodeEnum) -> None:
+        self.node = node
+        self.statements: List[Statement] = []
+        self.subscriptions: Dict[str, float] = {}
+        self.published: Dict[str, float] = {}
+        self.load = 0.0
+
+    @property
+    def incoming(self) -> float:
+        return sum(self.subscriptions.values())
+
+    @property
+    def outgoing(self) -> float:
+        return sum(self.published.values())
+
+
+class PlacementReport:
+    def __init__(self, placements: List[NodePlacement]) -> None:
+        self.placements = [placement for placement in placements if placement.statements]
+
+    @property
+    def traffic(self) -> float:
+        return sum(
+            placement.incoming + placement.outgoing for placement in self.placements
+        )
+
+    @property
+    def max_load(self) -> float:
+        return max([placement.load for placement in self.placements], default=0.0)
+
+    def __str__(self) -> str:
+        lines = [
+            f"{'node':>4} {'statements':>10} {'in msg/s':>10} "
+            f"{'out msg/s':>10} {'load ev/s':>10}"
+        ]
+        for placement in self.placements:
+            lines.append(
+                f"{placement.node.value:>4} {len(placement.statements):>10} "
+                f"{placement.incoming:>10.4f} {placement.outgoing:>10.4f} "
+                f"{placement.load:>10.4f}"
+            )
+        lines.append(
+            f"broker traffic {self.traffic:.4f} msg/s, max node load {self.max_load:.4f} ev/s"
+        )
+        return "\n".join(lines)
+
+
+class PlacementOptimizer:
+    def __init__(
+        self,
+        statements: List[Statement],
+        rates: RateModel,
+        nodes: Optional[List[NodeEnum]] = None,
+        capacity: float = NODE_CAPACITY,
+        load_weight: float = LOAD_WEIGHT,
+        replicas: Optional[int] = None,
+    ) -> None:
+        self.statements = statements
+        self.rates = rates
+        self.nodes = nodes or list(NodeEnum)
+        self.capacity = capacity
+        self.load_weight = load_weight
+        # None keeps the number of nodes every statement was planned on
+        self.replicas = replicas
+
+    def input_rates(self, statement: Statement) -> Dict[str, float]:
+        return {input_.topic: self.rates.rate(input_) for input_ in statement.inputs}
+
+    def cost(
+        self, placement: NodePlacement, input_rates: Dict[str, float], load: float
+    ) -> float:
+        new_traffic = sum(
+            rate
+            for topic, rate in input_rates.items()
+            if topic not in placement.subscriptions
+        )
+        return new_traffic + self.load_weight * (placement.load + load)
+
+    def optimize(self) -> Tuple[List[Statement], PlacementReport]:
+        placements = [NodePlacement(node) for node in self.nodes]
+        assigned: Dict[int, List[NodeEnum]] = {}
+
+        order = sorted(
+            range(len(self.statements)),
+            key=lambda index: -sum(self.input_rates(self.statements[index]).values()),
+        )
+        for index in order:
+            statement = self.statements[index]
+            input_rates = self.input_rates(statement)
+            replicas = self.replicas or max(len(statement.nodes or []), 1)
+            statement_load = sum(input_rates.values())
+            output_rate = self.rates.rate(statement.query)
+            if statement.partitioned:
+                # every replica computes and publishes its share of the matches
+                statement_load /= replicas
+                output_rate /= replicas
+
+            candidates = [
+                placement
+                for placement in placements
+                if placement.load + statement_load <= self.capacity
+            ]
+            if len(candidates) < replicas:
+                raise ValueError(
+                    f"Can't place {replicas} replicas of '{statement}' "
+                    f"within a capacity of {self.capacity} events/s per node"
+                )
+
+            candidates.sort(
+                key=lambda placement: (
+                    self.cost(placement, input_rates, statement_load),
+                    placement.load,
+                    placement.node.value,
+                )
+            )
+            chosen = candidates[:replicas]
+            for placement in chosen:
+                placement.statements.append(statement)
+                placement.subscriptions.update(input_rates)
+                placement.published[statement.query.topic] = output_rate
+                placement.load += statement_load
+
+            assigned[index] = sorted(
+                [placement.node for placement in chosen], key=lambda node: node.value
+            )
+
+        placed = [
+            Statement(
+                nodes=assigned[index],
+                query=statement.query,
+                inputs=statement.inputs,
+                partitioned=statement.partitioned,
+                within_ms=statement.within_ms,
+                selection=statement.selection,
+                consumption=statement.consumption,
+            )
+            for index, statement in enumerate(self.statements)
+        ]
+        return placed, PlacementReport(placements)
+
+
+if __name__ == "__main__":
+    from compose_from_statements import plan_statements
+
+    rates = RateModel(event_rates_from_files())
+    statements, report = PlacementOptimizer(plan_statements(), rates).optimize()
+    for statement in statements:
+        print(statement)
+    print(report)
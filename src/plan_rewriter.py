@@ -0,0 +1,204 @@
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple, Union
+
+from evaluation_plan import (
+    DEFAULT_POLICIES,
+    AtomicEventType,
+    Consumption,
+    NodeEnum,
+    Operator,
+    Query,
+    Selection,
+    Statement,
+)
+
+Operand = Union[AtomicEventType, Query]
+# topic, WITHIN and POLICY of what a statement publishes
+Produced = Tuple[str, Optional[int], Selection, Consumption]
+
+
+def produced_key(statement: Statement) -> Produced:
+    selection, consumption = statement.policy
+    return statement.query.topic, statement.within_ms, selection, consumption
+
+
+def covers(producer_ms: Optional[int], consumer_ms: Optional[int]) -> bool:
+    """
+    Whether a producer's window is at least as wide as a consumer's.
+    """
+    return producer_ms is None or (consumer_ms is not None and producer_ms >= consumer_ms)
+
+
+class PlanRewriter:
+    """
+    Rewrites the inputs of a distributed evaluation plan to reuse what other
+    statements already compute.
+
+    Every statement is rederived from its query:
+
+    - a composite operand (e.g. the SEQ(C, J, A) in AND(E, SEQ(C, J, A))) is
+      subscribed to as a topic; if no statement produces it, a helper statement
+      computing it from its own operands is added, once, and shared by all
+      statements that need it
+    - the operands of an AND are covered greedily by the largest AND topics
+      produced elsewhere in the plan, so AND(B, C, D, E, F) subscribes to
+      B and AND(C, D, E, F) instead of five atomic topics
+
+    A topic is only reused from statements with the default POLICY and a
+    WITHIN window at least as wide as the consumer's, the matches of others
+    would change the consumer's. Helpers have the default POLICY and run on
+    helper_node, or on the lowest node of their first consumer, with the
+    widest WITHIN window of the statements that need them.
+
+    The topic of a query doesn't tell its WITHIN and POLICY apart, so a
+    rewritten plan producing one topic with different settings is rejected,
+    see conflicting().
+    """
+
+    def __init__(
+        self, statements: List[Statement], helper_node: Optional[NodeEnum] = None
+    ) -> None:
+        self.statements = statements
+        self.helper_node = helper_node
+        self.produced: Dict[Produced, Query] = {
+            produced_key(statement): statement.query for statement in statements
+        }
+        self.helpers: Dict[str, Statement] = {}
+
+    def reusable(self, query: Query, within_ms: Optional[int] = None) -> bool:
+        return any(
+            topic == query.topic
+            and covers(produced_ms, within_ms)
+            and (selection, consumption) == DEFAULT_POLICIES[query.operator]
+            for topic, produced_ms, selection, consumption in self.produced
+        )
+
+    def rewrite(self) -> List[Statement]:
+        rewritten = [
+            Statement(
+                nodes=statement.nodes,
+                query=statement.query,
+                inputs=self.cover(statement.query, statement.nodes, statement.within_ms),
+                partitioned=statement.partitioned,
+                within_ms=statement.within_ms,
+                selection=statement.selection,
+                consumption=statement.consumption,
+            )
+            for statement in self.statements
+        ]
+        plan = list(self.helpers.values()) + rewritten
+
+        conflicts = conflicting(plan)
+        if conflicts:
+            raise ValueError(
+                "Statements produce the same topic with a different WITHIN or "
+                "POLICY, their matches would mix: "
+                + "; ".join(str(statement) for statement in conflicts)
+            )
+        return plan
+
+    def cover(
+        self, query: Query, nodes: List[NodeEnum], within_ms: Optional[int] = None
+    ) -> List[Operand]:
+        for operand in query.operands:
+            if isinstance(operand, Query):
+                self.require(operand, nodes, within_ms)
+
+        if query.operator != Operator.AND:
+            return list(query.operands)
+
+        remaining = Counter(operand.topic for operand in query.operands)
+        operands = {operand.topic: operand for operand in query.operands}
+        inputs: List[Operand] = []
+
+        candidates = sorted(
+            {
+                produced
+                for produced in self.produced.values()
+                if produced.operator == Operator.AND
+                and produced is not query
+                and self.reusable(produced, within_ms)
+            },
+            key=lambda produced: (-len(produced.operands), produced.topic),
+        )
+        for candidate in candidates:
+            needed = Counter(operand.topic for operand in candidate.operands)
+            while len(needed) and not needed - remaining:
+                remaining -= needed
+                inputs.append(candidate)
+
+        for topic, count in sorted(remaining.items()):
+            inputs.extend([operands[topic]] * count)
+
+        return inputs
+
+    def require(
+        self, query: Query, nodes: List[NodeEnum], within_ms: Optional[int] = None
+    ):
+        helper = self.helpers.get(query.topic)
+        if helper is not None:
+            # a helper's window has to fit the widest window of its consumers
+            widened = (
+                None
+                if helper.within_ms is None or within_ms is None
+                else max(helper.within_ms, within_ms)
+            )
+            if widened != helper.within_ms:
+                del self.produced[produced_key(helper)]
+                self.add_helper(query, helper.nodes, widened)
+            return
+
+        if self.reusable(query, within_ms):
+            return
+
+        helper_nodes = [self.helper_node or min(nodes, key=lambda node: node.value)]
+        self.add_helper(query, helper_nodes, within_ms)
+
+    def add_helper(
+        self, query: Query, nodes: List[NodeEnum], within_ms: Optional[int] = None
+    ):
+        selection, consumption = DEFAULT_POLICIES[query.operator]
+        # registered before covering, so recursive subqueries don't loop
+        self.produced[(query.topic, within_ms, selection, consumption)] = query
+        inputs = self.cover(query, nodes, within_ms)
+        self.helpers[query.topic] = Statement(
+            nodes=nodes, query=query, inputs=inputs, within_ms=within_ms
+        )
+
+
+def subscription_count(statements: List[Statement]) -> int:
+    return sum(len(statement.inputs) * len(statement.nodes) for statement in statements)
+
+
+def unevaluable(statements: List[Statement]) -> List[Statement]:
+    """
+    The statements the engines can't evaluate as written: an operand they
+    match on isn't among the inputs, or a composite input nobody produces.
+    PlanRewriter.rewrite fixes both.
+    """
+    produced = {statement.query.topic for statement in statements}
+    return [
+        statement
+        for statement in statements
+        if {operand.topic for operand in statement.evaluation_query.operands}
+        != set(statement.input_topics)
+        or any(
+            topic not in produced and len(topic) > 1 for topic in statement.input_topics
+        )
+    ]
+
+
+def conflicting(statements: List[Statement]) -> List[Statement]:
+    """
+    The statements producing a topic that another statement produces with a
+    different WITHIN or POLICY. The topic is the query's only, so their
+    matches would mix on it.
+    """
+    settings = defaultdict(set)
+    for statement in statements:
+        settings[statement.query.topic].add(produced_key(statement))
+    return [
+        statement
+        for statement in statements
+        if len(settings[statement.query.topic]) > 1
+    ]
@@ -0,0 +1,96 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+from metrics import NodeMetrics
+
+PUBLISH_BATCH_SIZE = int(os.environ.get("PUBLISH_BATCH_SIZE", 64))
+PUBLISH_LINGER_MS = float(os.environ.get("PUBLISH_LINGER_MS", 5))
+PUBLISH_BUFFER_SIZE = int(os.environ.get("PUBLISH_BUFFER_SIZE", 10000))
+
+
+class BatchingPublisher:
+    """
+    Output stage between a matching engine and ActiveMQ.
+
+    publish() only puts the message into a bounded buffer (blocking when it is
+    full), a background thread collects up to max_batch_size messages or waits
+    at most linger_ms for more, and sends one frame per topic and batch through
+    node.send_batch(). With metrics, the time each message spent in the
+    publisher is recorded as the "publish" latency of its topic.
+    """
+
+    def __init__(
+        self,
+        node,
+        max_batch_size: int = PUBLISH_BATCH_SIZE,
+        linger_ms: float = PUBLISH_LINGER_MS,
+        buffer_size: int = PUBLISH_BUFFER_SIZE,
+        metrics: Optional[NodeMetrics] = None,
+    ):
+        self.node = node
+        self.metrics = metrics
+        self.max_batch_size = max_batch_size
+        self.linger = linger_ms / 1000
+        self.buffer: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self.flusher = None
+
+    def start(self):
+        if self.flusher is None:
+            self.flusher = threading.Thread(
+                target=self.flush_loop, name=f"publisher-{self.node.id}", daemon=True
+            )
+            self.flusher.start()
+
+    def stop(self):
+        # the sentinel is queued behind all pending messages, so they get flushed
+        if self.flusher is not None:
+            self.buffer.put(None)
+            self.flusher.join()
+            self.flusher = None
+
+    def publish(self, message, topic):
+        self.buffer.put((topic, message, time.perf_counter()))
+
+    def flush_loop(self):
+        stopping = False
+        while not stopping:
+            item = self.buffer.get()
+            if item is None:
+                break
+
+            batches = defaultdict(list)
+            batches[item[0]].append(item)
+            size = 1
+
+            deadline = time.monotonic() + self.linger
+            while size < self.max_batch_size:
+                try:
+                    item = self.buffer.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batches[item[0]].append(item)
+                size += 1
+
+            for topic, items in batches.items():
+                try:
+                    self.node.send_batch([message for _, message, _ in items], topic=topic)
+                except Exception as error:
+                    print(
+                        f"BatchingPublisher - dropped {len(items)} messages for {topic}: {error}"
+                    )
+                    continue
+
+                if self.metrics is not None:
+                    sent_at = time.perf_counter()
+                    histogram = self.metrics.histogram(
+                        "publish", topic.split("/topic/", 1)[-1]
+                    )
+                    for _, _, enqueued_at in items:
+                        histogram.record(sent_at - enqueued_at)
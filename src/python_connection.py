@@ -0,0 +1,145 @@
+import os
+import time
+
+from async_connection import AsyncActiveMQNode
+from connection import ACTIVEMQ_HOST, ACTIVEMQ_PORT, ActiveMQNode
+from envelope import Envelope
+from evaluation_plan import StatementParser
+from ingest import IngestQueue
+from matching_engine import MatchingEngine
+from publisher import BatchingPublisher
+from readiness import wait_for_broker
+
+STATEMENTS = os.environ.get("STATEMENTS", "")
+NODE_ID = os.environ.get("NODE_ID", None)
+# statements of all nodes separated by '|', publishes only what other nodes
+# consume when set, see ActiveMQNode.publishes
+PLAN = os.environ.get("PLAN", "")
+
+
+class PythonActiveMQNode(ActiveMQNode):
+    """
+    Same interface and output topics as SiddhiActiveMQNode, but the statements
+    are evaluated in-process by the pure-Python MatchingEngine (no JVM).
+    """
+
+    def __init__(
+        self,
+        *args,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.matching_engine = None
+        self.publisher = BatchingPublisher(self, metrics=self.metrics)
+        self.ingest = IngestQueue(self.process_batch, name=f"ingest-{self.id}")
+
+    @property
+    def ingest_queue_depth(self) -> int:
+        return self.ingest.depth
+
+    @property
+    def partial_matches(self):
+        """
+        Partial matches each query is holding, by topic.
+        """
+        if not self.matching_engine:
+            return {}
+        return self.matching_engine.partial_matches
+
+    def start(self):
+        self.metrics.start_reporting()
+        self.publisher.start()
+        self.bootstrap_engine()
+        self.ingest.start()
+        self.subscribe_to_topics()
+        self.announce_ready()
+
+    def stop(self):
+        self.unsubscribe_from_topics()
+        self.ingest.stop()
+        self.publisher.stop()
+        self.disconnect()
+        self.metrics.stop_reporting()
+
+    def bootstrap_engine(self):
+        self.matching_engine = MatchingEngine(
+            self.statements, callback=self.on_match, node_id=self.id
+        )
+        self.metrics.observe("partial_matches", lambda: self.partial_matches)
+
+    def on_match(self, topic, events):
+        envelope = Envelope.from_parts(topic, producer_id=self.id, parts=events)
+        if not self.route_output(envelope):
+            return
+
+        print(
+            f"PythonActiveMQNode - sending message {topic} back to ActiveMQ (translated to '/topic/{topic}')"
+        )
+        self.publisher.publish(envelope, topic=f"/topic/{topic}")
+
+    def on_message(self, message):
+        envelopes = self.receive_message(message)
+        print(f"PythonActiveMQNode - Received message {envelopes}")
+
+        if not self.matching_engine:
+            print("Matching engine not initialized, skipping message forwarding...")
+            return
+
+        received_at = time.perf_counter()
+        for envelope in envelopes:
+            self.ingest.put((envelope, received_at))
+
+    def process_batch(self, items):
+        for envelope, received_at in items:
+            self.matching_engine.send(envelope.symbol, envelope)
+            self.metrics.record(
+                "engine", envelope.symbol, time.perf_counter() - received_at
+            )
+            # matches consumed by this node's own statements, see route_output
+            while self.local_events:
+                local = self.local_events.popleft()
+                self.matching_engine.send(local.symbol, local)
+
+    def on_error(self, error):
+        print(f"PythonActiveMQNode - Received error {error}")
+
+
+class AsyncPythonActiveMQNode(AsyncActiveMQNode, PythonActiveMQNode):
+    """
+    PythonActiveMQNode on an event loop, see async_connection.py. The engine
+    runs on the loop, a frame is matched and its matches sent before the
+    next one is read.
+    """
+
+    async def start(self):
+        self.metrics.start_reporting()
+        self.bootstrap_engine()
+        await self.subscribe_to_topics()
+        await self.announce_ready()
+
+    async def hand_off(self, envelopes):
+        received_at = time.perf_counter()
+        self.process_batch([(envelope, received_at) for envelope in envelopes])
+        await self.flush()
+
+
+if __name__ == "__main__":
+    statements = [
+        StatementParser(statement).parse() for statement in STATEMENTS.split("|")
+    ]
+    plan = (
+        [StatementParser(statement).parse() for statement in PLAN.split("|")]
+        if PLAN
+        else None
+    )
+
+    wait_for_broker(ACTIVEMQ_HOST, ACTIVEMQ_PORT)
+
+    python_activeMQ_node = PythonActiveMQNode(
+        id_=NODE_ID,
+        statements=statements,
+        plan=plan,
+    )
+
+    python_activeMQ_node.start()
+    time.sleep(3600)
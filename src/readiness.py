@@ -0,0 +1,138 @@
+"""
+Readiness-driven startup, replacing the fixed SLEEP before connecting.
+
+- wait_for_broker probes the broker port with exponential backoff
+- a node is ready once its engine runs and the broker confirmed its
+  subscriptions; it then writes READINESS_FILE (for container healthchecks)
+  and announces its id on READY_TOPIC
+- the producer probes the nodes on PROBE_TOPIC, every ready node answers on
+  READY_TOPIC, and replays the trace once all EXPECTED_NODES answered
+
+Announcements aren't retained by the broker, the probe lets the producer
+learn about the nodes that were ready before it subscribed.
+"""
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional, Set
+
+import stomp
+
+from connection_pool import backoff_delays, retry_with_backoff
+
+READY_TOPIC = "/topic/node.ready"
+PROBE_TOPIC = "/topic/node.probe"
+
+# written once the node is ready, {node_id} is replaced by the node id
+READINESS_FILE = os.environ.get("READINESS_FILE", "")
+# ids of the nodes the producer waits for, comma separated
+EXPECTED_NODES = os.environ.get("EXPECTED_NODES", "")
+READINESS_TIMEOUT_S = float(os.environ.get("READINESS_TIMEOUT_S", 300))
+
+
+def parse_node_ids(text: str) -> Set[int]:
+    return {int(node_id) for node_id in text.split(",") if node_id.strip()}
+
+
+def wait_for_broker(host: str, port: int, attempts: int = 0, timeout: float = 1.0):
+    """
+    Block until the broker accepts TCP connections, retrying with exponential
+    backoff (forever with attempts=0).
+    """
+    started = time.monotonic()
+
+    def probe():
+        socket.create_connection((host, int(port)), timeout=timeout).close()
+
+    retry_with_backoff(probe, attempts=attempts)
+    print(f"Broker {host}:{port} is up after {time.monotonic() - started:.1f}s")
+
+
+def write_readiness_file(node_id: int, path: str = READINESS_FILE):
+    if not path:
+        return
+    Path(path.format(node_id=node_id)).write_text(f"{node_id}\n")
+
+
+class ReadinessAnnouncer(stomp.ConnectionListener):
+    """
+    Announces a node on READY_TOPIC, once now and again on every probe.
+    """
+
+    def __init__(self, node) -> None:
+        self.node = node
+
+    @property
+    def subscription_id(self) -> str:
+        return f"probe-{self.node.id}"
+
+    def announce(self, timeout: Optional[float] = READINESS_TIMEOUT_S) -> bool:
+        connection = self.node.activemq_connection
+        connection.subscribe(self, destination=PROBE_TOPIC, id=self.subscription_id)
+        # the receipt also confirms the node's subscriptions, sent before it
+        # on the same connection
+        if not connection.send_confirmed(str(self.node.id), READY_TOPIC, timeout):
+            print(f"Node {self.node.id} - broker didn't confirm the subscriptions")
+            return False
+
+        write_readiness_file(self.node.id)
+        print(f"Node {self.node.id} is ready")
+        return True
+
+    def withdraw(self):
+        self.node.activemq_connection.unsubscribe(self.subscription_id)
+
+    def on_message(self, frame):
+        self.node.activemq_connection.send(body=str(self.node.id), destination=READY_TOPIC)
+
+
+class ReadinessWaiter(stomp.ConnectionListener):
+    """
+    Collects the ids of the nodes announcing themselves on READY_TOPIC.
+    """
+
+    def __init__(self, node, expected: Iterable[int]) -> None:
+        self.node = node
+        self.expected = set(expected)
+        self.ready: Set[int] = set()
+        self.complete = threading.Event()
+
+    @property
+    def missing(self) -> Set[int]:
+        return self.expected - self.ready
+
+    def wait(self, timeout: float = READINESS_TIMEOUT_S) -> Set[int]:
+        """
+        Probe until every expected node answered or timeout seconds passed,
+        returns the nodes that didn't answer.
+        """
+        if not self.expected:
+            return set()
+
+        connection = self.node.activemq_connection
+        subscription_id = f"ready-{self.node.id}"
+        connection.subscribe(self, destination=READY_TOPIC, id=subscription_id)
+
+        started = time.monotonic()
+        deadline = started + timeout
+        delays = backoff_delays()
+        try:
+            while self.missing and time.monotonic() < deadline:
+                connection.send(body=str(self.node.id), destination=PROBE_TOPIC)
+                self.complete.wait(min(next(delays), max(deadline - time.monotonic(), 0)))
+        finally:
+            connection.unsubscribe(subscription_id)
+
+        print(
+            f"{len(self.ready & self.expected)}/{len(self.expected)} nodes ready "
+            f"after {time.monotonic() - started:.1f}s"
+        )
+        return self.missing
+
+    def on_message(self, frame):
+        body = frame.body.decode("utf-8") if isinstance(frame.body, bytes) else frame.body
+        self.ready.add(int(body))
+        if not self.missing:
+            self.complete.set()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Iterable, Tuple
+
+from metrics import LatencyHistogram
+
+REPLAY_SPEEDUP = float(os.environ.get("REPLAY_SPEEDUP", 1))
+REPLAY_MODE = os.environ.get("REPLAY_MODE", "scheduled")
+
+MODES = ("scheduled", "max-rate")
+
+
+class ReplayReport:
+    def __init__(self, events: int, duration: float, lag: LatencyHistogram) -> None:
+        self.events = events
+        self.duration = duration
+        self.lag = lag
+
+    @property
+    def rate(self) -> float:
+        return self.events / self.duration if self.duration > 0 else float("inf")
+
+    def __str__(self) -> str:
+        return (
+            f"replayed {self.events} events in {self.duration:.3f}s "
+            f"({self.rate:.1f} events/s), lag behind schedule: "
+            f"mean_ms={self.lag.mean / 1000:.3f} "
+            f"p99_ms={self.lag.percentile(99) / 1000:.3f} "
+            f"max_ms={self.lag.max / 1000:.3f}"
+        )
+
+
+class ReplayScheduler:
+    """
+    Replays (timestamp in ms, item) pairs of a trace.
+
+    In "scheduled" mode every item is due at start + timestamp / speedup, an
+    absolute deadline, so time spent emitting does not accumulate as drift.
+    "max-rate" ignores the timestamps and emits as fast as possible.
+    """
+
+    def __init__(
+        self,
+        speedup: float = REPLAY_SPEEDUP,
+        mode: str = REPLAY_MODE,
+        clock: Callable[[], float] = time.perf_counter,
+        sleep: Callable[[float], None] = time.sleep,
+        async_sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown replay mode: {mode}, expected one of {MODES}")
+        if speedup <= 0:
+            raise ValueError(f"Replay speedup must be positive, got {speedup}")
+
+        self.speedup = speedup
+        self.mode = mode
+        self.clock = clock
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+
+    def replay(
+        self, events: Iterable[Tuple[int, Any]], emit: Callable[[Any], None]
+    ) -> ReplayReport:
+        lag = LatencyHistogram()
+        scheduled = self.mode == "scheduled"
+        scale = 1 / (1000 * self.speedup)
+        count = 0
+
+        start = self.clock()
+        for timestamp, item in events:
+            if scheduled:
+                deadline = start + timestamp * scale
+                delay = deadline - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+                lag.record(max(self.clock() - deadline, 0))
+
+            emit(item)
+            count += 1
+
+        return ReplayReport(count, self.clock() - start, lag)
+
+    async def replay_async(
+        self, events: Iterable[Tuple[int, Any]], emit: Callable[[Any], Awaitable[None]]
+    ) -> ReplayReport:
+        """
+        replay() on an event loop, awaiting async_sleep and the emit coroutine.
+        """
+        lag = LatencyHistogram()
+        scheduled = self.mode == "scheduled"
+        scale = 1 / (1000 * self.speedup)
+        count = 0
+
+        start = self.clock()
+        for timestamp, item in events:
+            if scheduled:
+                deadline = start + timestamp * scale
+                delay = deadline - self.clock()
+                if delay > 0:
+                    await self.async_sleep(delay)
+                lag.record(max(self.clock() - deadline, 0))
+
+            await emit(item)
+            count += 1
+
+        return ReplayReport(count, self.clock() - start, lag)
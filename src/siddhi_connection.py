@@ -1,17 +1,29 @@
+import asyncio
 import os
 import time
+from typing import Optional
 
 from PySiddhi.core.query.output.callback.QueryCallback import QueryCallback
 from PySiddhi.core.SiddhiManager import SiddhiManager
+from PySiddhi.DataTypes.LongType import LongType
 
-from connection import ActiveMQNode, make_connection
+from async_connection import AsyncActiveMQNode
+from connection import ActiveMQNode
+from envelope import Envelope, EventCache
 from evaluation_plan import Query, StatementParser, make_safe_topic_name
+from ingest import IngestQueue
+from publisher import BatchingPublisher
+from readiness import wait_for_broker
 
 ACTIVEMQ_HOST = os.environ.get("ACTIVEMQ_HOST", "localhost")
 ACTIVEMQ_PORT = int(os.environ.get("ACTIVEMQ_PORT", 61613))
 STATEMENTS = os.environ.get("STATEMENTS", "")
 NODE_ID = os.environ.get("NODE_ID", None)
-SLEEP = float(os.environ.get("SLEEP", 20))
+# statements of all nodes separated by '|', publishes only what other nodes
+# consume when set, see ActiveMQNode.publishes
+PLAN = os.environ.get("PLAN", "")
+# reporting interval in seconds of Siddhi's own statistics, off when empty
+SIDDHI_STATISTICS = os.environ.get("SIDDHI_STATISTICS", "")
 
 
 class SiddhiQueryOutputCallbackActiveMQ(QueryCallback):
@@ -28,36 +40,68 @@ class SiddhiQueryOutputCallbackActiveMQ(QueryCallback):
                 print(f"Received empty event from Siddhi query {event}")
                 continue
 
-            # event_data is the same as the topic in our case
-            event_topic = event_data[0]
+            # event_data is [topic, eventTime, id1, ..., idn], see Query.siddhi_select
+            event_topic, event_time, *event_ids = event_data
             #event_topic_mq = make_safe_topic_name(event_topic)
+            envelope = Envelope.composite(
+                event_topic,
+                producer_id=self.activeMQNode.id,
+                constituents=self.activeMQNode.recent_events.constituents(event_ids),
+                event_time=event_time,
+            )
+            if not self.activeMQNode.route_output(envelope):
+                continue
+
             print(
                 f"SiddhiQueryOutputCallbackActiveMQ - sending message {event_topic} back to ActiveMQ (translated to '/topic/{event_topic}')"
             )
-
-            self.activeMQNode.send(event_topic, topic=f"/topic/{event_topic}")
+            self.activeMQNode.publisher.publish(envelope, topic=f"/topic/{event_topic}")
 
 
 class SiddhiActiveMQNode(ActiveMQNode):
     def __init__(
         self,
         *args,
+        siddhi_manager: Optional[SiddhiManager] = None,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
-        self.activemq_connection = None  # init siddhi first
         self.siddhi_runtime = None
-        self.siddhi_manager = SiddhiManager()
+        self.input_handler = None
+        self.recent_events = EventCache()
+        # nodes hosted in one process share the manager (and its JVM), each
+        # node still gets its own app runtime
+        self.owns_siddhi_manager = siddhi_manager is None
+        self.siddhi_manager = siddhi_manager or SiddhiManager()
+        self.publisher = BatchingPublisher(self, metrics=self.metrics)
+        self.ingest = IngestQueue(self.process_batch, name=f"ingest-{self.id}")
+
+    @property
+    def ingest_queue_depth(self) -> int:
+        return self.ingest.depth
 
     def start(self):
+        self.metrics.start_reporting()
+        self.publisher.start()
         self.bootstrap_siddhi()
-        self.activemq_connection = make_connection(listener=self)
+        self.ingest.start()
+        # subscribing opens the pooled connection, after siddhi is ready
         self.subscribe_to_topics()
+        self.announce_ready()
 
     def stop(self):
         self.unsubscribe_from_topics()
+        self.ingest.stop()
+        self.shutdown_siddhi()
+        self.publisher.stop()
         self.disconnect()
-        self.siddhi_manager.shutdown()
+        self.metrics.stop_reporting()
+
+    def shutdown_siddhi(self):
+        if self.owns_siddhi_manager:
+            self.siddhi_manager.shutdown()
+        elif self.siddhi_runtime is not None:
+            self.siddhi_runtime.shutdown()
 
     def bootstrap_siddhi(
         self,
@@ -65,19 +109,32 @@ class SiddhiActiveMQNode(ActiveMQNode):
         output_stream="outputStream",
         attribute="symbol",
     ):
-        input_stream_def = f"define stream {input_stream} ({attribute} string); "
+        input_stream_def = (
+            f"define stream {input_stream} "
+            f"({attribute} string, eventTime long, eventId long, producerId int); "
+        )
+        # one output stream per statement, the queries select a different number of ids
         queries_def = " ".join(
             [
-                statement.query.to_siddhi_query(
+                statement.evaluation_query.to_siddhi_query(
                     input_stream=input_stream,
-                    output_stream=output_stream,
+                    output_stream=f"{output_stream}{index}",
                     attribute=attribute,
+                    shard=statement.shard(self.id),
+                    within_ms=statement.within_ms,
+                    policy=statement.policy,
                 )
-                for statement in self.statements
+                for index, statement in enumerate(self.statements)
             ]
         )
 
         app_string = f"{input_stream_def} {queries_def}"
+        if SIDDHI_STATISTICS:
+            # Siddhi reports throughput, latency and the memory held by each query
+            app_string = (
+                f"@app:statistics(reporter = 'console', interval = '{SIDDHI_STATISTICS}') "
+                + app_string
+            )
         # print(f"Initializing Siddhi runtime with app string: {app_string}")
 
         self.siddhi_runtime = self.siddhi_manager.createSiddhiAppRuntime(app_string)
@@ -88,33 +145,92 @@ class SiddhiActiveMQNode(ActiveMQNode):
                 topic, SiddhiQueryOutputCallbackActiveMQ(activeMQNode=self)
             )
 
+        self.input_handler = self.siddhi_runtime.getInputHandler(input_stream)
         self.siddhi_runtime.start()
 
     def on_message(self, message):
-        print(f"SiddhiActiveMQNode - Received message {message.body}")
-        message_topic = message.body
+        envelopes = self.receive_message(message)
+        print(f"SiddhiActiveMQNode - Received message {envelopes}")
 
-        if self.siddhi_runtime:
-            # siddhi seems to be able to handle the special characters in the topic name
-            self.siddhi_runtime.getInputHandler("cseEventStream").send([message_topic])
-        else:
+        if not self.siddhi_runtime:
             print("Siddhi runtime not initialized, skipping message forwarding...")
+            return
+
+        received_at = time.perf_counter()
+        for envelope in envelopes:
+            self.ingest.put((envelope, received_at))
+
+    def process_batch(self, items):
+        for envelope, received_at in items:
+            self.send_to_siddhi(envelope)
+            self.metrics.record(
+                "engine", envelope.symbol, time.perf_counter() - received_at
+            )
+            # matches consumed by this node's own statements, see route_output
+            while self.local_events:
+                self.send_to_siddhi(self.local_events.popleft())
+
+    def send_to_siddhi(self, envelope):
+        self.recent_events.add(envelope)
+        # siddhi seems to be able to handle the special characters in the topic name
+        self.input_handler.send(
+            [
+                envelope.symbol,
+                LongType(envelope.event_time),
+                LongType(envelope.event_id),
+                envelope.producer_id,
+            ]
+        )
 
     def on_error(self, error):
         print(f"SiddhiActiveMQNode - Received error {error}")
 
 
+class AsyncSiddhiActiveMQNode(AsyncActiveMQNode, SiddhiActiveMQNode):
+    """
+    SiddhiActiveMQNode on an event loop, see async_connection.py. Events go
+    into Siddhi from an executor thread, so the JVM doesn't block the loop.
+    """
+
+    async def start(self):
+        self.metrics.start_reporting()
+        self.bootstrap_siddhi()
+        await self.subscribe_to_topics()
+        await self.announce_ready()
+
+    async def stop(self):
+        await super().stop()
+        self.shutdown_siddhi()
+
+    async def hand_off(self, envelopes):
+        received_at = time.perf_counter()
+        # the output callbacks run on the sending thread, the matches are in
+        # the outbox once process_batch returns; later ones go with the next
+        # flush
+        await asyncio.get_event_loop().run_in_executor(
+            None,
+            self.process_batch,
+            [(envelope, received_at) for envelope in envelopes],
+        )
+        await self.flush()
+
+
 if __name__ == "__main__":
     statements = [
         StatementParser(statement).parse() for statement in STATEMENTS.split("|")
     ]
+    plan = (
+        [StatementParser(statement).parse() for statement in PLAN.split("|")]
+        if PLAN
+        else None
+    )
 
-    print("Waiting for ActiveMQ to start")
-    time.sleep(SLEEP)
+    wait_for_broker(ACTIVEMQ_HOST, ACTIVEMQ_PORT)
 
     siddhi_activeMQ_node = SiddhiActiveMQNode(
         id_=NODE_ID,
         statements=statements,
+        plan=plan,
     )
 
     siddhi_activeMQ_node.start()
@@ -0,0 +1,256 @@
+"""
+Discrete-event simulation of a whole evaluation plan in one process.
+
+Every node of the plan runs its statements on the pure-Python MatchingEngine,
+messages go through an in-memory topic bus instead of ActiveMQ and everything
+is driven by the trace timestamps on a virtual clock (in ms), so a 600 s trace
+takes as long as matching its events does. Optionally every message is delayed
+by a link latency and every node takes a service time per message, messages
+arriving at a busy node wait in its queue.
+
+Nodes subscribe to the input topics of their statements and publish the
+output of each and drop duplicate composite events, just like the ActiveMQ
+nodes.
+
+Run from src/: python simulator.py, the plan comes from
+compose_from_statements (REWRITE_PLAN, OPTIMIZE_PLACEMENT, PARTITION_REPLICAS)
+and the events from TRACE_FILE.
+"""
+import heapq
+import itertools
+import os
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from connection import DEDUP
+from dedup import DuplicateFilter
+from envelope import Envelope
+from evaluation_plan import Statement
+from matching_engine import Match, MatchingEngine
+from metrics import LatencyHistogram, NodeMetrics
+from trace_source import EVENT_TYPES, TraceEvent
+
+LINK_LATENCY_MS = float(os.environ.get("LINK_LATENCY_MS", 0))
+SERVICE_TIME_MS = float(os.environ.get("SERVICE_TIME_MS", 0))
+
+# sender id of the atomic event producer, outside NodeEnum so a per-link
+# latency can tell it from node 0; never encoded, an envelope's producer id
+# is unsigned
+PRODUCER_ID = -1
+
+# ms, or ms per (sender, receiver) node id
+LinkLatency = Union[float, Callable[[int, int], float]]
+
+
+class SimulatedNode:
+    def __init__(
+        self,
+        simulator: "Simulator",
+        node_id: int,
+        statements: List[Statement],
+        service_ms: float = SERVICE_TIME_MS,
+    ) -> None:
+        self.simulator = simulator
+        self.id = node_id
+        self.statements = statements
+        self.service_ms = service_ms
+        self.metrics = NodeMetrics(node_id)
+        self.duplicates = (
+            DuplicateFilter(clock=lambda: simulator.now / 1000) if DEDUP else None
+        )
+        self.matching_engine = MatchingEngine(
+            statements, callback=self.on_match, node_id=node_id
+        )
+
+        self.busy_until = 0.0
+        self.queued = 0
+        self.max_queued = 0
+
+    @property
+    def topic_subscriptions(self) -> List[str]:
+        return sorted(
+            {topic for statement in self.statements for topic in statement.input_topics}
+        )
+
+    def deliver(self, envelope: Envelope):
+        if (
+            self.duplicates is not None
+            and envelope.constituents
+            and self.duplicates.is_duplicate(envelope.event_id)
+        ):
+            self.metrics.count("duplicates", envelope.symbol)
+            return
+
+        now = self.simulator.now
+        self.metrics.count("received", envelope.symbol)
+        self.metrics.record("receive", envelope.symbol, (now - envelope.event_time) / 1000)
+
+        # a single server, messages wait until the previous ones are processed
+        self.busy_until = max(now, self.busy_until) + self.service_ms
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        self.simulator.schedule(self.busy_until, self.process, envelope)
+
+    def process(self, envelope: Envelope):
+        self.queued -= 1
+        self.matching_engine.send(envelope.symbol, envelope)
+
+    def on_match(self, topic: str, events: Match):
+        envelope = Envelope.from_parts(topic, producer_id=self.id, parts=events)
+        self.metrics.count("published", topic)
+        self.simulator.publish(self.id, envelope)
+
+
+class SimulationReport:
+    def __init__(
+        self,
+        nodes: List[SimulatedNode],
+        latencies: Dict[str, LatencyHistogram],
+        events: int,
+        duration_ms: float,
+        wall_time: float,
+    ) -> None:
+        self.nodes = nodes
+        # topic -> last constituent atomic event emitted -> composite published
+        self.latencies = latencies
+        self.events = events
+        self.duration_ms = duration_ms
+        self.wall_time = wall_time
+
+    def counter(self, node: SimulatedNode, counter: str) -> int:
+        return sum(
+            count for (name, _), count in node.metrics.counters.items() if name == counter
+        )
+
+    @property
+    def messages(self) -> int:
+        return sum(self.counter(node, "received") for node in self.nodes)
+
+    def __str__(self) -> str:
+        lines = [
+            f"{'node':>4} {'received':>10} {'published':>10} "
+            f"{'duplicates':>10} {'max queue':>10}"
+        ]
+        for node in self.nodes:
+            lines.append(
+                f"{node.id:>4} {self.counter(node, 'received'):>10} "
+                f"{self.counter(node, 'published'):>10} "
+                f"{self.counter(node, 'duplicates'):>10} {node.max_queued:>10}"
+            )
+        lines.extend(
+            f"topic={topic} {histogram.summary()}"
+            for topic, histogram in sorted(self.latencies.items())
+        )
+        lines.append(
+            f"{self.events} events, {self.messages} messages delivered, "
+            f"{self.duration_ms / 1000:.3f}s simulated in {self.wall_time:.3f}s"
+        )
+        return "\n".join(lines)
+
+
+class Simulator:
+    """
+    Runs the statements of a plan on one SimulatedNode per node id, the
+    replay of a trace of (timestamp in ms, event type code) pairs is published
+    by PRODUCER_ID.
+    """
+
+    def __init__(
+        self,
+        statements: List[Statement],
+        latency_ms: LinkLatency = LINK_LATENCY_MS,
+        service_ms: float = SERVICE_TIME_MS,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.now = 0.0
+        # (time, sequence number, action, argument), the sequence number
+        # keeps simultaneous events in the order they were scheduled
+        self.queue: List[Any] = []
+        self.sequence = itertools.count()
+
+        statements_by_node: Dict[int, List[Statement]] = defaultdict(list)
+        for statement in statements:
+            for node in statement.nodes:
+                statements_by_node[node.value].append(statement)
+
+        self.nodes = [
+            SimulatedNode(self, node_id, node_statements, service_ms)
+            for node_id, node_statements in sorted(statements_by_node.items())
+        ]
+        self.subscribers: Dict[str, List[SimulatedNode]] = defaultdict(list)
+        for node in self.nodes:
+            for topic in node.topic_subscriptions:
+                self.subscribers[topic].append(node)
+
+        self.latencies: Dict[str, LatencyHistogram] = {}
+
+    def link_latency(self, sender: int, receiver: int) -> float:
+        if callable(self.latency_ms):
+            return self.latency_ms(sender, receiver)
+        return self.latency_ms
+
+    def schedule(self, at: float, action: Callable[[Any], None], argument: Any):
+        heapq.heappush(self.queue, (at, next(self.sequence), action, argument))
+
+    def publish(self, sender: int, envelope: Envelope):
+        if envelope.constituents:
+            histogram = self.latencies.get(envelope.symbol)
+            if histogram is None:
+                histogram = self.latencies[envelope.symbol] = LatencyHistogram()
+            histogram.record((self.now - envelope.event_time) / 1000)
+
+        for node in self.subscribers.get(envelope.symbol, ()):
+            self.schedule(
+                self.now + self.link_latency(sender, node.id), node.deliver, envelope
+            )
+
+    def run(
+        self, trace: Iterable[TraceEvent], until_ms: Optional[float] = None
+    ) -> SimulationReport:
+        started = time.perf_counter()
+        events = iter(trace)
+        emitted = 0
+
+        def schedule_next(events: Iterator[TraceEvent]):
+            for timestamp, code in events:
+                self.schedule(max(timestamp, self.now), emit, (timestamp, code))
+                return
+
+        def emit(event: TraceEvent):
+            nonlocal emitted
+            timestamp, code = event
+            emitted += 1
+            self.publish(
+                PRODUCER_ID,
+                Envelope.atomic(
+                    EVENT_TYPES[code], producer_id=PRODUCER_ID, event_time=timestamp
+                ),
+            )
+            # the trace is streamed, only its next event is ever queued
+            schedule_next(events)
+
+        schedule_next(events)
+        while self.queue:
+            at, _, action, argument = heapq.heappop(self.queue)
+            if until_ms is not None and at > until_ms:
+                break
+            self.now = at
+            action(argument)
+
+        return SimulationReport(
+            self.nodes,
+            self.latencies,
+            emitted,
+            self.now,
+            time.perf_counter() - started,
+        )
+
+
+if __name__ == "__main__":
+    from atomicEventProducer import TRACE_FILE
+    from compose_from_statements import place_statements, plan_statements
+    from trace_source import TraceSource
+
+    simulator = Simulator(place_statements(plan_statements()))
+    print(simulator.run(TraceSource(TRACE_FILE)))
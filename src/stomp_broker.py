@@ -0,0 +1,467 @@
+"""
+Minimal STOMP 1.0-1.2 broker standing in for ActiveMQ in tests and local
+benchmarks.
+
+Only what the nodes use is implemented: topics (every subscriber of a
+destination gets every message sent to it, nothing is stored for later
+subscribers), subscriptions by id, the auto, client and client-individual ack
+modes, receipts and DISCONNECT. Bodies are passed through byte for byte with a
+content-length, so binary envelopes and batches work.
+
+Like ActiveMQ, destinations are reported with commas replaced by dashes, e.g.
+a message sent to '/topic/AND(E, SEQ(J, A))' arrives with the destination
+'/topic/AND(E-SEQ(J-A))'.
+
+Every connection is served by its own thread, and frames to it are written
+by another one from a queue, so a client that doesn't read never blocks the
+sessions publishing to it. Like ActiveMQ does for slow topic consumers,
+messages to a client with STOMP_BROKER_QUEUE_SIZE frames queued are dropped
+(and counted), receipts and errors never are. Start it in-process with
+
+    with StompBroker(port=0) as broker:
+        host, port = broker.address
+
+or on localhost with: python stomp_broker.py (STOMP_BROKER_PORT, default 61613)
+"""
+import itertools
+import os
+import re
+import socket
+import socketserver
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+STOMP_BROKER_HOST = os.environ.get("STOMP_BROKER_HOST", "127.0.0.1")
+STOMP_BROKER_PORT = int(os.environ.get("STOMP_BROKER_PORT", 61613))
+# frames queued for one client before messages to it are dropped
+STOMP_BROKER_QUEUE_SIZE = int(os.environ.get("STOMP_BROKER_QUEUE_SIZE", 100000))
+
+ACK_MODES = ("auto", "client", "client-individual")
+VERSIONS = ("1.0", "1.1", "1.2")
+
+ESCAPES = {"\\": "\\\\", "\n": "\\n", ":": "\\c", "\r": "\\r"}
+UNESCAPES = {value: key for key, value in ESCAPES.items()}
+UNESCAPE = re.compile(r"\\[\\nrc]")
+
+RECV_SIZE = 1 << 16
+
+
+class StompError(Exception):
+    pass
+
+
+class Frame:
+    __slots__ = ("command", "headers", "body")
+
+    def __init__(
+        self, command: str, headers: Optional[Dict[str, str]] = None, body: bytes = b""
+    ) -> None:
+        self.command = command
+        self.headers = headers or {}
+        self.body = body
+
+    def encode(self, escape: bool = True) -> bytes:
+        headers = dict(self.headers)
+        if self.body:
+            headers["content-length"] = str(len(self.body))
+        lines = [self.command] + [
+            f"{escape_header(key) if escape else key}:"
+            f"{escape_header(value) if escape else value}"
+            for key, value in headers.items()
+        ]
+        return ("\n".join(lines) + "\n\n").encode("utf-8") + self.body + b"\x00"
+
+    def __repr__(self) -> str:
+        return f"Frame(command='{self.command}', headers={self.headers}, body={self.body!r})"
+
+
+def escape_header(value: str) -> str:
+    return "".join(ESCAPES.get(char, char) for char in value)
+
+
+def unescape_header(value: str) -> str:
+    return UNESCAPE.sub(lambda match: UNESCAPES[match.group(0)], value)
+
+
+def parse_frame(buffer: bytearray, escaped: bool = True) -> Optional[Frame]:
+    """
+    Remove the first complete frame from buffer and return it, None if the
+    buffer doesn't hold one yet. Heart-beats (end of lines between frames)
+    are skipped.
+    """
+    start = 0
+    while start < len(buffer) and buffer[start] in b"\r\n":
+        start += 1
+    if start:
+        del buffer[:start]
+
+    end_of_headers = buffer.find(b"\n\n")
+    if end_of_headers < 0:
+        return None
+
+    lines = bytes(buffer[:end_of_headers]).decode("utf-8").split("\n")
+    command = lines[0].rstrip("\r")
+    headers: Dict[str, str] = {}
+    for line in lines[1:]:
+        key, separator, value = line.rstrip("\r").partition(":")
+        if not separator:
+            raise StompError(f"Malformed header line '{line}'")
+        if escaped:
+            key, value = unescape_header(key), unescape_header(value)
+        # the first occurrence of a repeated header wins
+        headers.setdefault(key, value)
+
+    body_start = end_of_headers + 2
+    if "content-length" in headers:
+        body_end = body_start + int(headers["content-length"])
+        if len(buffer) <= body_end:
+            return None
+        if buffer[body_end] != 0:
+            raise StompError("Frame body longer than its content-length")
+    else:
+        body_end = buffer.find(b"\x00", body_start)
+        if body_end < 0:
+            return None
+
+    body = bytes(buffer[body_start:body_end])
+    del buffer[: body_end + 1]
+    return Frame(command, headers, body)
+
+
+def activemq_destination(destination: str) -> str:
+    return re.sub(r",\s*", "-", destination)
+
+
+class Subscription:
+    __slots__ = ("session", "id", "destination", "ack", "pending")
+
+    def __init__(self, session: "StompSession", id_: str, destination: str, ack: str):
+        self.session = session
+        self.id = id_
+        self.destination = destination
+        self.ack = ack
+        # message id -> None, the messages sent and not acknowledged yet
+        self.pending: "OrderedDict[str, None]" = OrderedDict()
+
+    def acknowledge(self, message_id: str) -> bool:
+        if message_id not in self.pending:
+            return False
+
+        if self.ack == "client":
+            # cumulative, acknowledges every message up to this one
+            while self.pending:
+                acknowledged, _ = self.pending.popitem(last=False)
+                if acknowledged == message_id:
+                    break
+        else:
+            del self.pending[message_id]
+        return True
+
+
+class StompSession(socketserver.BaseRequestHandler):
+    """
+    One client connection, created by the StompBroker's server.
+    """
+
+    server: "BrokerServer"
+
+    def setup(self):
+        self.broker: StompBroker = self.server.broker
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # encoded frames for the writer thread, None stops it
+        self.outbox: "deque[Optional[bytes]]" = deque()
+        self.outbox_ready = threading.Condition()
+        self.outbox_closed = False
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.version = "1.0"
+        self.connected = False
+        self.closing = False
+        self.writer = threading.Thread(
+            target=self.write_loop, name=f"stomp-writer-{self.client_address}", daemon=True
+        )
+        self.writer.start()
+        self.broker.register(self)
+
+    def handle(self):
+        buffer = bytearray()
+        try:
+            while not self.closing:
+                data = self.request.recv(RECV_SIZE)
+                if not data:
+                    break
+                buffer += data
+                while not self.closing:
+                    frame = parse_frame(buffer, escaped=self.version != "1.0")
+                    if frame is None:
+                        break
+                    self.dispatch(frame)
+        except StompError as error:
+            self.send_error(str(error))
+        except OSError:
+            pass
+
+    def finish(self):
+        self.broker.unregister(self)
+        for subscription in list(self.subscriptions.values()):
+            self.broker.unsubscribe(subscription)
+        self.subscriptions.clear()
+        # the last receipt or error goes out before the socket is closed
+        with self.outbox_ready:
+            self.outbox_closed = True
+            self.outbox.append(None)
+            self.outbox_ready.notify()
+        self.writer.join()
+
+    def write_loop(self):
+        while True:
+            with self.outbox_ready:
+                while not self.outbox:
+                    self.outbox_ready.wait()
+                frames = list(self.outbox)
+                self.outbox.clear()
+
+            stop = frames[-1] is None
+            try:
+                self.request.sendall(b"".join(frames[:-1] if stop else frames))
+            except OSError:
+                self.closing = True
+                return
+            if stop:
+                return
+
+    def dispatch(self, frame: Frame):
+        if not self.connected and frame.command not in ("CONNECT", "STOMP"):
+            raise StompError(f"Expected CONNECT, received {frame.command}")
+
+        handler = getattr(self, f"on_{frame.command.lower()}", None)
+        if handler is None:
+            raise StompError(f"Unknown command {frame.command}")
+        handler(frame)
+
+        receipt = frame.headers.get("receipt")
+        if receipt is not None:
+            self.send_frame(Frame("RECEIPT", {"receipt-id": receipt}))
+        if frame.command == "DISCONNECT":
+            self.closing = True
+
+    def on_connect(self, frame: Frame):
+        accepted = frame.headers.get("accept-version", "1.0").split(",")
+        versions = [version for version in VERSIONS if version in accepted]
+        if not versions:
+            raise StompError(f"Supported protocol versions are {', '.join(VERSIONS)}")
+
+        self.version = versions[-1]
+        self.connected = True
+        self.send_frame(
+            Frame(
+                "CONNECTED",
+                {
+                    "version": self.version,
+                    "heart-beat": "0,0",
+                    "server": "stomp_broker",
+                    "session": f"session-{id(self)}",
+                },
+            )
+        )
+
+    on_stomp = on_connect
+
+    def on_subscribe(self, frame: Frame):
+        destination = self.required(frame, "destination")
+        ack = frame.headers.get("ack", "auto")
+        if ack not in ACK_MODES:
+            raise StompError(f"Unknown ack mode '{ack}', expected one of {ACK_MODES}")
+
+        # STOMP 1.0 subscriptions may leave out the id
+        id_ = frame.headers.get("id", destination)
+        previous = self.subscriptions.get(id_)
+        if previous is not None:
+            self.broker.unsubscribe(previous)
+
+        subscription = Subscription(self, id_, activemq_destination(destination), ack)
+        self.subscriptions[id_] = subscription
+        self.broker.subscribe(subscription)
+
+    def on_unsubscribe(self, frame: Frame):
+        id_ = frame.headers.get("id") or frame.headers.get("destination")
+        subscription = self.subscriptions.pop(id_, None)
+        if subscription is not None:
+            self.broker.unsubscribe(subscription)
+
+    def on_send(self, frame: Frame):
+        destination = self.required(frame, "destination")
+        headers = {
+            key: value
+            for key, value in frame.headers.items()
+            if key not in ("destination", "receipt", "content-length", "transaction")
+        }
+        self.broker.publish(activemq_destination(destination), headers, frame.body)
+
+    def on_ack(self, frame: Frame):
+        message_id = frame.headers.get("id") or self.required(frame, "message-id")
+        for subscription in self.subscriptions.values():
+            if subscription.acknowledge(message_id):
+                return
+
+    # topics don't redeliver, a NACK only settles the message
+    on_nack = on_ack
+
+    def on_disconnect(self, frame: Frame):
+        pass
+
+    def on_begin(self, frame: Frame):
+        raise StompError("Transactions are not supported")
+
+    def required(self, frame: Frame, header: str) -> str:
+        value = frame.headers.get(header)
+        if value is None:
+            raise StompError(f"{frame.command} frame without a {header} header")
+        return value
+
+    def deliver(self, subscription: Subscription, message_id: str, headers, body: bytes):
+        headers = dict(headers)
+        headers.update(
+            {
+                "destination": subscription.destination,
+                "message-id": message_id,
+                "subscription": subscription.id,
+            }
+        )
+        if subscription.ack != "auto":
+            headers["ack"] = message_id
+            # before it is queued, the client may acknowledge it right away
+            subscription.pending[message_id] = None
+        if not self.send_frame(Frame("MESSAGE", headers, body), droppable=True):
+            subscription.pending.pop(message_id, None)
+            self.broker.count_dropped()
+
+    def send_frame(self, frame: Frame, droppable: bool = False) -> bool:
+        """
+        Queue a frame for the writer thread, returns False if it was dropped
+        because the client is closing or, if droppable, too far behind.
+        """
+        data = frame.encode(escape=self.version != "1.0")
+        with self.outbox_ready:
+            if self.outbox_closed:
+                return False
+            if droppable and len(self.outbox) >= STOMP_BROKER_QUEUE_SIZE:
+                return False
+            self.outbox.append(data)
+            self.outbox_ready.notify()
+        return True
+
+    def send_error(self, message: str):
+        self.send_frame(Frame("ERROR", {"message": message}))
+        self.closing = True
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], broker: "StompBroker") -> None:
+        self.broker = broker
+        super().__init__(address, StompSession)
+
+
+class StompBroker:
+    """
+    Routes the messages sent to a destination to every subscription of it.
+    """
+
+    def __init__(self, host: str = STOMP_BROKER_HOST, port: int = STOMP_BROKER_PORT):
+        self.host = host
+        self.port = port
+        self.topics: Dict[str, List[Subscription]] = {}
+        self.sessions: "set[StompSession]" = set()
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1)
+        self.received = 0
+        self.delivered = 0
+        # messages not delivered to clients too far behind
+        self.dropped = 0
+        self.server: Optional[BrokerServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        if self.server is None:
+            return self.host, self.port
+        return self.server.server_address[:2]
+
+    def start(self) -> "StompBroker":
+        self.server = BrokerServer((self.host, self.port), self)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="stomp-broker", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            try:
+                session.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.server.server_close()
+        self.thread.join()
+        self.server = None
+
+    def register(self, session: StompSession):
+        with self.lock:
+            self.sessions.add(session)
+
+    def unregister(self, session: StompSession):
+        with self.lock:
+            self.sessions.discard(session)
+
+    def subscribe(self, subscription: Subscription):
+        with self.lock:
+            # copy on write, publishing iterates the lists without the lock
+            subscriptions = self.topics.get(subscription.destination, [])
+            self.topics[subscription.destination] = subscriptions + [subscription]
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            subscriptions = self.topics.get(subscription.destination, [])
+            remaining = [other for other in subscriptions if other is not subscription]
+            if remaining:
+                self.topics[subscription.destination] = remaining
+            else:
+                self.topics.pop(subscription.destination, None)
+
+    def publish(self, destination: str, headers: Dict[str, str], body: bytes):
+        message_id = f"ID:stomp_broker-{next(self.message_ids)}"
+        with self.lock:
+            subscriptions = self.topics.get(destination, ())
+            self.received += 1
+            self.delivered += len(subscriptions)
+        for subscription in subscriptions:
+            subscription.session.deliver(subscription, message_id, headers, body)
+
+    def count_dropped(self):
+        with self.lock:
+            self.delivered -= 1
+            self.dropped += 1
+
+    def __enter__(self) -> "StompBroker":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    broker = StompBroker()
+    print(f"STOMP broker listening on {broker.host}:{broker.port}")
+    broker.start()
+    try:
+        broker.thread.join()
+    except KeyboardInterrupt:
+        broker.stop()
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import connection
+from stomp_broker import StompBroker
+
+
+@pytest.fixture(scope="session")
+def broker():
+    """
+    Points make_connection at an in-process STOMP broker, unless ACTIVEMQ_HOST
+    names a real one (e.g. in docker-compose.test.yaml).
+    """
+    if "ACTIVEMQ_HOST" in os.environ:
+        yield None
+        return
+
+    with StompBroker(port=0) as broker:
+        host, port = broker.address
+        previous = connection.ACTIVEMQ_HOST, connection.ACTIVEMQ_PORT
+        connection.ACTIVEMQ_HOST, connection.ACTIVEMQ_PORT = host, port
+        try:
+            yield broker
+        finally:
+            connection.ACTIVEMQ_HOST, connection.ACTIVEMQ_PORT = previous
@@ -9,9 +9,11 @@ from connection import (
 
 from evaluation_plan import (
     AtomicEventType,
+    Consumption,
     NodeEnum,
     Operator,
     Query,
+    Selection,
     Statement,
     StatementParser,
 )
@@ -61,11 +63,11 @@ def test_query_from_string():
     query = Query.from_string(text)
 
     assert query.operator == Operator.AND
-    assert query.operands == [
+    assert query.operands == (
         AtomicEventType("A"),
         AtomicEventType("B"),
         AtomicEventType("C"),
-    ]
+    )
 
 
 def test_nested_query_from_string():
@@ -73,10 +75,10 @@ def test_nested_query_from_string():
     query = Query.from_string(text)
 
     assert query.operator == Operator.SEQ
-    assert query.operands == [
+    assert query.operands == (
         AtomicEventType("A"),
         Query(Operator.AND, [AtomicEventType("B"), AtomicEventType("C")]),
-    ]
+    )
 
 
 def test_nested_query_from_string_two():
@@ -84,7 +86,7 @@ def test_nested_query_from_string_two():
     query = Query.from_string(text)
 
     assert query.operator == Operator.SEQ
-    assert query.operands == [
+    assert query.operands == (
         AtomicEventType("A"),
         Query(Operator.AND, [AtomicEventType("B"), AtomicEventType("C")]),
         AtomicEventType("D"),
@@ -100,7 +102,156 @@ def test_nested_query_from_string_two():
             ],
         ),
         AtomicEventType("J"),
-    ]
+    )
+
+
+def test_query_nodes_are_interned():
+    query = Query.from_string("SEQ(A, AND(B, C), AND(B,C))")
+    other = Query.from_string("AND(E, AND(B, C))")
+
+    assert query.operands[1] is query.operands[2] is other.operands[1]
+    assert Query.from_string("SEQ(A, AND(B, C), AND(B, C))") is query
+    assert len({query, Query(Operator.SEQ, query.operands)}) == 1
+    assert query.topic == "SEQ(A, AND(B, C), AND(B, C))"
+
+
+def test_query_is_immutable():
+    query = Query.from_string("SEQ(A, B)")
+
+    with pytest.raises(AttributeError):
+        query.operator = Operator.AND
+    with pytest.raises(AttributeError):
+        query.operands.append(AtomicEventType.C)
+
+
+@pytest.mark.parametrize(
+    "text, canonical",
+    [
+        ("AND(SEQ(J, A), E)", "AND(E, SEQ(J, A))"),
+        ("AND(C, E, B, D, F)", "AND(B, C, D, E, F)"),
+        ("AND(B, AND(C, E, D, F))", "AND(B, C, D, E, F)"),
+        ("SEQ(J, A)", "SEQ(J, A)"),
+        ("SEQ(AND(E, C), A)", "SEQ(AND(C, E), A)"),
+        ("AND(A, SEQ(B, AND(D, AND(C, A))))", "AND(A, SEQ(B, AND(A, C, D)))"),
+    ],
+)
+def test_query_canonical_topic(text, canonical):
+    query = Query.from_string(text)
+
+    assert query.topic == canonical
+    assert query.canonical is Query.from_string(canonical)
+    assert query.canonical.canonical is query.canonical
+
+
+def test_statement_is_canonical():
+    statement = StatementParser(
+        "SELECT AND(SEQ(J, A), E) FROM SEQ(J, A), E ON {9}"
+    ).parse()
+
+    assert statement.query is Query.from_string("AND(E, SEQ(J, A))")
+    assert statement == StatementParser(
+        "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}"
+    ).parse()
+
+
+def test_statement_evaluation_query_regroups_inputs():
+    statement = StatementParser(
+        "SELECT AND(C, E, B, D, F) FROM B, AND(C, E, D, F) ON {0}"
+    ).parse()
+
+    assert statement.query.topic == "AND(B, C, D, E, F)"
+    assert statement.evaluation_query.operands == (
+        Query.from_string("AND(C, D, E, F)"),
+        AtomicEventType.B,
+    )
+    assert statement.evaluation_query.topic == statement.query.topic
+
+
+def test_statement_evaluation_query_keeps_other_queries():
+    statement = StatementParser(
+        "SELECT AND(E, SEQ(C, J, A)) FROM AND(E, SEQ(J, A)), C ON {5}"
+    ).parse()
+
+    assert statement.evaluation_query is statement.query
+
+
+def test_statement_parser_partitioned():
+    statement = StatementParser(
+        "SELECT SEQ(J, A) FROM J, A ON {4, 6, 7} PARTITIONED"
+    ).parse()
+
+    assert statement.partitioned
+    assert [statement.shard(node) for node in (4, 6, 7)] == [(0, 3), (1, 3), (2, 3)]
+    assert str(statement) == "SELECT SEQ(J, A) FROM J, A ON {4, 6, 7} PARTITIONED"
+    assert "e1=cseEventStream[symbol == 'J' and eventId % 3 == 1]" in (
+        statement.query.to_siddhi_query(shard=statement.shard(6))
+    )
+
+    replicated = StatementParser("SELECT SEQ(J, A) FROM J, A ON {4, 6}").parse()
+    assert not replicated.partitioned
+    assert replicated.shard(4) is None
+
+    # their replicas would each need every event and pick events on their own
+    for text in [
+        "SELECT AND(E, F) FROM E, F ON {4, 6} PARTITIONED",
+        "SELECT SEQ(J, A) FROM J, A ON {4, 6} PARTITIONED POLICY CONSUME",
+        "SELECT SEQ(J, A) FROM J, A ON {4, 6} POLICY LAST PARTITIONED",
+    ]:
+        with pytest.raises(ValueError):
+            StatementParser(text).parse()
+    assert StatementParser(
+        "SELECT SEQ(J, A) FROM J, A ON {4, 6} PARTITIONED POLICY EACH REUSE"
+    ).parse().partitioned
+
+
+def test_statement_parser_within():
+    statement = StatementParser(
+        "SELECT AND(E, F) FROM E, F ON {4, 6} WITHIN 1.5s"
+    ).parse()
+
+    assert statement.within_ms == 1500
+    assert str(statement) == "SELECT AND(E, F) FROM E, F ON {4, 6} WITHIN 1500ms"
+    # checked once over the event times of the match, see to_siddhi_and_query
+    assert "[eventTime - minEventTime <= 1500]" in statement.query.to_siddhi_query(
+        within_ms=statement.within_ms
+    )
+    assert StatementParser("SELECT SEQ(J, A) FROM J, A ON {4} WITHIN 2 min").parse().within_ms == 120000
+
+    with pytest.raises(ValueError):
+        StatementParser("SELECT SEQ(J, A) FROM J, A ON {4} WITHIN soon").parse()
+    with pytest.raises(ValueError):
+        StatementParser("SELECT SEQ(J, A) FROM J, A ON {4} EVENTUALLY").parse()
+
+
+def test_statement_parser_policy():
+    statement = StatementParser(
+        "SELECT SEQ(J, A) FROM J, A ON {4} WITHIN 1s POLICY FIRST CONSUME"
+    ).parse()
+
+    assert statement.policy == (Selection.FIRST, Consumption.CONSUME)
+    assert str(statement) == "SELECT SEQ(J, A) FROM J, A ON {4} WITHIN 1s POLICY FIRST CONSUME"
+    app = statement.query.to_siddhi_query(policy=statement.policy)
+    assert "from every (e1=" in app
+
+    # an unset part of the policy falls back to the default of the operator
+    statement = StatementParser("SELECT AND(E, F) FROM E, F ON {4} POLICY EACH").parse()
+    assert statement.policy == (Selection.EACH, Consumption.CONSUME)
+    assert str(statement) == "SELECT AND(E, F) FROM E, F ON {4} POLICY EACH"
+    with pytest.raises(ValueError):
+        statement.query.to_siddhi_query(policy=statement.policy)
+
+    for clause in ["POLICY", "POLICY FIRST LAST", "POLICY ALL", "POLICY LASTING"]:
+        with pytest.raises(ValueError):
+            StatementParser(f"SELECT SEQ(J, A) FROM J, A ON {{4}} {clause}").parse()
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["OR(A, B)", "AND(A, B", "AND(A, B))", "AND(A,, B)", "AND(A, Z)", "AND(A; B)", "A"],
+)
+def test_query_from_string_raises(text):
+    with pytest.raises(ValueError):
+        Query.from_string(text)
 
 
 def test_statement_parser():
@@ -141,14 +292,14 @@ def test_statement_parser_two():
     )
 
 
-def test_connection():
+def test_connection(broker):
     # smoke test
     conn = make_connection()
     time.sleep(0.01)
     conn.disconnect()
 
 
-def test_activemq_with_statement(capsys):
+def test_activemq_with_statement(broker, capsys):
     statement = "SELECT AND(E, SEQ(C, J, A)) FROM AND(E, SEQ(J, A)), C ON {5, 9}"
     parser = StatementParser(statement=statement)
     statement = parser.parse()
@@ -167,8 +318,12 @@ def test_activemq_with_statement(capsys):
         node = ActiveMQNode(id_=node.value, statements=[statement])
         node.send(f"Hello from Node {node.id}", topic=topic)
 
-    time.sleep(0.05)
-    captured = capsys.readouterr().out
+    # frames reach the listener from the broker's writer threads
+    captured = ""
+    deadline = time.monotonic() + 5
+    while "Hello from Node 9" not in captured and time.monotonic() < deadline:
+        time.sleep(0.05)
+        captured += capsys.readouterr().out
 
     assert "Hello from Node 5" in captured
     assert "Hello from Node 9" in captured
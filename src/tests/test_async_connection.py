@@ -0,0 +1,176 @@
+import asyncio
+import socket
+
+import connection
+from async_connection import AsyncActiveMQNode, AsyncStompConnection, Outbox
+from atomicEventProducer import AsyncAtomicEventProducer
+from envelope import Envelope
+from evaluation_plan import StatementParser
+from node_host import NodeHost
+from python_connection import AsyncPythonActiveMQNode
+from replay import ReplayScheduler
+
+
+class RecordingNode(AsyncActiveMQNode):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.received = []
+
+    async def hand_off(self, envelopes):
+        self.received.extend(envelopes)
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(asyncio.wait_for(coroutine, 10))
+    finally:
+        loop.close()
+
+
+async def wait_for(condition, timeout=5):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_event_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def broker_address():
+    return connection.ACTIVEMQ_HOST, int(connection.ACTIVEMQ_PORT)
+
+
+def test_outbox_groups_by_topic():
+    outbox = Outbox()
+    outbox.publish("a", topic="/topic/A")
+    outbox.publish("j", topic="/topic/J")
+    outbox.publish("b", topic="/topic/A")
+
+    assert outbox.take() == {"/topic/A": ["a", "b"], "/topic/J": ["j"]}
+    assert len(outbox) == 0
+
+
+def test_nodes_share_one_connection(broker):
+    async def scenario():
+        shared = AsyncStompConnection(broker_address())
+        nodes = [RecordingNode(id_=id_, activemq_connection=shared) for id_ in (4, 9)]
+        assert not shared.is_connected
+
+        await nodes[0].subscribe("/topic/J")
+        await nodes[1].subscribe("/topic/A")
+        # the receipt confirms the subscriptions sent before it
+        assert await shared.send_confirmed("J", "/topic/J", timeout=5)
+        await nodes[1].send_batch(
+            [Envelope.atomic("A", producer_id=1) for _ in range(3)], topic="/topic/A"
+        )
+        await wait_for(lambda: len(nodes[1].received) == 3)
+
+        assert [envelope.symbol for envelope in nodes[0].received] == ["J"]
+        assert shared.connects == 1
+
+        for node in nodes:
+            await node.disconnect()
+        # left to the owner of the shared connection
+        assert shared.is_connected
+        await shared.disconnect()
+        assert not shared.is_connected
+
+    run(scenario())
+
+
+def test_connection_reconnects_and_resubscribes(broker):
+    async def scenario():
+        node = RecordingNode(id_=4)
+        await node.subscribe("/topic/J")
+        dropped = node.activemq_connection.writer
+        address = dropped.get_extra_info("sockname")
+        (session,) = [
+            session
+            for session in list(broker.sessions)
+            if session.client_address == address
+        ]
+
+        # the broker drops the connection
+        session.request.shutdown(socket.SHUT_RDWR)
+        await wait_for(lambda: node.activemq_connection.connects == 2)
+        assert dropped.transport.is_closing()
+
+        activemq_connection = node.activemq_connection
+        assert await activemq_connection.send_confirmed("J", "/topic/J", timeout=5)
+        await wait_for(lambda: len(node.received) == 1)
+        await node.disconnect()
+
+    run(scenario())
+
+
+def test_hundreds_of_subscriptions_on_one_loop(broker):
+    async def scenario():
+        node = RecordingNode(id_=7)
+        topics = [f"/topic/bench.{index}" for index in range(300)]
+        for topic in topics:
+            await node.subscribe(topic)
+        activemq_connection = node.activemq_connection
+        assert await activemq_connection.send_confirmed("x", topics[0], timeout=5)
+
+        for topic in topics:
+            await node.send("event", topic=topic)
+        await wait_for(lambda: len(node.received) == len(topics) + 1)
+
+        await node.disconnect()
+
+    run(scenario())
+
+
+def test_python_node_and_producer_on_one_loop(broker):
+    statement = StatementParser("SELECT SEQ(J, A) FROM J, A ON {4}").parse()
+    topic = f"/topic/{statement.query.topic}"
+
+    async def scenario():
+        shared = AsyncStompConnection(broker_address())
+        node = AsyncPythonActiveMQNode(
+            id_=4, statements=[statement], activemq_connection=shared
+        )
+        sink = RecordingNode(id_=1, activemq_connection=shared)
+        producer = AsyncAtomicEventProducer(
+            id_=0,
+            eventIntervalsFileName=None,
+            eventTimestamps=[(0, "J"), (1, "A"), (2, "J"), (3, "A")],
+            activemq_connection=shared,
+        )
+
+        await sink.subscribe(topic)
+        await node.start()
+        assert await producer.wait_for_nodes({4}, timeout=5) == set()
+
+        report = await producer.pushEvents(ReplayScheduler(mode="max-rate"))
+        assert report.events == 4
+        await wait_for(lambda: len(sink.received) == 2)
+        assert {envelope.symbol for envelope in sink.received} == {
+            statement.query.topic
+        }
+
+        await node.stop()
+        await sink.disconnect()
+        await producer.disconnect()
+        await shared.disconnect()
+
+    run(scenario())
+
+
+def test_host_runs_its_nodes_on_one_loop(broker):
+    statements = [
+        StatementParser(statement).parse()
+        for statement in [
+            "SELECT SEQ(J, A) FROM J, A ON {4}",
+            "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
+        ]
+    ]
+    host = NodeHost([4, 9], statements, engine="python", runtime="asyncio")
+    host.start()
+
+    producer = AsyncActiveMQNode(id_=0, activemq_connection=host.activemq_connection)
+    missing = host.loop.run_until_complete(producer.wait_for_nodes({4, 9}, timeout=5))
+    assert missing == set()
+    assert host.activemq_connection.connects == 1
+
+    host.loop.run_until_complete(producer.disconnect())
+    host.stop()
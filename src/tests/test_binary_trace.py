@@ -0,0 +1,56 @@
+import pytest
+
+from binary_trace import BinaryTrace, convert_csv_trace, write_binary_trace
+from trace_source import EVENT_TYPE_CODES, TraceSource, read_csv_trace
+
+
+def test_binary_trace_roundtrip(tmp_path):
+    path = tmp_path / "trace.trace"
+    events = [(500, 0), (1000, 6), (1000, 4), (2 ** 40, 1)]
+
+    assert write_binary_trace(path, iter(events)) == len(events)
+
+    with BinaryTrace(path) as trace:
+        assert len(trace) == 4
+        assert list(trace) == events
+        assert trace.timestamps[3] == 2 ** 40
+    assert list(TraceSource(path)) == events
+
+
+def test_binary_trace_wide_codes(tmp_path):
+    path = tmp_path / "trace.trace"
+
+    write_binary_trace(path, [(1, 300), (2, 7)], code_width=2)
+
+    assert list(TraceSource(path)) == [(1, 300), (2, 7)]
+    with pytest.raises(ValueError):
+        write_binary_trace(path, [(1, 300)])
+
+
+def test_convert_combined_csv(tmp_path):
+    csv_path = tmp_path / "combined.csv"
+    csv_path.write_text("500,A\r\n1000,J\r\n1000,E\r\n")
+
+    binary_path = convert_csv_trace(csv_path)
+
+    assert binary_path.suffix == ".trace"
+    assert list(TraceSource(binary_path)) == list(read_csv_trace(csv_path))
+
+
+def test_convert_single_row_csv(tmp_path):
+    csv_path = tmp_path / "atomicEvents_E_timestamps.csv"
+    timestamps = list(range(7, 10 ** 6, 7))
+    csv_path.write_text(",".join(map(str, timestamps)) + "\r\n")
+
+    binary_path = convert_csv_trace(csv_path)
+
+    code = EVENT_TYPE_CODES["E"]
+    assert list(TraceSource(binary_path)) == [(t, code) for t in timestamps]
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / "trace.trace"
+    path.write_bytes(b"not a trace at all")
+
+    with pytest.raises(ValueError):
+        BinaryTrace(path)
@@ -0,0 +1,107 @@
+import socket
+import threading
+import time
+
+import pytest
+import stomp
+
+from connection import ActiveMQNode
+from connection_pool import ConnectionPool, backoff_delays, retry_with_backoff
+
+
+class RecordingNode(ActiveMQNode):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.received = []
+        self.arrived = threading.Event()
+
+    def on_message(self, message):
+        self.received.extend(self.receive_message(message))
+        self.arrived.set()
+
+
+def test_backoff_delays_double_up_to_the_maximum():
+    delays = backoff_delays(0.1, 0.5)
+    assert [next(delays) for _ in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+
+
+def test_retry_with_backoff():
+    calls = []
+    sleeps = []
+
+    def attempt():
+        calls.append(1)
+        if len(calls) < 3:
+            raise stomp.exception.ConnectFailedException()
+        return "connected"
+
+    assert retry_with_backoff(attempt, attempts=5, sleep=sleeps.append) == "connected"
+    assert len(sleeps) == 2 and sleeps[1] == 2 * sleeps[0]
+
+    calls.clear()
+    with pytest.raises(stomp.exception.ConnectFailedException):
+        retry_with_backoff(attempt, attempts=2, sleep=sleeps.append)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_nodes_share_a_lazily_opened_connection(broker):
+    pool = ConnectionPool(size=1)
+    nodes = [RecordingNode(id_=id_, connection_pool=pool) for id_ in (4, 9)]
+    assert len(pool) == 0
+
+    nodes[0].subscribe("/topic/J")
+    nodes[1].subscribe("/topic/A")
+    connection = nodes[0].activemq_connection
+    assert connection is nodes[1].activemq_connection
+    assert len(pool) == 1 and connection.connects == 1
+
+    nodes[0].send("A", topic="/topic/A")
+    assert nodes[1].arrived.wait(5)
+    # the frame only goes to the node owning the subscription
+    assert [envelope.symbol for envelope in nodes[1].received] == ["A"]
+    assert nodes[0].received == []
+
+    for node in nodes:
+        node.disconnect()
+    assert len(pool) == 0 and not connection.is_connected
+
+
+def test_pool_keeps_one_connection_per_broker():
+    pool = ConnectionPool(size=1)
+    nodes = [RecordingNode(id_=id_, connection_pool=pool) for id_ in (4, 9)]
+    first = pool.acquire(nodes[0], ("localhost", 61613))
+    second = pool.acquire(nodes[1], ("localhost", 61614))
+
+    assert first is not second and len(pool) == 2
+    assert pool.acquire(nodes[1], ("localhost", 61613)) is first
+
+    pool.release(nodes[1], ("localhost", 61614))
+    assert len(pool) == 1
+    pool.release(nodes[1], ("localhost", 61613))
+    assert len(pool) == 1 and first.listeners == {nodes[0]}
+    pool.release(nodes[0], ("localhost", 61613))
+    assert len(pool) == 0
+
+
+def test_pooled_connection_reconnects_and_resubscribes(broker):
+    pool = ConnectionPool(size=1)
+    node = RecordingNode(id_=4, connection_pool=pool)
+    node.subscribe("/topic/J")
+    address = node.activemq_connection.connection.transport.socket.getsockname()
+    (session,) = [
+        session for session in list(broker.sessions) if session.client_address == address
+    ]
+
+    # the broker drops the connection
+    session.request.shutdown(socket.SHUT_RDWR)
+    wait_for(lambda: node.activemq_connection.connects == 2)
+
+    node.send("J", topic="/topic/J")
+    assert node.arrived.wait(5)
+    node.disconnect()
@@ -0,0 +1,52 @@
+from dedup import DuplicateFilter
+from envelope import Envelope
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_replicated_composites_are_duplicates():
+    duplicates = DuplicateFilter(size=10, ttl=60)
+    parts = [Envelope.atomic("J", producer_id=1), Envelope.atomic("A", producer_id=1)]
+
+    # two replicas computing the same match
+    first = Envelope.from_parts("SEQ(J, A)", producer_id=4, parts=parts)
+    second = Envelope.from_parts("SEQ(J, A)", producer_id=6, parts=parts)
+
+    assert not duplicates.is_duplicate(first.event_id)
+    assert duplicates.is_duplicate(second.event_id)
+    assert (duplicates.passed, duplicates.dropped) == (1, 1)
+
+
+def test_memory_is_bounded():
+    duplicates = DuplicateFilter(size=3, ttl=60)
+
+    for event_id in range(10):
+        assert not duplicates.is_duplicate(event_id)
+
+    assert len(duplicates) == 3
+    # the oldest ids were evicted, the newest are still known
+    assert not duplicates.is_duplicate(0)
+    assert duplicates.is_duplicate(9)
+
+
+def test_ids_expire():
+    clock = FakeClock()
+    duplicates = DuplicateFilter(size=10, ttl=5, clock=clock)
+
+    duplicates.is_duplicate(1)
+    clock.now = 3
+    duplicates.is_duplicate(2)
+
+    clock.now = 6
+    assert not duplicates.is_duplicate(1)
+    assert duplicates.is_duplicate(2)  # seen again, expires at 11 now
+
+    clock.now = 10
+    assert duplicates.is_duplicate(2)
+    assert len(duplicates) == 2
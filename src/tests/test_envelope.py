@@ -0,0 +1,62 @@
+from stomp.utils import Frame
+
+from connection import BATCH_HEADER, ActiveMQNode
+from envelope import HEADER, Envelope, EventCache, is_envelope
+
+
+def test_envelope_roundtrip():
+    envelope = Envelope.atomic("A", producer_id=3, event_time=1234)
+    encoded = envelope.encode()
+
+    assert is_envelope(encoded)
+    assert len(encoded) == HEADER.size + 1
+    assert Envelope.decode(encoded) == envelope
+    assert envelope.constituent_ids == (envelope.event_id,)
+
+
+def test_composite_envelope_roundtrip():
+    parts = [Envelope.atomic(symbol, producer_id=0) for symbol in "JA"]
+    composite = Envelope.from_parts("SEQ(J, A)", producer_id=4, parts=parts)
+
+    assert composite.constituents == tuple(sorted(p.event_id for p in parts))
+    assert composite.event_time == max(p.event_time for p in parts)
+    assert Envelope.decode(composite.encode()) == composite
+
+
+def test_composite_event_id_is_deterministic():
+    parts = [Envelope.atomic(symbol, producer_id=0) for symbol in "JA"]
+
+    # the same match computed on two replicas gets the same id
+    on_node_4 = Envelope.from_parts("SEQ(J, A)", producer_id=4, parts=parts)
+    on_node_9 = Envelope.from_parts("SEQ(J, A)", producer_id=9, parts=parts[::-1])
+    other_topic = Envelope.from_parts("AND(J, A)", producer_id=4, parts=parts)
+
+    assert on_node_4.event_id == on_node_9.event_id
+    assert on_node_4.event_id != other_topic.event_id
+
+
+def test_unpack_envelope_batch():
+    envelopes = [Envelope.atomic("E", producer_id=0), Envelope.atomic("C", producer_id=0)]
+    body = b"".join(envelope.encode() for envelope in envelopes)
+    frame = Frame("MESSAGE", {BATCH_HEADER: "2"}, body)
+
+    assert ActiveMQNode.unpack_message(frame) == envelopes
+
+
+def test_event_cache_resolves_constituents():
+    cache = EventCache(size=2)
+    atomic = Envelope.atomic("J", producer_id=0)
+    composite = Envelope.composite("SEQ(J, A)", 4, constituents=[7, 8], event_time=0)
+
+    cache.add(atomic)
+    cache.add(composite)
+    assert cache.constituents([atomic.event_id, composite.event_id]) == [
+        atomic.event_id,
+        7,
+        8,
+    ]
+
+    # evicted or unknown ids stand for themselves
+    cache.add(Envelope.atomic("A", producer_id=0))
+    assert len(cache) == 2
+    assert cache.constituents([atomic.event_id]) == [atomic.event_id]
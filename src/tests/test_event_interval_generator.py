@@ -0,0 +1,67 @@
+import csv
+
+from eventIntervalGenerator import EventIntervaldGenerator
+
+
+def legacy_merge(eventIntervalsByType, totalTimeInMs):
+    # the per-millisecond scan the merge replaces
+    combined = []
+    for ms in range(totalTimeInMs):
+        for eventType, eventIntervals in eventIntervalsByType.items():
+            if ms in eventIntervals:
+                combined.append([ms, eventType])
+    return combined
+
+
+def test_merge_matches_per_millisecond_scan():
+    generator = EventIntervaldGenerator()
+    totalTimeInMs = 20000
+    eventIntervalsByType = {
+        "A": list(generator.iter_random_event_intervals(totalTimeInMs, 50, 3000, seed=1)),
+        "B": list(generator.iter_fixed_event_intervals(totalTimeInMs, 500)),
+        "C": list(generator.iter_random_event_intervals(totalTimeInMs, 1, 400, seed=2)),
+        "J": list(generator.iter_fixed_event_intervals(totalTimeInMs, 1000)),
+    }
+
+    merged = list(generator.merge_event_intervals(eventIntervalsByType, totalTimeInMs))
+
+    assert merged == legacy_merge(eventIntervalsByType, totalTimeInMs)
+
+
+def test_equal_timestamps_keep_type_order():
+    generator = EventIntervaldGenerator()
+    merged = generator.merge_event_intervals(
+        {"A": [10, 20], "E": [10], "J": [5, 10]}, totalTimeInMs=100
+    )
+
+    assert list(merged) == [[5, "J"], [10, "A"], [10, "E"], [10, "J"], [20, "A"]]
+
+
+def test_seeded_intervals_are_reproducible(tmp_path):
+    generator = EventIntervaldGenerator()
+    filename = str(tmp_path / "A.csv")
+
+    count = generator.generate_random_event_intervals(100000, 500, 3000, filename, seed="7-A")
+
+    with open(filename) as f:
+        written = [int(timestamp) for timestamp in next(csv.reader(f))]
+    assert len(written) == count
+    assert written == list(generator.iter_random_event_intervals(100000, 500, 3000, seed="7-A"))
+
+
+def test_combined_trace_is_written_incrementally(tmp_path):
+    generator = EventIntervaldGenerator()
+    filename = str(tmp_path / "combined.csv")
+    merged = generator.merge_event_intervals(
+        {
+            "A": generator.iter_fixed_event_intervals(10 ** 6, 7),
+            "B": generator.iter_fixed_event_intervals(10 ** 6, 11),
+        },
+        10 ** 6,
+    )
+
+    generator.writeCombinedEventIntervalsToFile(merged, filename)
+
+    with open(filename) as f:
+        rows = sum(1 for _ in f)
+    assert rows == (10 ** 6 - 1) // 7 + (10 ** 6 - 1) // 11
@@ -0,0 +1,50 @@
+import threading
+
+import pytest
+
+from ingest import IngestQueue
+
+
+def test_ingest_queue_drains_in_order_and_in_batches():
+    batches = []
+    ingest = IngestQueue(batches.append, batch_size=4)
+
+    for item in range(10):
+        ingest.put(item)
+    ingest.start()
+    ingest.stop()
+
+    assert [item for batch in batches for item in batch] == list(range(10))
+    assert max(len(batch) for batch in batches) <= 4
+    assert ingest.depth == 0
+
+
+def test_ingest_queue_drop_policy():
+    release = threading.Event()
+    batches = []
+
+    def slow_handler(batch):
+        release.wait()
+        batches.append(batch)
+
+    ingest = IngestQueue(slow_handler, queue_size=2, policy="drop", batch_size=1)
+    ingest.start()
+
+    ingest.put("first")  # taken by the worker, which then blocks
+    while ingest.depth:
+        pass
+    assert ingest.put("second")
+    assert ingest.put("third")
+    assert not ingest.put("fourth")
+
+    assert ingest.depth == 2
+    assert ingest.dropped == 1
+
+    release.set()
+    ingest.stop()
+    assert batches == [["first"], ["second"], ["third"]]
+
+
+def test_ingest_queue_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        IngestQueue(print, policy="spill")
@@ -0,0 +1,76 @@
+from connection import ActiveMQNode, local_topics
+from envelope import Envelope
+from evaluation_plan import StatementParser
+from python_connection import PythonActiveMQNode
+
+PLAN = [
+    StatementParser(statement).parse()
+    for statement in [
+        "SELECT SEQ(J, A) FROM J, A ON {4}",
+        "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {4}",
+        "SELECT AND(C, D, E, F) FROM C, D, E, F ON {2, 4}",
+        "SELECT AND(B, C, D, E, F) FROM B, AND(C, D, E, F) ON {2, 4}",
+        "SELECT SEQ(C, J) FROM C, J ON {4, 6} PARTITIONED",
+        "SELECT AND(B, SEQ(C, J)) FROM B, SEQ(C, J) ON {4}",
+    ]
+]
+
+
+class RecordingPublisher:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, message, topic):
+        self.published.append((topic, message))
+
+
+def test_local_topics():
+    seq_j_a, _, and_c, _, seq_c_j, and_b_seq = PLAN
+
+    # a replica of a partitioned SEQ only computes its shard
+    assert local_topics(PLAN[:4], 4) == {seq_j_a.query.topic, and_c.query.topic}
+    assert local_topics([seq_c_j, and_b_seq], 4) == set()
+    assert local_topics([seq_j_a], 4) == set()
+
+
+def test_node_skips_local_subscriptions_and_publications():
+    node = ActiveMQNode(id_=4, statements=PLAN[:4], plan=PLAN)
+    seq_j_a, and_e, and_c, and_b = (statement.query.topic for statement in PLAN[:4])
+
+    assert f"/topic/{seq_j_a}" not in node.topic_subscriptions
+    assert f"/topic/{and_c}" not in node.topic_subscriptions
+    # node 2 consumes AND(C, D, E, F) locally as well
+    assert not node.publishes(seq_j_a)
+    assert not node.publishes(and_c)
+    # results of the plan
+    assert node.publishes(and_e)
+    assert node.publishes(and_b)
+
+    # the node subscribes to the shards of the partitioned SEQ on the broker,
+    # so it has to publish its own one as well
+    seq_c_j = PLAN[4].query.topic
+    partitioned = ActiveMQNode(id_=4, statements=[PLAN[4], PLAN[5]], plan=PLAN)
+    assert f"/topic/{seq_c_j}" in partitioned.topic_subscriptions
+    assert partitioned.publishes(seq_c_j)
+
+    # without the plan every output goes to the broker
+    assert ActiveMQNode(id_=4, statements=PLAN[:4]).publishes(seq_j_a)
+
+
+def test_python_node_hands_matches_to_its_own_statements():
+    node = PythonActiveMQNode(id_=4, statements=PLAN[:2], plan=PLAN[:2])
+    node.publisher = RecordingPublisher()
+    node.bootstrap_engine()
+
+    node.process_batch(
+        [
+            (Envelope.atomic(symbol, producer_id=0, event_time=time), 0.0)
+            for time, symbol in enumerate("JAE")
+        ]
+    )
+
+    topic = PLAN[1].query.topic
+    assert [published[0] for published in node.publisher.published] == [
+        f"/topic/{topic}"
+    ]
+    assert node.metrics.counters[("local", PLAN[0].query.topic)] == 1
@@ -0,0 +1,224 @@
+from envelope import Envelope
+from evaluation_plan import Consumption, Query, Selection, StatementParser
+from matching_engine import AndMatcher, MatchingEngine, SeqMatcher
+
+
+def test_seq_matcher_every_start_event_opens_a_partial_match():
+    matcher = SeqMatcher(Query.from_string("SEQ(J, A)"))
+
+    assert matcher.process("J", "J1") == []
+    assert matcher.process("J", "J2") == []
+    assert matcher.partial_matches == 2
+
+    assert matcher.process("A", "A1") == [("J1", "A1"), ("J2", "A1")]
+    assert matcher.partial_matches == 0
+
+    # partial matches are consumed when they complete
+    assert matcher.process("A", "A2") == []
+
+
+def test_seq_matcher_keeps_order():
+    matcher = SeqMatcher(Query.from_string("SEQ(C, J, A)"))
+
+    events = [("A", "A1"), ("J", "J1"), ("C", "C1"), ("A", "A2"), ("J", "J2")]
+    assert [m for symbol, event in events for m in matcher.process(symbol, event)] == []
+
+    assert matcher.process("A", "A3") == [("C1", "J2", "A3")]
+
+
+def test_seq_matcher_repeated_operand():
+    matcher = SeqMatcher(Query.from_string("SEQ(A, A)"))
+
+    assert matcher.process("A", "A1") == []
+    assert matcher.process("A", "A2") == [("A1", "A2")]
+    assert matcher.process("A", "A3") == [("A2", "A3")]
+
+
+def test_and_matcher_matches_in_any_order():
+    matcher = AndMatcher(Query.from_string("AND(C, E, D, F)"))
+
+    for symbol in ["F", "E", "F", "C"]:
+        assert matcher.process(symbol, f"{symbol}1") == []
+    assert matcher.partial_matches == 1
+
+    assert matcher.process("D", "D1") == [("C1", "E1", "D1", "F1")]
+    assert matcher.partial_matches == 0
+
+
+def test_matching_engine_publishes_statement_topics():
+    statements = [
+        StatementParser("SELECT SEQ(J, A) FROM J, A ON {4}").parse(),
+        StatementParser("SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}").parse(),
+    ]
+    matches = []
+    engine = MatchingEngine(statements, callback=lambda topic, _: matches.append(topic))
+
+    for symbol in ["J", "E", "A", "SEQ(J, A)"]:
+        engine.send(symbol)
+
+    assert matches == ["SEQ(J, A)", "AND(E, SEQ(J, A))"]
+    assert engine.partial_matches == {"SEQ(J, A)": 0, "AND(E, SEQ(J, A))": 0}
+
+
+def test_partitioned_seq_replicas_split_partial_matches():
+    statement = StatementParser(
+        "SELECT SEQ(J, A) FROM J, A ON {4, 6, 7} PARTITIONED"
+    ).parse()
+    events = [
+        Envelope.atomic(symbol, producer_id=1)
+        for symbol in ["J", "J", "A", "J", "J", "J", "A", "A", "J"]
+    ]
+
+    def run(node_id):
+        matches = []
+        engine = MatchingEngine(
+            [statement], callback=lambda _, match: matches.append(match), node_id=node_id
+        )
+        for event in events:
+            engine.send(event.symbol, event)
+        return matches, engine.partial_matches["SEQ(J, A)"]
+
+    def ids(matches):
+        return sorted(tuple(event.event_id for event in match) for match in matches)
+
+    unpartitioned, _ = run(None)
+    replicas = [run(node_id) for node_id in (4, 6, 7)]
+
+    # every match is found by exactly one replica, none is lost
+    assert ids(m for matches, _ in replicas for m in matches) == ids(unpartitioned)
+    assert all(matches for matches, _ in replicas)
+    assert sum(partial for _, partial in replicas) == 1
+
+
+def test_seq_matcher_window_expires_partial_matches():
+    matcher = SeqMatcher(Query.from_string("SEQ(J, A)"), within_ms=30000)
+
+    def event(symbol, event_time):
+        return Envelope(symbol, event_time, event_id=event_time, producer_id=1)
+
+    assert matcher.process("J", event("J", 0)) == []
+    assert matcher.process("J", event("J", 20000)) == []
+    assert matcher.partial_matches == 2
+
+    # the first J is more than 30s older than this A
+    matches = matcher.process("A", event("A", 40000))
+    assert [tuple(e.event_time for e in match) for match in matches] == [(20000, 40000)]
+
+    matcher.process("J", event("J", 50000))
+    assert matcher.partial_matches == 1
+    assert matcher.process("J", event("J", 90000)) == []
+    assert matcher.partial_matches == 1
+
+
+def test_and_matcher_window_forgets_old_events():
+    matcher = AndMatcher(Query.from_string("AND(E, F)"), within_ms=5000)
+
+    def event(symbol, event_time):
+        return Envelope(symbol, event_time, event_id=event_time, producer_id=1)
+
+    assert matcher.process("E", event("E", 0)) == []
+    assert matcher.process("F", event("F", 6000)) == []
+    assert matcher.partial_matches == 1
+
+    match = matcher.process("E", event("E", 9000))
+    assert [e.event_time for e in match[0]] == [9000, 6000]
+
+
+def test_matching_engine_applies_statement_window():
+    statement = StatementParser("SELECT SEQ(J, A) FROM J, A ON {4} WITHIN 1s").parse()
+    matches = []
+    engine = MatchingEngine([statement], callback=lambda topic, _: matches.append(topic))
+
+    engine.send("J", Envelope("J", 0, event_id=1, producer_id=1))
+    engine.send("A", Envelope("A", 1500, event_id=2, producer_id=1))
+
+    assert matches == []
+    assert engine.partial_matches == {"SEQ(J, A)": 0}
+
+
+def test_seq_matcher_first_selection_runs_one_match_at_a_time():
+    matcher = SeqMatcher(
+        Query.from_string("SEQ(J, A)"), policy=(Selection.FIRST, Consumption.REUSE)
+    )
+
+    assert matcher.process("J", "J1") == []
+    assert matcher.process("J", "J2") == []
+    assert matcher.process("A", "A1") == [("J1", "A1")]
+    assert matcher.process("A", "A2") == []
+    assert matcher.process("J", "J3") == []
+    assert matcher.process("A", "A3") == [("J3", "A3")]
+
+
+def test_seq_matcher_last_selection_keeps_the_newest_partial_match():
+    matcher = SeqMatcher(
+        Query.from_string("SEQ(C, J, A)"), policy=(Selection.LAST, Consumption.REUSE)
+    )
+
+    for event in ["C1", "C2", "J1", "C3"]:
+        assert matcher.process(event[0], event) == []
+    assert matcher.partial_matches == 2
+
+    assert matcher.process("A", "A1") == [("C2", "J1", "A1")]
+    assert matcher.partial_matches == 1
+
+
+def test_seq_matcher_consume_uses_every_event_once():
+    matcher = SeqMatcher(
+        Query.from_string("SEQ(J, A)"), policy=(Selection.EACH, Consumption.CONSUME)
+    )
+
+    assert matcher.process("J", "J1") == []
+    assert matcher.process("J", "J2") == []
+    assert matcher.process("A", "A1") == [("J1", "A1")]
+    assert matcher.process("A", "A2") == [("J2", "A2")]
+    assert matcher.process("A", "A3") == []
+
+
+def test_and_matcher_each_reuse_matches_every_combination():
+    matcher = AndMatcher(
+        Query.from_string("AND(E, F)"), policy=(Selection.EACH, Consumption.REUSE)
+    )
+
+    assert matcher.process("E", "E1") == []
+    assert matcher.process("E", "E2") == []
+    assert matcher.process("F", "F1") == [("E1", "F1"), ("E2", "F1")]
+    assert matcher.process("E", "E3") == [("E3", "F1")]
+    assert matcher.partial_matches == 3
+
+
+def test_and_matcher_last_selection_matches_the_newest_events():
+    matcher = AndMatcher(
+        Query.from_string("AND(E, F)"), policy=(Selection.LAST, Consumption.CONSUME)
+    )
+
+    assert matcher.process("E", "E1") == []
+    assert matcher.process("E", "E2") == []
+    assert matcher.process("F", "F1") == [("E2", "F1")]
+    assert matcher.partial_matches == 0
+
+
+def test_and_matcher_each_consume_uses_every_event_once():
+    matcher = AndMatcher(
+        Query.from_string("AND(A, B)"), policy=(Selection.EACH, Consumption.CONSUME)
+    )
+
+    assert matcher.process("A", "A1") == []
+    assert matcher.process("B", "B1") == [("A1", "B1")]
+    assert matcher.process("B", "B2") == []
+    assert matcher.process("B", "B3") == []
+    # paired with the oldest remembered B
+    assert matcher.process("A", "A2") == [("A2", "B2")]
+    assert matcher.partial_matches == 1
+
+
+def test_matching_engine_applies_statement_policy():
+    statement = StatementParser(
+        "SELECT SEQ(J, A) FROM J, A ON {4} POLICY FIRST"
+    ).parse()
+    matches = []
+    engine = MatchingEngine([statement], callback=lambda _, match: matches.append(match))
+
+    for symbol in ["J", "J", "A", "A"]:
+        engine.send(symbol)
+
+    assert matches == [("J", "A")]
@@ -0,0 +1,61 @@
+import pytest
+
+from metrics import LatencyHistogram, NodeMetrics
+
+
+@pytest.mark.parametrize("value", [0, 1, 63, 64, 65, 127, 128, 1000, 123456, 10**9])
+def test_histogram_bucket_bounds(value):
+    index = LatencyHistogram.index(value)
+
+    assert LatencyHistogram.value_at(index) <= value
+    assert value < LatencyHistogram.value_at(index + 1)
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+
+    assert histogram.count == 1000
+    assert histogram.max == 1_000_000
+    assert histogram.percentile(50) == pytest.approx(500_000, rel=0.04)
+    assert histogram.percentile(99) == pytest.approx(990_000, rel=0.04)
+    assert histogram.mean == pytest.approx(500_500)
+
+
+def test_histogram_clamps_negative_durations():
+    histogram = LatencyHistogram()
+    histogram.record(-0.5)
+    histogram.record(0.002)
+
+    assert histogram.count == 2
+    assert histogram.mean == 1000
+    assert histogram.percentile(50) == 0
+
+
+def test_node_metrics_dump(tmp_path):
+    metrics = NodeMetrics(node_id=4)
+    metrics.record("receive", "J", 0.002)
+    metrics.record("publish", "SEQ(J, A)", 0.010)
+
+    filename = tmp_path / "metrics.log"
+    metrics.dump(str(filename))
+
+    lines = filename.read_text().splitlines()
+    assert lines[1].startswith("node=4 stage=publish topic=SEQ(J, A) count=1")
+    assert lines[2].startswith("node=4 stage=receive topic=J count=1")
+
+
+def test_node_metrics_counters():
+    metrics = NodeMetrics(node_id=9)
+    metrics.count("duplicates", "SEQ(J, A)")
+    metrics.count("duplicates", "SEQ(J, A)", n=2)
+
+    assert "node=9 counter=duplicates topic=SEQ(J, A) count=3" in metrics.report()
+
+
+def test_node_metrics_gauges():
+    metrics = NodeMetrics(node_id=4)
+    metrics.observe("partial_matches", lambda: {"SEQ(J, A)": 7})
+
+    assert "node=4 gauge=partial_matches topic=SEQ(J, A) value=7" in metrics.report()
@@ -0,0 +1,53 @@
+import pytest
+
+from compose_from_statements import pack_nodes
+from connection import ActiveMQNode
+from connection_pool import ConnectionPool
+from evaluation_plan import StatementParser
+from node_host import NodeHost, statements_for_node
+
+STATEMENTS = [
+    StatementParser(statement).parse()
+    for statement in [
+        "SELECT SEQ(J, A) FROM J, A ON {4}",
+        "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
+        "SELECT AND(C, D, E, F) FROM C, D, E, F ON {2, 4}",
+    ]
+]
+
+
+def test_statements_for_node():
+    assert statements_for_node(STATEMENTS, 4) == [STATEMENTS[0], STATEMENTS[2]]
+    assert statements_for_node(STATEMENTS, 3) == []
+
+
+def test_host_runs_its_nodes_on_one_connection(broker):
+    pool = ConnectionPool(size=1)
+    host = NodeHost([4, 9], STATEMENTS, engine="python", connection_pool=pool)
+    assert [node.statements for node in host.nodes.values()] == [
+        [STATEMENTS[0], STATEMENTS[2]],
+        [STATEMENTS[1]],
+    ]
+
+    host.start()
+    producer = ActiveMQNode(id_=0, connection_pool=pool)
+    assert producer.wait_for_nodes({4, 9}, timeout=5) == set()
+    assert len(pool) == 1
+
+    producer.disconnect()
+    host.stop()
+    assert len(pool) == 0
+
+
+def test_host_rejects_nodes_without_statements():
+    with pytest.raises(ValueError):
+        NodeHost([3], STATEMENTS, engine="python")
+    with pytest.raises(ValueError):
+        NodeHost([4], STATEMENTS, engine="flink")
+
+
+def test_pack_nodes_balances_statements():
+    statements_by_node = {0: ["a"], 2: ["b", "c"], 4: ["d", "e", "f"], 9: ["g"]}
+
+    assert pack_nodes(statements_by_node, 2) == [[4, 9], [0, 2]]
+    assert pack_nodes(statements_by_node, 10) == [[4], [2], [0], [9]]
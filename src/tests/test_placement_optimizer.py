@@ -0,0 +1,90 @@
+import pytest
+
+from evaluation_plan import NodeEnum, Query, StatementParser
+from placement_optimizer import (
+    PlacementOptimizer,
+    RateModel,
+    event_rates,
+    event_rates_from_files,
+)
+
+
+def parse(*statements):
+    return [StatementParser(statement).parse() for statement in statements]
+
+
+def test_event_rates():
+    rates = event_rates([(500, "A"), (1000, "B"), (2000, "A")])
+
+    assert rates == {"A": 1.0, "B": 0.5}
+    assert event_rates([(500, "A")], duration_ms=10000) == {"A": 0.1}
+
+
+def test_event_rates_from_files():
+    rates = event_rates_from_files()
+
+    assert set(rates) == {"A", "B", "C", "D", "E", "F", "J"}
+    # F is pushed every 5s, C every 30s
+    assert rates["F"] == pytest.approx(0.2, rel=0.05)
+    assert rates["C"] == pytest.approx(1 / 30, rel=0.05)
+
+
+def test_rate_model():
+    rates = RateModel({"A": 2.0, "B": 2.0, "C": 0.5})
+
+    assert rates.rate(Query.from_string("SEQ(C, A, B)")) == 0.5
+    # E[max] of two Exp(2) is 1/2 + 1/2 - 1/4
+    assert rates.rate(Query.from_string("AND(A, B)")) == pytest.approx(4 / 3)
+    # a single operand is its own rate, more operands only slow it down
+    assert rates.rate(Query.from_string("AND(A, B, C)")) < rates.rate(
+        Query.from_string("AND(A, B)")
+    )
+
+
+def test_shared_inputs_are_colocated():
+    statements = parse(
+        "SELECT SEQ(A, B) FROM A, B ON {0}",
+        "SELECT AND(A, B) FROM A, B ON {0}",
+        "SELECT SEQ(C, D) FROM C, D ON {0}",
+    )
+    rates = RateModel({"A": 1.0, "B": 1.0, "C": 0.1, "D": 0.1})
+
+    placed, report = PlacementOptimizer(
+        statements, rates, nodes=[NodeEnum.ONE, NodeEnum.TWO], load_weight=0
+    ).optimize()
+
+    assert placed[0].nodes == placed[1].nodes == [NodeEnum.ONE]
+    # A and B are delivered to node 1 once, plus both outputs
+    assert report.traffic == pytest.approx(2 + 1 + 2 / 3 + 0.2 + 0.1)
+    assert str(placed[0]) == "SELECT SEQ(A, B) FROM A, B ON {1}"
+
+
+def test_capacity_and_replicas():
+    statements = parse(
+        "SELECT SEQ(A, B) FROM A, B ON {0, 1}",
+        "SELECT AND(A, B) FROM A, B ON {0}",
+    )
+    rates = RateModel({"A": 1.0, "B": 1.0})
+    nodes = [NodeEnum.ONE, NodeEnum.TWO, NodeEnum.THREE]
+
+    placed, report = PlacementOptimizer(statements, rates, nodes, capacity=2).optimize()
+
+    assert len(placed[0].nodes) == 2
+    assert not set(placed[0].nodes) & set(placed[1].nodes)
+    assert report.max_load <= 2
+
+    with pytest.raises(ValueError):
+        PlacementOptimizer(statements, rates, nodes[:2], capacity=2).optimize()
+
+
+def test_partitioned_replicas_split_the_load():
+    rates = RateModel({"A": 1.0, "B": 1.0})
+    nodes = [NodeEnum.ONE, NodeEnum.TWO]
+
+    for text, load in [
+        ("SELECT SEQ(A, B) FROM A, B ON {0, 1} PARTITIONED", 1.0),
+        # every replica computes all matches
+        ("SELECT SEQ(A, B) FROM A, B ON {0, 1}", 2.0),
+    ]:
+        _, report = PlacementOptimizer(parse(text), rates, nodes).optimize()
+        assert report.max_load == pytest.approx(load)
@@ -0,0 +1,137 @@
+import pytest
+
+from compose_from_statements import STATEMENTS
+from evaluation_plan import NodeEnum, StatementParser
+from plan_rewriter import (
+    PlanRewriter,
+    conflicting,
+    subscription_count,
+    unevaluable,
+)
+
+
+def rewrite(*statements, **kwargs):
+    parsed = [StatementParser(statement).parse() for statement in statements]
+    return [str(statement) for statement in PlanRewriter(parsed, **kwargs).rewrite()]
+
+
+def test_reuses_produced_and_subquery():
+    statements = rewrite(
+        "SELECT AND(C, E, D, F) FROM C, E, D, F ON {2}",
+        "SELECT AND(C, E, B, D, F) FROM B, C, D, E, F ON {0, 1}",
+    )
+
+    assert statements == [
+        "SELECT AND(C, D, E, F) FROM C, D, E, F ON {2}",
+        "SELECT AND(B, C, D, E, F) FROM AND(C, D, E, F), B ON {0, 1}",
+    ]
+
+
+def test_introduces_one_shared_helper():
+    statements = rewrite(
+        "SELECT AND(E, SEQ(C, J, A)) FROM AND(E, SEQ(J, A)), C ON {5, 9}",
+        "SELECT AND(B, SEQ(C, J, A)) FROM B, C, J, A ON {3}",
+    )
+
+    assert statements == [
+        "SELECT SEQ(C, J, A) FROM C, J, A ON {5}",
+        "SELECT AND(E, SEQ(C, J, A)) FROM E, SEQ(C, J, A) ON {5, 9}",
+        "SELECT AND(B, SEQ(C, J, A)) FROM B, SEQ(C, J, A) ON {3}",
+    ]
+
+
+def test_nested_helpers_and_helper_node():
+    statements = rewrite(
+        "SELECT AND(A, SEQ(B, AND(C, D))) FROM A, B, C, D ON {1}",
+        helper_node=NodeEnum.TEN,
+    )
+
+    assert statements == [
+        "SELECT AND(C, D) FROM C, D ON {10}",
+        "SELECT SEQ(B, AND(C, D)) FROM B, AND(C, D) ON {10}",
+        "SELECT AND(A, SEQ(B, AND(C, D))) FROM A, SEQ(B, AND(C, D)) ON {1}",
+    ]
+
+
+def test_reuses_only_wider_windows_and_the_default_policy():
+    # a wider window or none covers the consumer's
+    assert rewrite(
+        "SELECT AND(C, E, D, F) FROM C, E, D, F ON {2} WITHIN 10s",
+        "SELECT AND(C, E, B, D, F) FROM B, C, D, E, F ON {0} WITHIN 5s",
+    )[1] == "SELECT AND(B, C, D, E, F) FROM AND(C, D, E, F), B ON {0} WITHIN 5s"
+
+    for producer in ["WITHIN 1s", "POLICY EACH"]:
+        statements = rewrite(
+            f"SELECT AND(C, E, D, F) FROM C, E, D, F ON {{2}} {producer}",
+            "SELECT AND(C, E, B, D, F) FROM B, C, D, E, F ON {0} WITHIN 5s",
+        )
+        assert statements[1] == (
+            "SELECT AND(B, C, D, E, F) FROM B, C, D, E, F ON {0} WITHIN 5s"
+        )
+
+    # a helper for the consumer would publish into the same topic
+    with pytest.raises(ValueError):
+        rewrite(
+            "SELECT SEQ(J, A) FROM J, A ON {4} WITHIN 1s POLICY LAST CONSUME",
+            "SELECT AND(E, SEQ(J, A)) FROM E, J, A ON {9}",
+        )
+
+
+def test_conflicting():
+    parsed = [
+        StatementParser(statement).parse()
+        for statement in (
+            "SELECT SEQ(J, A) FROM J, A ON {4}",
+            "SELECT SEQ(J, A) FROM J, A ON {6} POLICY EACH REUSE",
+            "SELECT SEQ(J, A) FROM J, A ON {9} WITHIN 1s",
+            "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
+        )
+    ]
+
+    assert conflicting(parsed) == parsed[:3]
+    assert conflicting(parsed[:2] + parsed[3:]) == []
+
+
+def test_rewritten_plan_is_evaluable():
+    parsed = [StatementParser(statement).parse() for statement in STATEMENTS]
+    rewritten = PlanRewriter(parsed).rewrite()
+    produced = {statement.query.topic for statement in rewritten}
+
+    for statement in rewritten:
+        # every operand the engines match on is subscribed to and produced
+        operands = {operand.topic for operand in statement.evaluation_query.operands}
+        assert operands == set(statement.input_topics)
+        assert all(
+            topic in produced or len(topic) == 1 for topic in statement.input_topics
+        )
+        assert StatementParser(str(statement)).parse() == statement
+
+
+def test_subscription_count():
+    parsed = [
+        StatementParser(statement).parse()
+        for statement in (
+            "SELECT AND(C, E, D, F) FROM C, E, D, F ON {2}",
+            "SELECT AND(C, E, B, D, F) FROM B, C, D, E, F ON {0, 1}",
+        )
+    ]
+
+    assert subscription_count(parsed) == 14
+    assert subscription_count(PlanRewriter(parsed).rewrite()) == 8
+
+
+def test_unevaluable():
+    parsed = [
+        StatementParser(statement).parse()
+        for statement in (
+            "SELECT SEQ(J, A) FROM J, A ON {4}",
+            "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
+            "SELECT AND(E, SEQ(C, J, A)) FROM AND(E, SEQ(J, A)), C ON {5, 9}",
+            "SELECT AND(B, SEQ(C, J)) FROM B, SEQ(C, J) ON {4}",
+        )
+    ]
+
+    assert unevaluable(parsed) == parsed[2:]
+    assert unevaluable(PlanRewriter(parsed).rewrite()) == []
+    # the deployed plan also works without rewriting
+    assert unevaluable([StatementParser(s).parse() for s in STATEMENTS]) == []
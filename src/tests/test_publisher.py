@@ -0,0 +1,66 @@
+import time
+
+from stomp.utils import Frame
+
+from connection import BATCH_HEADER, ActiveMQNode
+from publisher import BatchingPublisher
+
+
+class RecordingNode:
+    id = 0
+
+    def __init__(self):
+        self.frames = []
+
+    def send_batch(self, messages, topic):
+        self.frames.append((topic, list(messages)))
+
+
+def test_publisher_batches_per_topic():
+    node = RecordingNode()
+    publisher = BatchingPublisher(node, max_batch_size=10, linger_ms=50)
+    publisher.start()
+
+    for message in ["SEQ(J, A)", "AND(E, SEQ(J, A))", "SEQ(J, A)"]:
+        publisher.publish(message, topic=f"/topic/{message}")
+    publisher.stop()
+
+    assert sorted(node.frames) == [
+        ("/topic/AND(E, SEQ(J, A))", ["AND(E, SEQ(J, A))"]),
+        ("/topic/SEQ(J, A)", ["SEQ(J, A)", "SEQ(J, A)"]),
+    ]
+
+
+def test_publisher_respects_max_batch_size():
+    node = RecordingNode()
+    publisher = BatchingPublisher(node, max_batch_size=2, linger_ms=50)
+    publisher.start()
+
+    for _ in range(5):
+        publisher.publish("A", topic="/topic/A")
+    publisher.stop()
+
+    assert [len(messages) for _, messages in node.frames] == [2, 2, 1]
+
+
+def test_publisher_flushes_after_linger():
+    node = RecordingNode()
+    publisher = BatchingPublisher(node, max_batch_size=100, linger_ms=1)
+    publisher.start()
+
+    publisher.publish("A", topic="/topic/A")
+    time.sleep(0.2)
+
+    assert node.frames == [("/topic/A", ["A"])]
+    publisher.stop()
+
+
+def test_unpack_text_message():
+    single = Frame("MESSAGE", {"destination": "/topic/A"}, b"A")
+    batch = Frame("MESSAGE", {BATCH_HEADER: "2"}, b"SEQ(J, A)\nSEQ(J, A)")
+
+    assert [e.symbol for e in ActiveMQNode.unpack_message(single)] == ["A"]
+    assert [e.symbol for e in ActiveMQNode.unpack_message(batch)] == [
+        "SEQ(J, A)",
+        "SEQ(J, A)",
+    ]
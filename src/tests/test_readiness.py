@@ -0,0 +1,54 @@
+import socket
+
+import pytest
+
+from connection import ActiveMQNode
+from connection_pool import ConnectionPool
+from evaluation_plan import StatementParser
+from readiness import parse_node_ids, wait_for_broker, write_readiness_file
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_wait_for_broker(broker):
+    wait_for_broker(*broker.address)
+
+    with pytest.raises(OSError):
+        wait_for_broker("127.0.0.1", free_port(), attempts=2)
+
+
+def test_write_readiness_file(tmp_path):
+    write_readiness_file(4, path=str(tmp_path / "node-{node_id}.ready"))
+    assert (tmp_path / "node-4.ready").read_text() == "4\n"
+
+
+def test_parse_node_ids():
+    assert parse_node_ids("4, 9,") == {4, 9}
+    assert parse_node_ids("") == set()
+
+
+def test_producer_waits_for_subscribed_nodes(broker):
+    statement = StatementParser(
+        "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {5, 9}"
+    ).parse()
+    pool = ConnectionPool(size=2)
+    nodes = [
+        ActiveMQNode(id_=node.value, statements=[statement], connection_pool=pool)
+        for node in statement.nodes
+    ]
+    for node in nodes:
+        node.start()
+
+    # the nodes announced themselves before the producer listened, the probe
+    # makes them announce again
+    producer = ActiveMQNode(id_=0, connection_pool=pool)
+    assert producer.wait_for_nodes({5, 9}, timeout=5) == set()
+    assert producer.wait_for_nodes({5, 9, 11}, timeout=0.5) == {11}
+
+    producer.disconnect()
+    for node in nodes:
+        node.stop()
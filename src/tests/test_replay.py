@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from atomicEventProducer import AtomicEventProducer
+from replay import ReplayScheduler
+
+
+class FakeClock:
+    def __init__(self, emit_cost=0.0):
+        self.now = 100.0
+        self.emit_cost = emit_cost
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+
+
+def replay(scheduler, clock, trace):
+    emitted = []
+
+    def emit(item):
+        emitted.append((clock.now, item))
+        clock.now += clock.emit_cost
+
+    report = scheduler.replay(trace, emit)
+    return emitted, report
+
+
+def test_scheduled_replay_targets_absolute_deadlines():
+    # emitting takes 5 ms, which must not add up as drift
+    clock = FakeClock(emit_cost=0.005)
+    scheduler = ReplayScheduler(clock=clock, sleep=clock.sleep)
+
+    emitted, report = replay(scheduler, clock, [(100, "A"), (200, "B"), (300, "C")])
+
+    assert [round(at - 100.0, 6) for at, _ in emitted] == [0.1, 0.2, 0.3]
+    assert report.events == 3
+    assert report.lag.max == 0
+
+
+def test_replay_speedup():
+    clock = FakeClock()
+    scheduler = ReplayScheduler(speedup=1000, clock=clock, sleep=clock.sleep)
+
+    emitted, report = replay(scheduler, clock, [(1000, "A"), (600000, "B")])
+
+    assert [round(at - 100.0, 6) for at, _ in emitted] == [0.001, 0.6]
+    assert report.duration == pytest.approx(0.6)
+
+
+def test_replay_reports_lag_when_emitting_is_too_slow():
+    clock = FakeClock(emit_cost=0.015)
+    scheduler = ReplayScheduler(clock=clock, sleep=clock.sleep)
+
+    _, report = replay(scheduler, clock, [(0, "A"), (10, "B"), (20, "C")])
+
+    assert report.lag.max == pytest.approx(10_000, rel=0.05)
+
+
+def test_max_rate_replay_ignores_timestamps():
+    clock = FakeClock(emit_cost=0.001)
+    scheduler = ReplayScheduler(mode="max-rate", clock=clock, sleep=clock.sleep)
+
+    emitted, report = replay(scheduler, clock, [(0, "A"), (600000, "B")])
+
+    assert [item for _, item in emitted] == ["A", "B"]
+    assert report.duration == pytest.approx(0.002)
+    assert report.rate == pytest.approx(1000)
+
+
+def test_async_replay_awaits_the_deadlines():
+    clock = FakeClock(emit_cost=0.005)
+    scheduler = ReplayScheduler(clock=clock, async_sleep=clock.async_sleep)
+    emitted = []
+
+    async def emit(item):
+        emitted.append((clock.now, item))
+        clock.now += clock.emit_cost
+
+    loop = asyncio.new_event_loop()
+    report = loop.run_until_complete(
+        scheduler.replay_async([(100, "A"), (200, "B"), (300, "C")], emit)
+    )
+    loop.close()
+
+    assert [round(at - 100.0, 6) for at, _ in emitted] == [0.1, 0.2, 0.3]
+    assert report.events == 3
+
+
+def test_replay_rejects_unknown_mode():
+    with pytest.raises(ValueError):
+        ReplayScheduler(mode="turbo")
+
+
+def test_producer_stamps_trace_times():
+    class RecordingProducer(AtomicEventProducer):
+        def send(self, message, topic):
+            self.sent.append((topic, message))
+
+    producer = RecordingProducer(
+        id_=0,
+        eventIntervalsFileName=None,
+        eventTimestamps=[(0, "J"), (250, "A"), (60000, "J")],
+    )
+    producer.sent = []
+    clock = FakeClock()
+    producer.pushEvents(ReplayScheduler(speedup=1000, clock=clock, sleep=clock.sleep))
+
+    # the trace's spacing, not the time it took to send them
+    times = [envelope.event_time - producer.replayStart for _, envelope in producer.sent]
+    assert times == [0, 250, 60000]
+    assert [topic for topic, _ in producer.sent] == ["/topic/J", "/topic/A", "/topic/J"]
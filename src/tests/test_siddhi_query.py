@@ -0,0 +1,143 @@
+import random
+import re
+
+import pytest
+
+from compose_from_statements import STATEMENTS
+from evaluation_plan import AtomicEventType, Operator, Query, StatementParser
+from matching_engine import AndMatcher
+
+
+@pytest.mark.parametrize("statement", STATEMENTS)
+def test_plan_statement_output_unchanged(statement):
+    query = StatementParser(statement).parse().evaluation_query
+    app = query.to_siddhi_query()
+
+    # one named query per topic, so the output callback and topic stay the same
+    assert app.count("@info(name = ") == 1
+    assert app.count(f"@info(name = '{query.topic}')") == 1
+    assert app.count("insert into outputStream;") == 1
+    assert f"select '{query.topic}' as symbol" in app
+
+    for operand in query.operands:
+        assert app.count(f"cseEventStream[symbol == '{operand}']") == 1
+
+
+@pytest.mark.parametrize("n_operands", range(2, 8))
+def test_and_query_grows_linearly(n_operands):
+    operands = list(AtomicEventType)[:n_operands]
+    query = Query(Operator.AND, operands)
+    app = query.to_siddhi_query()
+
+    assert app.count("from every") == n_operands - 1
+    assert app.count("insert into outputStream;") == 1
+
+    pair_size = len(Query(Operator.AND, operands[:2]).to_siddhi_query())
+    assert len(app) < n_operands * pair_size
+
+
+def test_and_query_checks_the_window_once_over_event_times():
+    query = Query.from_string("AND(C, D, E)")
+    app = query.to_siddhi_query(within_ms=1000)
+
+    # no arrival-time window on the levels of the tree, one filter on the root
+    assert " within " not in app
+    assert app.count("minimum(") == 2
+    assert app.count("[eventTime - minEventTime <= 1000]") == 1
+    assert app.count("@info(name = ") == 1
+    root = app[app.index(f"@info(name = '{query.topic}')") :]
+    assert "select symbol, eventTime, id1, id2, id3" in root
+    assert root.count("insert into outputStream;") == 1
+
+
+PATTERN = re.compile(
+    r"from every \(e1=(?P<left>.+?) and e2=(?P<right>.+?)\)\n"
+    r".*?(?P<ids>e1\.\w+ as id1.*?)(?:, minimum|\n)"
+    r".*?insert into (?P<target>\w+);",
+    re.S,
+)
+
+
+def run_and_tree(app, events):
+    """
+    Push (symbol, event id) pairs through the wiring of a generated AND tree,
+    every pattern matching like `every (e1 and e2)`: it keeps the first event
+    of each side and consumes both with the match. Returns the id columns
+    inserted into outputStream.
+    """
+    patterns = [match.groupdict() for match in PATTERN.finditer(app)]
+    waiting = [{} for _ in patterns]
+    output = []
+
+    def insert(stream, row):
+        if stream == "outputStream":
+            output.append(tuple(row.values()))
+        for pattern, sides in zip(patterns, waiting):
+            for side, source in (("e1", pattern["left"]), ("e2", pattern["right"])):
+                if source == stream:
+                    sides.setdefault(side, row)
+            if len(sides) == 2:
+                columns = re.findall(r"(e[12])\.(\w+) as (id\d+)", pattern["ids"])
+                match = {id_: sides[side][column] for side, column, id_ in columns}
+                sides.clear()
+                insert(pattern["target"], match)
+
+    for symbol, event_id in events:
+        insert(f"cseEventStream[symbol == '{symbol}']", {"eventId": event_id})
+    return output
+
+
+def and_matches(query, events):
+    """
+    The event ids of the matches AndMatcher finds, sorted within each match.
+    """
+    matcher = AndMatcher(query)
+    return [
+        sorted(event_id for _, event_id in match)
+        for symbol, event_id in events
+        for match in matcher.process(symbol, (symbol, event_id))
+    ]
+
+
+def tree_matches(query, events):
+    app = query.to_siddhi_query()
+    assert len(PATTERN.findall(app)) == len(query.operands) - 1
+    assert app.count("insert into outputStream;") == 1
+    return [sorted(ids) for ids in run_and_tree(app, events)]
+
+
+@pytest.mark.parametrize("n_operands", [2, 3, 5])
+def test_and_tree_matches_like_the_and_matcher(n_operands):
+    query = Query(Operator.AND, list(AtomicEventType)[:n_operands])
+
+    # rounds holding every operand once, in a random order
+    rng = random.Random(n_operands)
+    events = []
+    for _ in range(20):
+        round_ = list(query.operands)
+        rng.shuffle(round_)
+        events.extend((operand.topic, len(events) + 1) for operand in round_)
+
+    # every operand is selected exactly once, whatever level it joins at
+    assert len(and_matches(query, events)) == 20
+    assert tree_matches(query, events) == and_matches(query, events)
+
+
+def test_two_operand_and_matches_like_the_and_matcher_on_repeats():
+    query = Query.from_string("AND(A, B)")
+    rng = random.Random(2)
+    events = [(rng.choice("AAAB"), event_id) for event_id in range(1, 200)]
+
+    # a single pattern, repeated events are ignored until the match by both
+    assert len(and_matches(query, events)) > 10
+    assert tree_matches(query, events) == and_matches(query, events)
+
+
+def test_and_tree_runs_ahead_on_repeated_operands():
+    query = Query.from_string("AND(A, B, C)")
+    events = [(symbol, event_id) for event_id, symbol in enumerate("AABBCAC", 1)]
+
+    # B2 completes a second AND(A, B) with A3 in the tree, see
+    # to_siddhi_and_query, the matcher ignored it while waiting for C
+    assert and_matches(query, events) == [[1, 3, 5]]
+    assert tree_matches(query, events) == [[1, 3, 5], [4, 6, 7]]
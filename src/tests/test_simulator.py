@@ -0,0 +1,96 @@
+from evaluation_plan import StatementParser
+from simulator import PRODUCER_ID, Simulator
+from trace_source import EVENT_TYPE_CODES
+
+
+def parse(*statements):
+    return [StatementParser(statement).parse() for statement in statements]
+
+
+def trace(*events):
+    return [(timestamp, EVENT_TYPE_CODES[symbol]) for timestamp, symbol in events]
+
+
+def counter(node, name):
+    return sum(count for (counter, _), count in node.metrics.counters.items() if counter == name)
+
+
+def test_simulator_routes_chained_statements_on_a_virtual_clock():
+    simulator = Simulator(
+        parse(
+            "SELECT SEQ(J, A) FROM J, A ON {4}",
+            "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
+        ),
+        latency_ms=5,
+        service_ms=1,
+    )
+    report = simulator.run(trace((0, "J"), (10, "A"), (20, "E")))
+
+    node_4, node_9 = simulator.nodes
+    assert (node_4.id, node_9.id) == (4, 9)
+    assert counter(node_4, "received") == 2 and counter(node_4, "published") == 1
+    assert counter(node_9, "received") == 2 and counter(node_9, "published") == 1
+
+    # SEQ(J, A): A emitted at 10, delivered at 15, matched at 16
+    assert simulator.latencies["SEQ(J, A)"].max == 6000
+    # AND(E, SEQ(J, A)): E emitted at 20, delivered at 25, matched at 26
+    assert simulator.latencies["AND(E, SEQ(J, A))"].max == 6000
+    assert report.events == 3 and report.messages == 4
+    assert report.duration_ms == 26
+
+
+def test_simulator_queues_messages_at_busy_nodes():
+    simulator = Simulator(
+        parse("SELECT SEQ(J, A) FROM J, A ON {4}"), latency_ms=0, service_ms=10
+    )
+    simulator.run(trace((0, "J"), (1, "J"), (2, "J"), (3, "A")))
+
+    (node,) = simulator.nodes
+    assert node.max_queued == 4
+    # the A waits for the three J before it
+    assert simulator.latencies["SEQ(J, A)"].max == 37000
+
+
+def test_simulator_link_latency_per_link():
+    simulator = Simulator(
+        parse(
+            "SELECT SEQ(J, A) FROM J, A ON {4}",
+            "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
+        ),
+        latency_ms=lambda sender, receiver: 100 if (sender, receiver) == (4, 9) else 0,
+    )
+    simulator.run(trace((0, "J"), (10, "A"), (20, "E")))
+
+    assert simulator.latencies["AND(E, SEQ(J, A))"].max == 90000
+
+
+def test_simulator_producer_link_is_not_node_0():
+    simulator = Simulator(
+        parse("SELECT SEQ(J, A) FROM J, A ON {0}"),
+        latency_ms=lambda sender, receiver: 50 if sender == PRODUCER_ID else 0,
+    )
+    simulator.run(trace((0, "J"), (10, "A")))
+
+    assert simulator.latencies["SEQ(J, A)"].max == 50000
+
+
+def test_simulator_drops_replicated_outputs():
+    simulator = Simulator(
+        parse(
+            "SELECT SEQ(J, A) FROM J, A ON {4, 6}",
+            "SELECT AND(E, SEQ(J, A)) FROM E, SEQ(J, A) ON {9}",
+        )
+    )
+    simulator.run(trace((0, "J"), (10, "A"), (20, "E")))
+
+    node_9 = simulator.nodes[-1]
+    assert counter(node_9, "duplicates") == 1
+    assert counter(node_9, "published") == 1
+
+
+def test_simulator_stops_at_until_ms():
+    simulator = Simulator(parse("SELECT SEQ(J, A) FROM J, A ON {4}"))
+    report = simulator.run(trace((0, "J"), (10, "A"), (20, "J")), until_ms=15)
+
+    assert report.events == 2
+    assert "SEQ(J, A)" in str(report)
@@ -0,0 +1,121 @@
+import socket
+import threading
+
+import pytest
+import stomp
+
+import connection
+import stomp_broker
+from connection import ActiveMQNode, make_connection
+from envelope import Envelope
+from stomp_broker import Frame, Subscription, parse_frame
+
+
+class Collector(stomp.ConnectionListener):
+    def __init__(self, expected=1):
+        self.frames = []
+        self.done = threading.Event()
+        self.receipt = threading.Event()
+        self.expected = expected
+
+    def on_receipt(self, frame):
+        self.receipt.set()
+
+    def on_message(self, frame):
+        self.frames.append(frame)
+        if len(self.frames) >= self.expected:
+            self.done.set()
+
+
+def test_parse_frame_binary_body_and_heartbeats():
+    body = Envelope("A", 1, 2, 3).encode() + b"\x00\n"
+    buffer = bytearray(
+        b"\n\n"
+        + Frame("SEND", {"destination": "/topic/a\\b:c"}, body).encode()
+        + b"SEND\ndestination:/topic/b"
+    )
+
+    frame = parse_frame(buffer)
+    assert frame.command == "SEND"
+    assert frame.headers["destination"] == "/topic/a\\b:c"
+    assert frame.body == body
+    # the second frame is incomplete
+    assert parse_frame(buffer) is None
+    assert buffer == bytearray(b"SEND\ndestination:/topic/b")
+
+
+def test_client_ack_is_cumulative():
+    subscription = Subscription(None, "sub", "/topic/A", "client")
+    for message_id in ["m1", "m2", "m3"]:
+        subscription.pending[message_id] = None
+
+    assert subscription.acknowledge("m2")
+    assert list(subscription.pending) == ["m3"]
+    assert not subscription.acknowledge("m1")
+
+
+def test_broker_routes_by_subscription(broker):
+    listener = Collector(expected=2)
+    conn = make_connection(listener)
+    conn.subscribe(destination="/topic/SEQ(J, A)", id="seq", ack="client-individual")
+    conn.subscribe(destination="/topic/E", id="e", ack="auto")
+    conn.unsubscribe(id="e", headers={"receipt": "subscribed"})
+    # the subscriptions are in place once the receipt arrives
+    assert listener.receipt.wait(5)
+
+    node = ActiveMQNode(id_=4)
+    envelopes = [Envelope("SEQ(J, A)", 1, 2, 4), Envelope("SEQ(J, A)", 3, 4, 4)]
+    node.send("E", topic="/topic/E")
+    node.send_batch(envelopes, topic="/topic/SEQ(J, A)")
+    node.send(envelopes[0], topic="/topic/SEQ(J, A)")
+
+    assert listener.done.wait(5)
+    batch, single = listener.frames
+    assert batch.headers["subscription"] == "seq"
+    assert batch.headers["destination"] == "/topic/SEQ(J-A)"
+    assert ActiveMQNode.unpack_message(batch) == envelopes
+    assert ActiveMQNode.unpack_message(single) == envelopes[:1]
+
+    conn.ack(batch.headers["message-id"], "seq")
+    conn.disconnect()
+    node.disconnect()
+
+
+def stalled_subscriber(destination):
+    """
+    A raw client subscribed to destination that never reads what it gets.
+    """
+    client = socket.socket()
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    client.connect((connection.ACTIVEMQ_HOST, int(connection.ACTIVEMQ_PORT)))
+    client.sendall(Frame("CONNECT", {"accept-version": "1.2"}).encode())
+    client.sendall(
+        Frame(
+            "SUBSCRIBE", {"destination": destination, "id": "stalled", "receipt": "r"}
+        ).encode()
+    )
+    buffer = bytearray()
+    while b"RECEIPT" not in buffer:
+        buffer += client.recv(4096)
+    return client
+
+
+def test_stalled_subscriber_does_not_block_publishers(broker, monkeypatch):
+    if broker is None:
+        pytest.skip("needs the in-process broker")
+    monkeypatch.setattr(stomp_broker, "STOMP_BROKER_QUEUE_SIZE", 16)
+    client = stalled_subscriber("/topic/E")
+    node = ActiveMQNode(id_=4)
+    dropped = broker.dropped
+
+    # far more than the socket buffers hold
+    body = b"x" * (1 << 16)
+    for _ in range(200):
+        node.send(body, topic="/topic/E")
+    assert node.activemq_connection.send_confirmed("E", "/topic/E", timeout=5)
+    # what didn't fit into the stalled client's queue was dropped
+    assert broker.dropped > dropped
+
+    node.disconnect()
+    client.close()
+
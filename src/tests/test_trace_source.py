@@ -0,0 +1,36 @@
+from pathlib import Path
+
+import pytest
+
+from trace_source import EVENT_TYPES, TraceSource
+
+DATA = Path(__file__).parent.parent / "data"
+
+
+def test_csv_trace_source(tmp_path):
+    path = tmp_path / "trace.csv"
+    path.write_text("500,A\n1000,J\n\n1000,E\n")
+
+    trace = TraceSource(path)
+    events = list(trace)
+
+    assert [(t, EVENT_TYPES[code]) for t, code in events] == [
+        (500, "A"),
+        (1000, "J"),
+        (1000, "E"),
+    ]
+    # re-iterable, every iteration streams the file again
+    assert list(trace) == events
+
+
+def test_trace_source_is_lazy():
+    events = iter(TraceSource(DATA / "combinedEventTimestamps.csv"))
+    first = next(events)
+
+    assert isinstance(first[0], int)
+    assert isinstance(first[1], int)
+
+
+def test_unknown_trace_format():
+    with pytest.raises(ValueError):
+        TraceSource("trace.parquet")
@@ -0,0 +1,65 @@
+"""
+Lazy readers for event traces.
+
+Every reader is a generator of (timestamp in ms, event type code) pairs with
+both values already parsed to ints, so memory stays flat no matter how long
+the trace is. Codes index into EVENT_TYPES.
+"""
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Tuple
+
+from binary_trace import BINARY_TRACE_SUFFIX, read_binary_trace
+from evaluation_plan import AtomicEventType
+
+TraceEvent = Tuple[int, int]
+
+EVENT_TYPES = AtomicEventType.values()
+EVENT_TYPE_CODES = {symbol: code for code, symbol in enumerate(EVENT_TYPES)}
+
+
+def read_csv_trace(path) -> Iterator[TraceEvent]:
+    """
+    Combined trace as written by EventIntervaldGenerator, one
+    `timestamp,type` row per event.
+    """
+    codes = EVENT_TYPE_CODES
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            timestamp, symbol = line.split(",")
+            yield int(timestamp), codes[symbol]
+
+
+TRACE_READERS: Dict[str, Callable[..., Iterator[TraceEvent]]] = {
+    ".csv": read_csv_trace,
+    BINARY_TRACE_SUFFIX: read_binary_trace,
+}
+
+
+def register_trace_format(suffix: str, reader: Callable[..., Iterator[TraceEvent]]):
+    TRACE_READERS[suffix] = reader
+
+
+class TraceSource:
+    """
+    Re-iterable trace backed by a file, the reader is picked by the suffix.
+    Every iteration streams the file again from the start.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+
+        try:
+            self.reader = TRACE_READERS[self.path.suffix]
+        except KeyError:
+            raise ValueError(
+                f"Unknown trace format '{self.path.suffix}', expected one of {list(TRACE_READERS)}"
+            ) from None
+
+    def __iter__(self) -> Iterator[TraceEvent]:
+        return self.reader(self.path)
+
+    def __repr__(self) -> str:
+        return f"TraceSource(path='{self.path}')"